@@ -1,57 +1,604 @@
-from vlc import Instance
+import collections
 import logging
+import threading
 import time
 from logger import Logger
 
+from Metrics import registry
+
+AUDIO_BUFFERING = registry.counter(
+    "nightride_audio_buffering_events_total", "libvlc buffering events"
+)
+AUDIO_UNDERRUNS = registry.counter(
+    "nightride_audio_underruns_total",
+    "Times playback stalled to rebuffer after it had started",
+)
+AUDIO_ERRORS = registry.counter(
+    "nightride_audio_errors_total", "libvlc playback errors"
+)
+AUDIO_LOST_BUFFERS = registry.gauge(
+    "nightride_audio_lost_buffers", "Audio buffers lost by libvlc for the current stream"
+)
+AUDIO_DEMUX_BITRATE = registry.gauge(
+    "nightride_audio_demux_bitrate", "Demuxed stream bitrate reported by libvlc"
+)
+
+AUDIO_FAILOVERS = {
+    reason: registry.counter(
+        "nightride_audio_failovers_total",
+        "Standby streams started after the playing stream failed",
+        labels={"reason": reason},
+    )
+    for reason in ("error", "underrun", "stall")
+}
+AUDIO_QUALITY_SWITCHES = {
+    direction: registry.counter(
+        "nightride_audio_quality_switches_total",
+        "Switches to another stream variant, to match the link",
+        labels={"direction": direction},
+    )
+    for direction in ("up", "down")
+}
+AUDIO_QUALITY_BITRATE = registry.gauge(
+    "nightride_audio_quality_bitrate", "Bitrate of the stream variant playing, bits per second"
+)
+AUDIO_FAILOVER_SECONDS = registry.histogram(
+    "nightride_audio_failover_seconds",
+    "Time from a failed audio stream to a standby stream playing",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+VLC_OPTIONS = ("--input-repeat=-1", "-q")
+# The streams are audio only. Skipping everything around video, subtitles, lua
+# scripts and metadata lookups keeps those modules out of memory.
+VLC_LITE_OPTIONS = VLC_OPTIONS + (
+    "--no-video",
+    "--no-xlib",
+    "--no-spu",
+    "--no-osd",
+    "--no-lua",
+    "--no-metadata-network-access",
+)
+# Not --no-stats: the byte counts drive the audio delay, quality switching,
+# stall detection and the stream gauges. Not --no-plugins-cache either, which
+# rescans every plugin on each start.
+
+
+class StreamDelay:
+    # Estimates how far playback runs behind the live edge of a stream.
+    #
+    # Past its initial burst, a live stream arrives at its own byte rate, so the
+    # bytes received so far, divided by that rate, are the media time at the live
+    # edge. The delay is that minus the media time played. Samples are taken at
+    # most once per {interval}, and the rate is taken over the last {window}
+    # seconds. The estimate is smoothed, so a slow drift is followed while jitter is not.
+    def __init__(self, window: float = 30.0, interval: float = 1.0, smoothing: float = 0.2):
+        self.window = window
+        self.interval = interval
+        self.smoothing = smoothing
+        self.reset()
+
+    def reset(self):
+        # On every new connection
+        self.samples = collections.deque()
+        self.delay = None
+
+    def update(self, now, received_bytes, played_seconds):
+        if self.samples and now - self.samples[-1][0] < self.interval:
+            return self.delay
+        self.samples.append((now, received_bytes))
+        while now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+
+        # A few seconds of samples before the rate means anything
+        first_at, first_bytes = self.samples[0]
+        if now - first_at < 5 or received_bytes <= first_bytes:
+            return self.delay
+        byte_rate = (received_bytes - first_bytes) / (now - first_at)
+        measured = received_bytes / byte_rate - played_seconds
+        if measured < 0:
+            return self.delay
+        if self.delay is None:
+            self.delay = measured
+        else:
+            self.delay += (measured - self.delay) * self.smoothing
+        return self.delay
+
+
+class QualitySelector:
+    # Picks the stream variant the link can carry.
+    #
+    # {variants} are (path, bits per second). A live stream arrives no faster
+    # than its own bitrate, so the throughput shows when a variant is too much
+    # for the link, but never how much more the link could carry. So it steps
+    # down when the throughput stays under {down_ratio} of the bitrate for
+    # {down_after} seconds, or when the player reports it ran dry. The bitrates
+    # are nominal, and real streams run a little under them, hence the margin.
+    # It steps up to try the next variant after {up_after} seconds without
+    # trouble. A step up that is taken back within that time doubles it, up to
+    # {max_up_after}, so a link that can't carry the higher variant is not tried
+    # again every few seconds.
+    def __init__(
+        self,
+        variants,
+        down_ratio: float = 0.8,
+        down_after: float = 4.0,
+        up_after: float = 30.0,
+        max_up_after: float = 600.0,
+        window: float = 5.0,
+        interval: float = 1.0,
+    ):
+        self.variants = sorted(variants, key=lambda variant: variant[1])
+        self.down_ratio = down_ratio
+        self.down_after = down_after
+        self.up_after = up_after
+        self.max_up_after = max_up_after
+        self.window = window
+        self.interval = interval
+        # The best first. A link that can't carry it shows within seconds.
+        self.index = len(self.variants) - 1
+        self.wait = up_after
+        self.up_at = None
+        self.reset()
+
+    @property
+    def adaptive(self) -> bool:
+        # Needs more than one variant, and the bitrate of each.
+        return len(self.variants) > 1 and all(bitrate for _, bitrate in self.variants)
+
+    @property
+    def path(self) -> str:
+        return self.variants[self.index][0]
+
+    @property
+    def bitrate(self) -> int:
+        return self.variants[self.index][1]
+
+    def reset(self):
+        # On every new connection
+        self.samples = collections.deque()
+        self.slow_since = None
+        self.calm_since = None
+
+    def update(self, now, received_bytes, starved=False):
+        # The index of the variant to switch to, or None to stay. {starved} is
+        # True while the player rebuffers after its buffer had filled.
+        if not self.adaptive:
+            return None
+        if starved:
+            return self.step(-1, now)
+        if self.samples and now - self.samples[-1][0] < self.interval:
+            return None
+        self.samples.append((now, received_bytes))
+        while now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+        if self.calm_since is None:
+            self.calm_since = now
+        if self.up_at is not None and now - self.up_at >= self.wait:
+            # The last step up held.
+            self.up_at = None
+            self.wait = self.up_after
+
+        first_at, first_bytes = self.samples[0]
+        if now - first_at < self.window / 2:
+            return None
+        byte_rate = self.bitrate / 8
+        if (received_bytes - first_bytes) / (now - first_at) < byte_rate * self.down_ratio:
+            if self.slow_since is None:
+                self.slow_since = now
+            if now - self.slow_since >= self.down_after:
+                return self.step(-1, now)
+        else:
+            self.slow_since = None
+        if now - self.calm_since >= self.wait:
+            return self.step(1, now)
+        return None
+
+    def step(self, direction, now):
+        # Also used by the player, on an underrun or stall. The new index, or None at either end.
+        index = self.index + direction
+        if not 0 <= index < len(self.variants):
+            self.calm_since = now
+            return None
+        if direction < 0 and self.up_at is not None:
+            self.up_at = None
+            self.wait = min(self.max_up_after, self.wait * 2)
+        elif direction > 0:
+            self.up_at = now
+        self.index = index
+        self.reset()
+        AUDIO_QUALITY_SWITCHES["up" if direction > 0 else "down"].inc()
+        return index
 
-class AudioPlayer:
-    def __init__(self, base_url, loglevel=logging.INFO, logfile: str = "radio.log"):
-        try:
-            self.logger = Logger(
-                module_name=__name__,
-                log_file=logfile,
-                log_level=loglevel,
-                delete_old_logfile=True,
-                streamhandler=False,
-                filehandler=True,
-            )
 
-            self.instance = Instance("--input-repeat=-1", "-q")
-            self.player = self.instance.media_player_new()
-            self.base_url = base_url
+class AudioBackend:
+    # What the player needs from an audio backend: play(station), stop() and
+    # set_volume(volume). Backends load in the background. Calls made before
+    # load() finishes are kept, and applied as soon as it has.
+    #
+    # A backend implements load(), apply_station(), apply_stop() and
+    # apply_volume(). The apply methods run with {lock} held, once {ready} is set.
+    def __init__(self, base_url, variants=None, loglevel=logging.INFO, logfile: str = "radio.log"):
+        self.logger = Logger(
+            module_name=__name__,
+            log_file=logfile,
+            log_level=loglevel,
+            delete_old_logfile=True,
+            streamhandler=False,
+            filehandler=True,
+        )
+
+        self.base_url = base_url
+
+        # Requested state
+        self.station = None
+        self.volume = None
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+
+        # How far the audio heard runs behind the live stream, in seconds. None while unknown.
+        self.stream_delay = StreamDelay()
+        # Stream variants of every station, as (path, bits per second)
+        self.quality = QualitySelector(variants or [("{station}.m4a", 0)])
+        AUDIO_QUALITY_BITRATE.set_function(lambda: self.quality.bitrate)
+
+    @property
+    def delay(self):
+        return self.stream_delay.delay
+
+    def start(self):
+        load_thread = threading.Thread(target=self.start_backend)
+        load_thread.daemon = True
+        load_thread.start()
+
+    def start_backend(self):
+        try:
+            self.load()
         except Exception as e:
             self.logger.log.error(e)
+            return
+
+        with self.lock:
+            self.ready.set()
+            self.logger.log.debug(f"{type(self).__name__} initialized")
+            if self.volume is not None:
+                self.apply_volume()
+            if self.station is not None:
+                self.apply_station()
+
+    @property
+    def failing(self) -> bool:
+        # True while the stream has failed and is being replaced.
+        return False
+
+    def stream_url(self):
+        return f"{self.base_url}/{self.quality.path.format(station=self.station)}"
 
     def play(self, station: str = "chillsynth"):
         self.logger.log.debug(f"Press play")
+        with self.lock:
+            self.station = station
+            if self.ready.is_set():
+                self.apply_station()
+
+    def stop(self):
+        self.logger.log.debug(f"Press stop")
+        with self.lock:
+            self.station = None
+            if self.ready.is_set():
+                self.apply_stop()
+
+    def set_volume(self, volume):
+        with self.lock:
+            self.volume = volume
+            if self.ready.is_set():
+                self.apply_volume()
+
+    def volume_percent(self):
+        # Volume must be times eleven, so we can reach close to 100% max volume :-D
+        # Hey at least it's linear!
+        return self.volume * 11
+
+
+class AudioPlayer(AudioBackend):
+    # The libvlc backend.
+    #
+    # A watchdog thread checks the stream every {check_interval} seconds. The
+    # stream has failed on a libvlc error, on a rebuffer that lasts longer than
+    # {underrun_grace}, or when neither play time nor demuxed bytes have moved
+    # for {stall_timeout}, counted from the first data. Connecting gets
+    # {failover_timeout}. The failed player keeps going while a standby player
+    # connects in parallel, muted. Once the standby has buffered, the two swap.
+    #
+    # With several stream variants, the watchdog also feeds the throughput and
+    # the buffered audio to a QualitySelector. A switch to another variant takes
+    # the same way, through a standby player, so it is heard as a short skip.
+    def __init__(
+        self,
+        base_url,
+        lite=False,
+        device="default",
+        variants=None,
+        stall_timeout: float = 5.0,
+        underrun_grace: float = 0.5,
+        failover_timeout: float = 10.0,
+        check_interval: float = 0.1,
+        loglevel=logging.INFO,
+        logfile: str = "radio.log",
+    ):
+        super().__init__(base_url, variants=variants, loglevel=loglevel, logfile=logfile)
+
+        self.options = VLC_LITE_OPTIONS if lite else VLC_OPTIONS
+        if device == "null":
+            # Decode, but play nowhere. For benchmarks.
+            self.options += ("--aout=dummy",)
+        elif device != "default":
+            self.options += ("--aout=alsa", f"--alsa-audio-device={device}")
+        self.instance = None
+        self.player = None
+        self.media = None
+        # Of the playing stream. When it is not stream_url(), the watchdog switches.
+        self.media_url = None
+        # True once the current stream has filled its buffer
+        self.buffered = False
+
+        # Watchdog state
+        self.connected = False
+        self.stall_timeout = stall_timeout
+        self.underrun_grace = underrun_grace
+        self.failover_timeout = failover_timeout
+        self.check_interval = check_interval
+        self.failed = False
+        self.underrun_at = None
+        self.progress = None
+        self.progress_at = time.monotonic()
+        self.failed_at = None
+        self.standby = None
+        self.standby_media = None
+        self.standby_url = None
+        self.standby_started = None
+        self.standby_buffered = False
+
+        AUDIO_LOST_BUFFERS.set_function(lambda: self.get_stats().lost_abuffers)
+        AUDIO_DEMUX_BITRATE.set_function(lambda: self.get_stats().demux_bitrate)
+
+        self.start()
+
+    def load(self):
+        # Importing vlc loads libvlc and its plugins, which takes a while.
+        # Doing it here keeps it off the startup path of the interface.
+        from vlc import EventType, Instance, MediaStats, State
+
+        self.EventType = EventType
+        self.MediaStats = MediaStats
+        self.State = State
+        self.instance = Instance(*self.options)
+        self.player = self.new_player()
+
+        watchdog_thread = threading.Thread(target=self.watch)
+        watchdog_thread.daemon = True
+        watchdog_thread.start()
+
+    def new_player(self):
+        player = self.instance.media_player_new()
+        # Events carry the player they came from, so those of a standby are told apart.
+        events = player.event_manager()
+        events.event_attach(self.EventType.MediaPlayerBuffering, self.on_buffering, player)
+        events.event_attach(self.EventType.MediaPlayerEncounteredError, self.on_error, player)
+        return player
+
+    def apply_station(self):
         try:
-            self.media = self.instance.media_new(f"{self.base_url}/{station}.m4a")
-            self.logger.log.debug(f"Playing url {self.base_url}/{station}.m4a")
+            self.discard_standby()
+            self.media_url = self.stream_url()
+            self.media = self.instance.media_new(self.media_url)
+            self.logger.log.debug(f"Playing url {self.media_url}")
+            self.buffered = False
+            self.reset_watchdog()
             self.player.set_media(self.media)
             self.player.play()
         except Exception as e:
             self.logger.log.error(e)
 
-    def stop(self):
-        self.logger.log.debug(f"Press stop")
+    def on_buffering(self, event, player):
+        AUDIO_BUFFERING.inc()
+        if player is self.standby:
+            if event.u.new_cache >= 100:
+                self.standby_buffered = True
+        elif player is self.player:
+            if event.u.new_cache > 0:
+                # Data has arrived. The stall clock runs from here.
+                self.connected = True
+            if event.u.new_cache >= 100:
+                self.buffered = True
+                self.underrun_at = None
+            elif self.buffered:
+                # Buffering again after the buffer was full means the stream ran dry.
+                self.buffered = False
+                self.underrun_at = time.monotonic()
+                AUDIO_UNDERRUNS.inc()
+
+    def on_error(self, event, player):
+        if player is self.player:
+            self.buffered = False
+            self.failed = True
+            AUDIO_ERRORS.inc()
+
+    def get_stats(self, media=None):
+        stats = self.MediaStats()
+        (media or self.media).get_stats(stats)
+        return stats
+
+    def apply_stop(self):
+        self.discard_standby()
         self.player.stop()
 
+    @property
+    def failing(self) -> bool:
+        return self.failed_at is not None
+
     def get_info(self):
         self.player.print_info()
 
-    def set_volume(self, volume):
-        # Volume must be times eleven, so we can reach close to 100% max volume :-D
-        # Hey at least it's linear!
+    def apply_volume(self):
         try:
-            volume_percent = volume * 11
+            volume_percent = self.volume_percent()
             self.logger.log.debug(f"Set volume to {volume_percent}%")
             self.player.audio_set_volume(volume_percent)
         except Exception as e:
             self.logger.log.error(e)
 
+    ### Watchdog ###
+
+    def watch(self):
+        while True:
+            time.sleep(self.check_interval)
+            with self.lock:
+                if self.station is None:
+                    continue
+                try:
+                    if self.standby is not None:
+                        self.check_standby()
+                    else:
+                        reason = self.failure()
+                        if reason:
+                            self.start_failover(reason)
+                        else:
+                            self.measure_delay()
+                            if self.media_url != self.stream_url():
+                                self.start_standby()
+                except Exception as e:
+                    self.logger.log.error("Audio watchdog error")
+                    self.logger.log.error(e)
+
+    def measure_delay(self):
+        # Needs libvlc stats. Without them, read_bytes stays 0, the delay unknown,
+        # and the quality where it is.
+        played = self.player.get_time()
+        if played > 0:
+            now = time.monotonic()
+            read_bytes = self.get_stats().read_bytes
+            self.stream_delay.update(now, read_bytes, played / 1000)
+            if read_bytes:
+                # Buffer health comes from libvlc's buffering events, not from the bitrate.
+                self.quality.update(now, read_bytes, starved=self.underrun_at is not None)
+
+    def reset_watchdog(self):
+        self.stream_delay.reset()
+        self.quality.reset()
+        self.failed = False
+        self.underrun_at = None
+        self.progress = None
+        self.progress_at = time.monotonic()
+        # Until the first data, the connection gets {failover_timeout}, not {stall_timeout}.
+        self.connected = False
+
+    def failure(self):
+        # Why the stream has failed, or None while it is fine.
+        now = time.monotonic()
+        if self.failed or self.player.get_state() in (self.State.Error, self.State.Ended):
+            return "error"
+        if self.underrun_at is not None and now - self.underrun_at > self.underrun_grace:
+            return "underrun"
+
+        stats = self.get_stats()
+        progress = (self.player.get_time(), stats.demux_read_bytes)
+        if not self.connected:
+            if not any(progress):
+                # A slow connect on a congested link is not a stall.
+                if now - self.progress_at > self.failover_timeout:
+                    return "stall"
+                return None
+            self.connected = True
+        if progress != self.progress:
+            self.progress = progress
+            self.progress_at = now
+            return None
+        if now - self.progress_at > self.stall_timeout:
+            return "stall"
+        return None
+
+    def start_failover(self, reason):
+        self.logger.log.warning(f"Audio stream failed ({reason}). Connecting a standby stream.")
+        AUDIO_FAILOVERS[reason].inc()
+        if self.failed_at is None:
+            self.failed_at = time.monotonic()
+        if reason != "error":
+            # The link may not carry this variant any more.
+            self.quality.step(-1, time.monotonic())
+        self.start_standby()
+
+    def start_standby(self):
+        if self.failed_at is None:
+            self.logger.log.info(f"Switching to the {self.quality.bitrate} bit/s stream")
+        self.standby = self.new_player()
+        self.standby_url = self.stream_url()
+        self.standby_media = self.instance.media_new(self.standby_url)
+        self.standby_buffered = False
+        self.standby_started = time.monotonic()
+        self.standby.set_media(self.standby_media)
+        self.standby.play()
+        # Silent until it takes over, in case the failed player recovers meanwhile.
+        self.standby.audio_set_mute(True)
+
+    def check_standby(self):
+        if self.standby_buffered or self.standby.get_time() > 0:
+            self.swap()
+        elif time.monotonic() - self.standby_started > self.failover_timeout:
+            self.logger.log.warning("Standby stream did not buffer in time")
+            if self.failed_at is None and self.quality.up_at is not None:
+                # A step up the link can't carry
+                self.quality.step(-1, time.monotonic())
+            # The failure, or the other variant, is still wanted. The next check starts another.
+            self.discard_standby()
+
+    def swap(self):
+        failed, self.player = self.player, self.standby
+        self.media = self.standby_media
+        self.media_url = self.standby_url
+        self.standby = None
+        self.standby_media = None
+        self.buffered = True
+        self.reset_watchdog()
+        self.connected = True
+
+        self.player.audio_set_mute(False)
+        if self.volume is not None:
+            self.apply_volume()
+        if self.failed_at is not None:
+            AUDIO_FAILOVER_SECONDS.observe(time.monotonic() - self.failed_at)
+            self.logger.log.info(
+                f"Standby stream took over after {time.monotonic() - self.failed_at:.3f}s"
+            )
+            self.failed_at = None
+        self.release(failed)
+
+    def discard_standby(self):
+        if self.standby is not None:
+            self.release(self.standby)
+            self.standby = None
+            self.standby_media = None
+
+    def release(self, player):
+        # stop() waits for libvlc threads. Never on the watchdog, or in an event callback.
+        release_thread = threading.Thread(target=lambda: (player.stop(), player.release()))
+        release_thread.daemon = True
+        release_thread.start()
+
+
+def create_audio_player(backend="vlc", **kwargs):
+    # AudioPlayer for "vlc", FFmpegPlayer for "ffmpeg". Takes the arguments of AudioPlayer.
+    if backend == "ffmpeg":
+        from FFmpegPlayer import FFmpegPlayer
+
+        return FFmpegPlayer(**kwargs)
+    return AudioPlayer(**kwargs)
+
 
 if __name__ == "__main__":
-    player = AudioPlayer(loglevel=logging.DEBUG, logfile="radio.log")
+    player = AudioPlayer(
+        base_url="https://stream.nightride.fm", loglevel=logging.DEBUG, logfile="radio.log"
+    )
     player.play()
     print("10 second test play of chillsynth!")
     time.sleep(10)
@@ -0,0 +1,272 @@
+import atexit
+import configparser
+import io
+import logging
+import os
+import tempfile
+import threading
+from logger import Logger
+
+# Config is the one shared view of settings.ini.
+#
+# The file is parsed once per process. Changes made with set() are coalesced:
+# the file is written on a background thread once no change has been made for
+# {save_delay} seconds, and at exit. Writes go to a temporary file which is then
+# renamed over settings.ini, so the file is never left half written.
+#
+# Usage:
+# from Config import get_config
+# config = get_config()
+# config.stations
+# config.set("SETTINGS", "vu_meter", True)
+
+# Point the player at another settings file, e.g. in benchmarks.
+SETTINGS_ENV = "NIGHTRIDE_SETTINGS"
+
+
+def atomic_write(path: str, text: str):
+    # A temporary file of its own per write, as several processes may write the same file.
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
+    try:
+        with open(fd, "w", encoding="utf-8") as temp_file:
+            temp_file.write(text)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        # mkstemp makes it readable by the owner only. Keep the mode of the file replaced.
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class Config:
+    def __init__(
+        self,
+        path: str = "settings.ini",
+        save_delay: float = 1.0,
+        loglevel=logging.INFO,
+        logfile: str = "radio.log",
+    ):
+        self.logger = Logger(
+            module_name=__name__,
+            log_file=logfile,
+            log_level=loglevel,
+            delete_old_logfile=True,
+            streamhandler=False,
+            filehandler=True,
+        )
+
+        self.path = path
+        self.save_delay = save_delay
+        self.lock = threading.Lock()
+        self.save_timer = None
+
+        self.parser = configparser.ConfigParser()
+        self.parser.read(path)
+        self.stations = [value for key, value in self.parser.items("STATIONS")]
+        self.logger.log.debug(f"Read config from {path}")
+
+        atexit.register(self.flush)
+
+    ### Typed values ###
+
+    @property
+    def sse_url(self) -> str:
+        return self.parser["URLS"]["sse_url"]
+
+    @property
+    def audio_stream_base_url(self) -> str:
+        return self.parser["URLS"]["audio_stream_base_url"]
+
+    @property
+    def audio_backend(self) -> str:
+        # "vlc", or "ffmpeg" for FFmpegPlayer
+        return self.parser.get("AUDIO", "backend", fallback="vlc")
+
+    @property
+    def audio_device(self) -> str:
+        return self.parser.get("AUDIO", "device", fallback="default")
+
+    @property
+    def audio_stall_timeout(self) -> float:
+        # Seconds without audio progress before a standby stream is connected
+        return self.parser.getfloat("AUDIO", "stall_timeout", fallback=5)
+
+    @property
+    def audio_variants(self) -> list:
+        # [(path, bits per second)] of the streams of every station. "{station}" is replaced.
+        value = self.parser.get("AUDIO", "variants", fallback="{station}.m4a")
+        variants = []
+        for variant in value.split(","):
+            path, _, bitrate = variant.strip().partition(" ")
+            if path:
+                variants.append((path, int(bitrate or 0)))
+        return variants
+
+    @property
+    def audio_delay(self):
+        # Seconds to hold metadata back for the audio to catch up. None measures it.
+        value = self.parser.get("AUDIO", "delay", fallback="auto")
+        return None if value == "auto" else float(value)
+
+    @property
+    def renderer(self) -> str:
+        # "curses", or "ansi" for the cell-diffing renderer
+        return self.parser.get("DISPLAY", "renderer", fallback="curses")
+
+    @property
+    def render_byte_budget(self) -> int:
+        # Bytes the ansi renderer may write per frame
+        return self.parser.getint("DISPLAY", "byte_budget", fallback=2048)
+
+    @property
+    def lcd1602(self) -> bool:
+        return self.parser.getboolean("ADDONS", "lcd1602")
+
+    @property
+    def vu_meter(self) -> bool:
+        return self.parser.getboolean("SETTINGS", "vu_meter")
+
+    @property
+    def default_station(self) -> str:
+        return self.parser["SETTINGS"]["default_station"]
+
+    @property
+    def lite(self) -> bool:
+        # The lite profile trades features for memory, for 512 MB boards.
+        return self.parser.get("SETTINGS", "profile", fallback="full") == "lite"
+
+    @property
+    def processes(self) -> str:
+        # "single", or "multi" to run ingest, audio, LCD and interface as separate processes
+        return self.parser.get("SETTINGS", "processes", fallback="single")
+
+    @property
+    def now_playing_snapshot(self) -> str:
+        return self.parser.get("SETTINGS", "now_playing_snapshot", fallback="")
+
+    @property
+    def history_enabled(self) -> bool:
+        return self.parser.getboolean("HISTORY", "enabled", fallback=False)
+
+    @property
+    def history_database(self) -> str:
+        return self.parser.get("HISTORY", "database", fallback="history.db")
+
+    @property
+    def broker_socket(self) -> str:
+        return self.parser.get("BROKER", "socket", fallback="")
+
+    @property
+    def http_enabled(self) -> bool:
+        return self.parser.getboolean("HTTP", "enabled", fallback=False)
+
+    @property
+    def http_host(self) -> str:
+        return self.parser.get("HTTP", "host", fallback="127.0.0.1")
+
+    @property
+    def http_port(self) -> int:
+        return self.parser.getint("HTTP", "port", fallback=8741)
+
+    @property
+    def ndjson_file(self) -> str:
+        # Every update, one JSON object per line. Empty disables it.
+        return self.parser.get("SINKS", "ndjson_file", fallback="")
+
+    @property
+    def metrics_file(self) -> str:
+        return self.parser.get("METRICS", "file", fallback="")
+
+    @property
+    def metrics_interval(self) -> float:
+        return self.parser.getfloat("METRICS", "interval", fallback=15)
+
+    @property
+    def sse_stall_timeout(self) -> float:
+        return self.parser.getfloat("SSE", "stall_timeout", fallback=90)
+
+    @property
+    def sse_min_backoff(self) -> float:
+        return self.parser.getfloat("SSE", "min_backoff", fallback=0.5)
+
+    @property
+    def sse_max_backoff(self) -> float:
+        return self.parser.getfloat("SSE", "max_backoff", fallback=30)
+
+    @property
+    def sse_subscriptions(self) -> list:
+        # Stations to decode events for. Empty means all of them.
+        value = self.parser.get("SSE", "subscribe", fallback="")
+        return [station.strip() for station in value.split(",") if station.strip()]
+
+    ### Generic access, for settings without a typed value ###
+
+    def get(self, section: str, key: str, fallback=None):
+        return self.parser.get(section, key, fallback=fallback)
+
+    def getboolean(self, section: str, key: str, fallback=None):
+        return self.parser.getboolean(section, key, fallback=fallback)
+
+    def getint(self, section: str, key: str, fallback=None):
+        return self.parser.getint(section, key, fallback=fallback)
+
+    def getfloat(self, section: str, key: str, fallback=None):
+        return self.parser.getfloat(section, key, fallback=fallback)
+
+    ### Persistence ###
+
+    def set(self, section: str, key: str, value):
+        with self.lock:
+            self.parser.set(section, key, f"{value}")
+            # Every change restarts the countdown, so a held key causes one write.
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+            self.save_timer = threading.Timer(self.save_delay, self.save)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def save(self):
+        with self.lock:
+            self.save_timer = None
+            text = self.render()
+        try:
+            atomic_write(self.path, text)
+            self.logger.log.debug(f"Saved config to {self.path}")
+        except Exception as e:
+            self.logger.log.error(f"Failed to save config to {self.path}")
+            self.logger.log.error(e)
+
+    def render(self) -> str:
+        text = io.StringIO()
+        self.parser.write(text)
+        return text.getvalue()
+
+    def flush(self):
+        # Write out a pending change right away, e.g. at exit.
+        with self.lock:
+            pending = self.save_timer is not None
+            if pending:
+                self.save_timer.cancel()
+        if pending:
+            self.save()
+
+
+shared_config = None
+shared_config_lock = threading.Lock()
+
+
+def get_config() -> Config:
+    global shared_config
+    with shared_config_lock:
+        if shared_config is None:
+            shared_config = Config(path=os.environ.get(SETTINGS_ENV, "settings.ini"))
+        return shared_config
@@ -0,0 +1,218 @@
+import logging
+import threading
+import time
+import urllib.request
+
+from AudioPlayer import AUDIO_ERRORS, AUDIO_UNDERRUNS, AudioBackend
+from Metrics import registry
+
+AUDIO_PERIODS = registry.counter(
+    "nightride_audio_periods_total", "Audio periods written to the sound device"
+)
+
+RATE = 48000
+CHANNELS = 2
+
+# FFmpegPlayer plays the stations without libvlc.
+#
+# One thread per stream reads the station with PyAV, decodes and resamples it
+# to 16 bit stereo, and writes it to ALSA with pyalsaaudio in large periods.
+# Few, large writes keep the wakeups, and so the CPU use, low. Volume is
+# applied in software, one numpy multiply per period.
+#
+# Needs: pip3 install av numpy pyalsaaudio
+#
+# Usage:
+# player = FFmpegPlayer(base_url="https://stream.nightride.fm")
+# player.play("darksynth")
+# player.set_volume(4)
+
+
+class CountingReader:
+    # The HTTP response, as a file for av.open(), counting the bytes read for
+    # the delay estimate. PyAV has no count of its own.
+    def __init__(self, response):
+        self.response = response
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.response.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def close(self):
+        self.response.close()
+
+
+class NullSink:
+    # Takes audio at the pace of a sound card, and plays it nowhere. For benchmarks.
+    def __init__(self, period_frames):
+        self.period_seconds = period_frames / RATE
+        self.played_until = 0.0
+
+    def write(self, data):
+        # Blocks like a sound card with one period queued.
+        now = time.monotonic()
+        self.played_until = max(self.played_until, now) + self.period_seconds
+        time.sleep(max(0.0, self.played_until - now - self.period_seconds))
+        return len(data) // (2 * CHANNELS)
+
+    def close(self):
+        pass
+
+
+class FFmpegPlayer(AudioBackend):
+    def __init__(
+        self,
+        base_url,
+        lite=False,
+        device="default",
+        variants=None,
+        period_frames: int = 4096,
+        stall_timeout: float = 5.0,
+        loglevel=logging.INFO,
+        logfile: str = "radio.log",
+    ):
+        # Plays the best of the {variants}. Switching between them is left to the libvlc backend.
+        super().__init__(base_url, variants=variants, loglevel=loglevel, logfile=logfile)
+
+        self.device = device
+        # 4096 frames is 85 ms at 48 kHz. The lite profile keeps fewer of them queued.
+        self.period_frames = period_frames
+        self.periods = 2 if lite else 4
+        # A read that waits longer drops the connection, and run_stream reconnects.
+        self.stall_timeout = stall_timeout
+        self.gain = 1.0
+        # Bumped on every play() and stop(). A stream thread exits once it no longer owns the latest one.
+        self.generation = 0
+        self.first_period_at = None
+        self.periods_written = 0
+        self.start()
+
+    def load(self):
+        # The same split as with libvlc: heavy imports happen here, in the background.
+        import av
+        import numpy
+
+        if self.device != "null":
+            import alsaaudio
+
+            self.alsaaudio = alsaaudio
+        self.av = av
+        self.numpy = numpy
+
+    def open_sink(self):
+        if self.device == "null":
+            return NullSink(self.period_frames)
+        return self.alsaaudio.PCM(
+            type=self.alsaaudio.PCM_PLAYBACK,
+            device=self.device,
+            channels=CHANNELS,
+            rate=RATE,
+            format=self.alsaaudio.PCM_FORMAT_S16_LE,
+            periodsize=self.period_frames,
+            periods=self.periods,
+        )
+
+    def apply_station(self):
+        self.generation += 1
+        url = self.stream_url()
+        self.logger.log.debug(f"Playing url {url}")
+        stream_thread = threading.Thread(target=self.run_stream, args=(url, self.generation))
+        stream_thread.daemon = True
+        stream_thread.start()
+
+    def apply_stop(self):
+        self.generation += 1
+
+    def apply_volume(self):
+        volume_percent = self.volume_percent()
+        self.logger.log.debug(f"Set volume to {volume_percent}%")
+        self.gain = volume_percent / 100
+
+    def get_info(self):
+        self.logger.log.info(
+            f"FFmpeg backend on {self.device}, {self.period_frames} frame periods"
+        )
+
+    def run_stream(self, url, generation):
+        # Reconnects until the station changes, like libvlc with --input-repeat.
+        while generation == self.generation:
+            try:
+                self.stream(url, generation)
+            except Exception as e:
+                AUDIO_ERRORS.inc()
+                self.logger.log.error(f"Audio stream error: {e}")
+            if generation == self.generation:
+                time.sleep(1)
+
+    def stream(self, url, generation):
+        numpy = self.numpy
+        # A read that waits longer than {stall_timeout} raises, and run_stream reconnects.
+        source = CountingReader(urllib.request.urlopen(url, timeout=self.stall_timeout))
+        try:
+            container = self.av.open(source, mode="r")
+        except Exception:
+            source.close()
+            raise
+        sink = self.open_sink()
+        try:
+            resampler = self.av.AudioResampler(format="s16", layout="stereo", rate=RATE)
+            period = numpy.empty((self.period_frames, CHANNELS), dtype=numpy.int16)
+            scaled = numpy.empty((self.period_frames, CHANNELS), dtype=numpy.float32)
+            filled = 0
+            self.stream_delay.reset()
+            self.periods_written = 0
+
+            for packet in container.demux(audio=0):
+                if generation != self.generation:
+                    return
+                for frame in packet.decode():
+                    for resampled in resampler.resample(frame):
+                        # Packed s16 comes as one plane of interleaved samples.
+                        samples = resampled.to_ndarray().reshape(-1, CHANNELS)
+                        while len(samples):
+                            take = min(len(samples), self.period_frames - filled)
+                            period[filled : filled + take] = samples[:take]
+                            samples = samples[take:]
+                            filled += take
+                            if filled == self.period_frames:
+                                self.write_period(sink, period, scaled)
+                                self.measure_delay(source)
+                                filled = 0
+        finally:
+            sink.close()
+            container.close()
+            source.close()
+
+    def measure_delay(self, source):
+        # What the sound card has queued is not heard yet.
+        played = (self.periods_written - self.periods) * self.period_frames / RATE
+        received = source.bytes_read
+        if played > 0 and received:
+            self.stream_delay.update(time.monotonic(), received, played)
+
+    def write_period(self, sink, period, scaled):
+        gain = self.gain
+        if gain != 1.0:
+            numpy = self.numpy
+            numpy.multiply(period, gain, out=scaled)
+            if gain > 1.0:
+                numpy.clip(scaled, -32768, 32767, out=scaled)
+            period[:] = scaled
+        if sink.write(period.tobytes()) < 0:
+            # pyalsaaudio reports an underrun as a negative write
+            AUDIO_UNDERRUNS.inc()
+        AUDIO_PERIODS.inc()
+        self.periods_written += 1
+        if self.first_period_at is None:
+            self.first_period_at = time.perf_counter()
+
+
+if __name__ == "__main__":
+    player = FFmpegPlayer(
+        base_url="https://stream.nightride.fm", loglevel=logging.DEBUG, logfile="radio.log"
+    )
+    player.play()
+    print("10 second test play of chillsynth!")
+    time.sleep(10)
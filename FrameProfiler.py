@@ -0,0 +1,102 @@
+import collections
+import threading
+import time
+
+# FrameProfiler times the steps of the interface render loop.
+#
+# While disabled, call() is a flag check and a plain function call. While
+# enabled, it keeps the last {window} durations of every step for the overlay,
+# and accumulates self time per call stack. dump() writes those stacks in the
+# folded format read by flamegraph.pl and speedscope.
+#
+# Usage:
+# profiler = FrameProfiler()
+# profiler.enabled = True
+# with profiler.frame():
+#     profiler.call("draw_menu_bar", self.draw_menu_bar, stdscr)
+# profiler.worst(5)
+# profiler.dump("frames.folded")
+
+
+class FrameProfiler:
+    def __init__(self, window: int = 300):
+        self.enabled = False
+        self.window = window
+        self.durations = {}
+        self.folded = collections.Counter()
+        # Call stack of [name, time spent in children]
+        self.stack = []
+        # Only the render loop is profiled. Calls from other threads run unprofiled.
+        self.thread = threading.current_thread()
+
+    def call(self, name, function, *args, **kwargs):
+        if not self.enabled or threading.current_thread() is not self.thread:
+            return function(*args, **kwargs)
+
+        self.stack.append([name, 0.0])
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.record(time.perf_counter() - start)
+
+    def frame(self):
+        return ProfiledFrame(self)
+
+    def record(self, elapsed):
+        frame = self.stack[-1]
+        path = ";".join(name for name, _ in self.stack)
+        self.stack.pop()
+
+        # Flame graphs expect self time. Time spent in children is counted there.
+        self.folded[path] += int((elapsed - frame[1]) * 1e6)
+        if self.stack:
+            self.stack[-1][1] += elapsed
+
+        durations = self.durations.get(frame[0])
+        if durations is None:
+            durations = self.durations[frame[0]] = collections.deque(maxlen=self.window)
+        durations.append(elapsed)
+
+    def reset(self):
+        self.durations.clear()
+        self.folded.clear()
+        self.stack.clear()
+
+    def stats(self, name):
+        durations = sorted(self.durations[name])
+        return (
+            durations[len(durations) // 2],
+            durations[min(len(durations) - 1, int(len(durations) * 0.99))],
+            durations[-1],
+        )
+
+    def worst(self, count: int = 5):
+        # [(name, p50, p99, max)], slowest p99 first. Times in seconds.
+        rows = [(name,) + self.stats(name) for name in list(self.durations)]
+        rows.sort(key=lambda row: row[2], reverse=True)
+        return rows[:count]
+
+    def dump(self, path: str):
+        with open(path, "w", encoding="utf-8") as folded_file:
+            for stack, microseconds in sorted(self.folded.items()):
+                folded_file.write(f"{stack} {microseconds}\n")
+
+
+class ProfiledFrame:
+    # The root of every stack, covering one pass of the render loop.
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def __enter__(self):
+        if self.profiler.enabled:
+            self.profiler.stack = [["frame", 0.0]]
+            self.start = time.perf_counter()
+        else:
+            self.start = None
+
+    def __exit__(self, *exc):
+        # A frame started while disabled is not recorded, even if profiling was
+        # switched on during it.
+        if self.start is not None and self.profiler.stack:
+            self.profiler.record(time.perf_counter() - self.start)
@@ -0,0 +1,114 @@
+import logging
+import os
+import socket
+import threading
+import time
+from logger import Logger
+
+from Config import get_config
+from NightrideAPI import NightRideAPI
+from Sinks import ndjson
+
+# MetadataBroker holds the one upstream SSE connection for every player on this host.
+#
+# Decoded now playing updates are republished to local players over a Unix socket,
+# one JSON object per line. A player connecting gets the current state of every
+# station first, then updates as they arrive. NightRideAPI attaches to the broker
+# on its own, whenever the socket in settings.ini [BROKER] accepts connections.
+#
+# Usage:
+# python3 MetadataBroker.py
+
+
+class MetadataBroker:
+    def __init__(self, socket_path: str, loglevel=logging.INFO, logfile: str = "broker.log"):
+        self.logger = Logger(
+            module_name=__name__,
+            log_file=logfile,
+            log_level=loglevel,
+            delete_old_logfile=True,
+            streamhandler=False,
+            filehandler=True,
+        )
+
+        self.socket_path = socket_path
+        self.clients = []
+        self.clients_lock = threading.Lock()
+
+        self.server = self.bind()
+        # The broker serves players of any station, so it decodes them all. It
+        # keeps the snapshot, history and HTTP server, as the one feed on the host.
+        self.api = NightRideAPI(
+            loglevel=loglevel,
+            logfile=logfile,
+            audio=False,
+            use_broker=False,
+            subscribe_all=True,
+            outputs=True,
+        )
+        # Publishing runs in a sink, so sending to players never holds up the feed.
+        self.api.add_sink("broker", self.publish, max_pending=1000)
+
+        accept_thread = threading.Thread(target=self.accept_clients)
+        accept_thread.daemon = True
+        accept_thread.start()
+
+    def bind(self):
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                probe.close()
+                raise Exception(f"A broker is already running at {self.socket_path}")
+            except ConnectionRefusedError:
+                # Left behind by a broker that died. Safe to take over.
+                os.remove(self.socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen()
+        self.logger.log.info(f"Metadata broker listening on {self.socket_path}")
+        return server
+
+    def accept_clients(self):
+        while True:
+            client, _ = self.server.accept()
+            # Clients never block the broker. One that can't keep up is dropped,
+            # and gets the full state again when it reconnects.
+            client.setblocking(False)
+            with self.clients_lock:
+                state = b"".join(
+                    ndjson(station, current)
+                    for station, current in list(self.api.now_playing.items())
+                )
+                if self.send(client, state):
+                    self.clients.append(client)
+            self.logger.log.info(f"Player attached, {len(self.clients)} in total")
+
+    def send(self, client, data):
+        try:
+            if client.send(data) == len(data):
+                return True
+        except OSError:
+            pass
+        client.close()
+        return False
+
+    def publish(self, station, current):
+        # Encoded once, however many players are attached.
+        data = ndjson(station, current)
+        with self.clients_lock:
+            self.clients = [client for client in self.clients if self.send(client, data)]
+
+    def close(self):
+        self.server.close()
+        os.remove(self.socket_path)
+
+
+if __name__ == "__main__":
+    broker = MetadataBroker(socket_path=get_config().broker_socket)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        broker.close()
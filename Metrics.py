@@ -0,0 +1,196 @@
+import bisect
+import threading
+import time
+
+from Config import atomic_write
+
+# Metrics is a small in-process registry of counters, gauges and histograms.
+#
+# Metrics are created once, at import time of the module using them, and
+# updated on the hot paths with a lock-protected add. The registry renders
+# everything in the Prometheus text format, served on /metrics by the now playing
+# server, or written to a file for the node_exporter textfile collector.
+#
+# Usage:
+# from Metrics import registry
+# EVENTS = registry.counter("nightride_sse_events_total", "SSE events received")
+# EVENTS.inc()
+# print(registry.render())
+
+# Seconds. Covers sub-millisecond decode times up to slow frames.
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+        self.function = None
+        self.lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        # Evaluated when rendering, so values that are costly to track, such as
+        # libvlc stats, cost nothing until someone looks at them.
+        self.function = function
+
+    def samples(self):
+        value = self.value
+        if self.function:
+            try:
+                value = self.function()
+            except Exception:
+                value = float("nan")
+        yield self.name, self.labels, value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return HistogramTimer(self)
+
+    def samples(self):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            yield f"{self.name}_bucket", self.labels + (("le", le),), cumulative
+        yield f"{self.name}_sum", self.labels, total
+        yield f"{self.name}_count", self.labels, cumulative
+
+
+class HistogramTimer:
+    # with HISTOGRAM.time(): ...
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.help = {}
+
+    def get_or_create(self, kind, name, help, labels, **kwargs):
+        labels = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            metric = self.metrics.get((name, labels))
+            if metric is None:
+                metric = kind(name, labels, **kwargs)
+                self.metrics[(name, labels)] = metric
+                self.help[name] = (help, kind.kind)
+            return metric
+
+    def counter(self, name, help, labels=None) -> Counter:
+        return self.get_or_create(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=None) -> Gauge:
+        return self.get_or_create(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=None, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.get_or_create(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = sorted(self.metrics.items())
+        lines = []
+        previous = None
+        for (name, _), metric in metrics:
+            if name != previous:
+                help, kind = self.help[name]
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                previous = name
+            for sample, labels, value in metric.samples():
+                lines.append(f"{sample}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class MetricsFileWriter:
+    # Writes the registry to a file every {interval} seconds, e.g. for the
+    # node_exporter textfile collector.
+    def __init__(self, path: str, interval: float = 15):
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        writer_thread = threading.Thread(target=self.run)
+        writer_thread.daemon = True
+        writer_thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            atomic_write(self.path, registry.render())
+        except OSError:
+            pass
+
+    def stop(self):
+        self.stopped.set()
+        self.write()
@@ -1,21 +1,134 @@
-import configparser
+import argparse
+import atexit
 import json
 import logging
+import os
+import random
 import re
-import sseclient
-import urllib3
+import socket
+import sys
 import time
 import threading
 from logger import Logger
 
-from AudioPlayer import AudioPlayer
+from AudioPlayer import create_audio_player
+from Config import atomic_write, get_config
+from Metrics import MetricsFileWriter, registry
+from PlayClock import PlayClock
+from PlayHistory import PlayHistory
+from Sinks import NdjsonWriter, Sink, ndjson
+from StationRegistry import StationRegistry
+
+SSE_EVENTS = registry.counter(
+    "nightride_sse_events_total", "SSE events received, keepalives included"
+)
+SSE_KEEPALIVES = registry.counter(
+    "nightride_sse_keepalives_total", "SSE keepalive events received"
+)
+SSE_DECODE_SECONDS = registry.histogram(
+    "nightride_sse_decode_seconds", "Time to decode one track event"
+)
+SSE_RECONNECTS = registry.counter(
+    "nightride_sse_reconnects_total", "SSE client connections after the first"
+)
+SSE_KEEPALIVE_MISSES = registry.counter(
+    "nightride_sse_keepalive_misses_total", "Keepalive events not received in time"
+)
+SSE_ERRORS = registry.counter(
+    "nightride_sse_errors_total", "Errors in the SSE client"
+)
+SSE_FILTERED = registry.counter(
+    "nightride_sse_filtered_total", "Events of unsubscribed stations, dropped undecoded"
+)
+
+
+def peek_station(data: str):
+    # The station of a raw track event, found without decoding the JSON.
+    # None if the payload doesn't look as expected, and needs a full decode.
+    key = data.find('"station"')
+    if key < 0:
+        return None
+    start = data.find('"', data.find(":", key + 9) + 1)
+    end = data.find('"', start + 1)
+    if start < 0 or end < 0:
+        return None
+    return data[start + 1 : end]
+
+
+class NowPlaying:
+    # What a station is playing. Every track event creates one, so it is slotted:
+    # no per-instance dict, and a fraction of the memory of the dict it replaces.
+    __slots__ = ("artist", "song", "started_at", "started_at_wall", "stale")
+
+    def __init__(self, artist, song, started_at, started_at_wall, stale=False):
+        self.artist = artist
+        self.song = song
+        # perf_counter() time, for the play time shown on the interface
+        self.started_at = started_at
+        self.started_at_wall = started_at_wall
+        # True for data from a snapshot, until the station sends an event
+        self.stale = stale
+
+    @classmethod
+    def from_wall(cls, artist, song, started_at_wall, stale=False):
+        # For records from another process or an earlier run, where only the wall clock means anything.
+        started_at = time.perf_counter() - (time.time() - started_at_wall)
+        return cls(artist, song, started_at, started_at_wall, stale)
+
+
+class Deadline:
+    # Calls {callback} unless reset() again within the given time. A single
+    # thread serves the whole lifetime of the API, instead of a new
+    # threading.Timer per keepalive.
+    def __init__(self, callback, logger=None):
+        self.callback = callback
+        self.logger = logger
+        self.expires = None
+        self.condition = threading.Condition()
+        deadline_thread = threading.Thread(target=self.run)
+        deadline_thread.daemon = True
+        deadline_thread.start()
+
+    def reset(self, seconds):
+        with self.condition:
+            self.expires = time.monotonic() + seconds
+            self.condition.notify()
+
+    def cancel(self):
+        with self.condition:
+            self.expires = None
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.expires is None or self.expires > time.monotonic():
+                    if self.expires is None:
+                        self.condition.wait()
+                    else:
+                        self.condition.wait(self.expires - time.monotonic())
+                self.expires = None
+            try:
+                self.callback()
+            except Exception as e:
+                # The thread has to live on, or no later deadline would fire.
+                if self.logger:
+                    self.logger.error("Deadline callback failed")
+                    self.logger.error(e)
 
 
 class NightRideAPI:
-    def __init__(self, loglevel=logging.INFO, logfile: str = "radio.log"):
-        ### Read config ###
-        config = configparser.ConfigParser()
-        config.read("settings.ini")
+    def __init__(
+        self,
+        loglevel=logging.INFO,
+        logfile: str = "radio.log",
+        audio: bool = True,
+        use_broker: bool = True,
+        subscribe_all: bool = False,
+        subscriptions: list = None,
+        outputs: bool = True,
+    ):
+        config = get_config()
 
         self.logger = Logger(
             module_name=__name__,
@@ -26,41 +139,275 @@ class NightRideAPI:
             filehandler=True,
         )
 
-        self.SSE_URL = config["URLS"]["sse_url"]
-        AUDIO_STREAM_BASE_URL = config["URLS"]["audio_stream_base_url"]
+        # Smaller buffers and a trimmed libvlc for low-memory boards.
+        self.lite = config.lite
 
-        stationlist = config.items("STATIONS")
-        self.stations = []
-        for key, value in stationlist:
-            self.stations.append(value)
+        self.SSE_URL = config.sse_url
+        AUDIO_STREAM_BASE_URL = config.audio_stream_base_url
+        # Configured stations first. Any others are added as the feed mentions them.
+        self.stations = StationRegistry(config.stations)
 
-        # Initialize SSE client
-        self.init_client(self.SSE_URL)
+        # Stations whose events get decoded. None decodes every station.
+        self.subscriptions = None
+        # {subscriptions} given here take the place of the ones in settings.ini.
+        self.configured_subscriptions = set(subscriptions or config.sse_subscriptions)
+        if self.configured_subscriptions and not subscribe_all:
+            self.subscriptions = set(self.configured_subscriptions)
 
-        # Initialize audio player
-        self.audioPlayer = AudioPlayer(
-            base_url=AUDIO_STREAM_BASE_URL, loglevel=loglevel
-        )
+        # With a metadata broker running on this host, all players share its single upstream connection.
+        self.broker_socket = config.broker_socket if use_broker else ""
+        # The socket attached to the broker, None while following the feed directly
+        self.broker = None
+
+        # Initialize audio player. The audio backend loads in the background, while
+        # the SSE client connects in the metadata thread started below.
+        # Metadata-only users, such as the broker, run without audio.
+        self.audioPlayer = None
+        if audio:
+            self.audioPlayer = create_audio_player(
+                config.audio_backend,
+                base_url=AUDIO_STREAM_BASE_URL,
+                lite=self.lite,
+                device=config.audio_device,
+                variants=config.audio_variants,
+                stall_timeout=config.audio_stall_timeout,
+                loglevel=loglevel,
+            )
 
         for x in self.stations:
             self.logger.log.debug(f"Station {self.stations.index(x)}: {x}")
 
         self.station = "chillsynth"
         self.now_playing = {}
-        self.audioPlayer.play(self.station)
+        self.listeners = []
+        self.sinks = []
+        self.connections = 0
+
+        # SSE connection supervision. A complete event has to arrive every
+        # {stall_timeout} seconds, or the connection is considered dead.
+        self.http = None
+        self.client = None
+        self.response = None
+        self.stall_timeout = config.sse_stall_timeout
+        self.min_backoff = config.sse_min_backoff
+        self.max_backoff = config.sse_max_backoff
+        self.deadline = Deadline(self.keep_sse_client_alive, logger=self.logger.log)
+
+        # The now playing snapshot gives the interface data for every station on
+        # the first frame, instead of waiting for each station to send an event.
+        # {outputs} False leaves out everything that writes somewhere: snapshot,
+        # history, NDJSON file, metrics file and HTTP server. For dump().
+        self.snapshot_file = config.now_playing_snapshot if outputs else ""
+        self.snapshot_delay = 2
+        self.snapshot_timer = None
+        self.snapshot_lock = threading.Lock()
+        if self.snapshot_file:
+            self.load_snapshot()
+            atexit.register(self.save_snapshot)
+
+        # Play history records track changes from every station, not just the one playing.
+        self.history = None
+        if outputs and config.history_enabled:
+            self.history = PlayHistory(
+                database=config.history_database,
+                max_pending=500 if self.lite else 10000,
+                cache_size=256 if self.lite else None,
+                loglevel=loglevel,
+                logfile=logfile,
+            )
+            # Rows still waiting for their batch are written on the way out.
+            atexit.register(self.history.close)
+            # History records every station, so it needs every event decoded.
+            if self.subscriptions is not None:
+                self.logger.log.info("Play history is on: [SSE] subscribe is ignored.")
+                self.subscriptions = None
+
+        # Every update appended to a file, for other tools to follow.
+        if outputs and config.ndjson_file:
+            self.add_sink(
+                "ndjson",
+                NdjsonWriter(open(config.ndjson_file, "ab")),
+                max_pending=100 if self.lite else 1000,
+            )
+
+        self.metrics_writer = None
+        if outputs and config.metrics_file:
+            self.metrics_writer = MetricsFileWriter(
+                config.metrics_file, interval=config.metrics_interval
+            )
+            atexit.register(self.metrics_writer.stop)
+
+        # Optional local HTTP server for dashboards and other consumers.
+        self.http_server = None
+        if outputs and config.http_enabled:
+            from NowPlayingServer import NowPlayingServer
+
+            try:
+                self.http_server = NowPlayingServer(
+                    self,
+                    host=config.http_host,
+                    port=config.http_port,
+                    max_pending_events=20 if self.lite else 100,
+                    loglevel=loglevel,
+                    logfile=logfile,
+                )
+            except OSError as e:
+                # Most often a broker or another player next to this one serves it already.
+                self.logger.log.warning(
+                    f"Not serving now playing on {config.http_host}:{config.http_port}: {e}"
+                )
+
+        # What is heard runs behind the feed. The play clock holds metadata back to match.
+        self.play_clock = None
+        if self.audioPlayer:
+            self.play_clock = PlayClock(
+                self,
+                self.audioPlayer,
+                fixed_delay=config.audio_delay,
+                max_pending=100 if self.lite else 1000,
+                loglevel=loglevel,
+                logfile=logfile,
+            )
+            self.audioPlayer.play(self.station)
 
         thread_1 = threading.Thread(target=self.start)
         thread_1.daemon = True
         thread_1.start()
 
     def start(self):
-        self.get_metadata()
+        # The broker's feed while one runs, the SSE feed directly otherwise.
+        # Without a broker at hand, one is looked for again with backoff.
+        if self.broker_socket:
+            self.broker = self.connect_broker()
+            probe_thread = threading.Thread(target=self.probe_broker)
+            probe_thread.daemon = True
+            probe_thread.start()
+        while True:
+            if self.broker is not None:
+                self.follow_broker(self.broker)
+                self.broker = None
+                self.logger.log.warning("Lost metadata broker. Connecting to SSE directly.")
+            self.run_sse()
+
+    def add_listener(self, callback):
+        # callback(station, current) is called from the metadata thread on every update.
+        # It has to be quick. Outputs that may be slow belong in a sink.
+        self.listeners.append(callback)
+
+    def add_sink(self, name, handler, max_pending: int = 100):
+        # handler(station, current) is called from a thread of the sink's own. See Sinks.py.
+        sink = Sink(name, handler, max_pending=max_pending, logger=self.logger.log)
+        self.sinks.append(sink)
+        return sink
+
+    def connect_broker(self):
+        # A socket attached to the broker, or None if no broker is running.
+        broker = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            broker.connect(self.broker_socket)
+        except OSError:
+            broker.close()
+            return None
+        self.logger.log.info(f"Attached to metadata broker at {self.broker_socket}")
+        return broker
+
+    def probe_broker(self):
+        # Runs while the feed is followed directly. Once a broker accepts, the
+        # direct connection is cut, and run_sse hands over to the broker.
+        failures = 0
+        while True:
+            time.sleep(self.backoff(failures))
+            if self.broker is not None:
+                failures = 0
+                continue
+            broker = self.connect_broker()
+            if broker is None:
+                failures += 1
+                continue
+            self.broker = broker
+            self.cut_sse_connection()
+
+    def follow_broker(self, broker):
+        # Returns once the broker goes away.
+        with broker, broker.makefile("rb") as lines:
+            for line in lines:
+                try:
+                    update = json.loads(line)
+                    current = NowPlaying.from_wall(
+                        update["artist"],
+                        update["song"],
+                        update["started_at_wall"],
+                        update["stale"],
+                    )
+                    # The broker keeps the history, so attached players don't duplicate it.
+                    self.update_now_playing(
+                        update["station"], current, record_history=False
+                    )
+                except Exception as e:
+                    self.logger.log.error("Bad update from metadata broker")
+                    self.logger.log.error(e)
+
+    def run_sse(self):
+        # One thread owns the SSE connection for its whole life: connect, read
+        # until the stream fails or stalls, back off, and connect again.
+        # Returns when a broker has been found to take over.
+        failures = 0
+        while self.broker is None:
+            self.init_client(self.SSE_URL)
+            # A broker found while connecting cuts nothing yet, so look again.
+            if self.client is not None and self.broker is None:
+                if self.get_metadata():
+                    # The connection delivered events, so it was healthy. Start over fast.
+                    failures = 0
+            self.deadline.cancel()
+            if self.broker is not None:
+                if self.response is not None:
+                    self.response.close()
+                self.client = None
+                return
+
+            delay = self.backoff(failures)
+            failures += 1
+            self.logger.log.warning(f"SSE connection lost. Reconnecting in {delay:.2f}s")
+            time.sleep(delay)
+
+    def backoff(self, failures):
+        # Exponential backoff with jitter, so players that lost the connection
+        # together don't all come back at the same instant.
+        ceiling = min(self.max_backoff, self.min_backoff * 2**failures)
+        return random.uniform(ceiling / 2, ceiling)
 
     def fetch_sse(self, url, headers):
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-        http = urllib3.PoolManager(cert_reqs="CERT_NONE", assert_hostname=False)
+        import urllib3
+
+        if self.http is None:
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+            # TCP keepalive notices a dead peer within seconds, even while the
+            # feed is quiet. The read timeout catches a live peer that stopped sending.
+            socket_options = urllib3.connection.HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+            ]
+            if hasattr(socket, "TCP_KEEPIDLE"):
+                socket_options += [
+                    (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 1),
+                    (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 1),
+                    (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3),
+                ]
+            self.http = urllib3.PoolManager(
+                cert_reqs="CERT_NONE",
+                assert_hostname=False,
+                socket_options=socket_options,
+                timeout=urllib3.Timeout(connect=5, read=self.stall_timeout),
+                retries=False,
+            )
         try:
-            return http.request("GET", url, preload_content=False, headers=headers)
+            response = self.http.request(
+                "GET", url, preload_content=False, headers=headers
+            )
+            if response.status != 200:
+                response.release_conn()
+                raise Exception(f"SSE endpoint answered with status {response.status}")
+            return response
         except Exception as e:
             self.logger.log.error("fetch_sse error")
             self.logger.log.error(e)
@@ -68,98 +415,296 @@ class NightRideAPI:
     def init_client(self, sse_url):
         self.logger.log.debug(f"Start SSE client")
         headers = {"Accept": "text/event-stream"}
+        if self.connections:
+            SSE_RECONNECTS.inc()
+        self.connections += 1
+        self.client = None
         try:
+            import sseclient
+
             self.response = self.fetch_sse(sse_url, headers)
-            self.client = sseclient.SSEClient(self.response)
+            if self.response is not None:
+                self.client = sseclient.SSEClient(self.response)
+                self.deadline.reset(self.stall_timeout)
         except Exception as e:
+            SSE_ERRORS.inc()
             self.logger.log.error("init_client error")
             self.logger.log.error(e)
 
     def keep_sse_client_alive(self):
+        # Runs on the deadline thread. Cutting the connection makes the blocked
+        # read in get_metadata fail, and run_sse reconnects.
         self.logger.log.error(
-            "Keepalive event not received in time. Restarting sse client."
+            "No complete event received in time. Restarting sse client."
         )
-        self.client.close()
-        self.init_client(self.SSE_URL)
+        SSE_KEEPALIVE_MISSES.inc()
+        self.cut_sse_connection()
 
-        metadata_handler_thread = threading.Thread(target=self.start)
-        metadata_handler_thread.daemon = True
-        metadata_handler_thread.start()
+    def cut_sse_connection(self):
+        # Makes the blocked read in get_metadata fail.
+        try:
+            self.response.shutdown()
+        except AttributeError:
+            # urllib3 before 2.3 has no shutdown(). The connection is None once released.
+            sock = getattr(getattr(self.response, "connection", None), "sock", None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError as e:
+                    self.logger.log.error(e)
+        except Exception as e:
+            self.logger.log.error(e)
 
     def get_metadata(self):
-        countdown_seconds = 90
-        # We could use a while true -loop here to ensure the event listener is restarted in case of an error.
-        # while True:
+        # Returns True if the connection delivered at least one event.
+        received = False
         try:
-            # Start a timer to keep SSE connection alive
-            keep_alive_timer = threading.Timer(
-                countdown_seconds, self.keep_sse_client_alive
-            )
-
             for event in self.client.events():
-                self.logger.log.debug(f"SSE event received: {event.data}")
-
-                if event.data == "keepalive":
-                    # Keepalive events should be received every {countdown_seconds}.
-                    # We wait for {countdown_seconds} to pass, after which we assume the connection has been dropped, and we need to restart it.
-                    self.logger.log.debug(
-                        f"Keepalive detected, resfreshing {countdown_seconds}sec keepalive timer"
-                    )
-                    keep_alive_timer.cancel()
-                    keep_alive_timer = threading.Timer(
-                        countdown_seconds, self.keep_sse_client_alive
-                    )
-                    keep_alive_timer.start()
-
-                elif event.data != "keepalive":
-                    # Event can contain undefined values. Thus we need to initiate them as empty strings.
-                    artist = ""
-                    title = ""
-                    station = ""
-
-                    data = json.loads(event.data)
-                    if "station" in data[0]:
-                        station = data[0]["station"]
-                    station = data[0]["station"]
-
-                    # start_time is used to *estimate* play time on the interface
-                    start_time = time.perf_counter()
-
-                    if "rekt" in data[0]["station"]:
-                        # Stations 'rekt' and 'rektory' have both the song title and the artist name in the 'title' section.
-                        # These stations have to be handled in a different manner.
-                        pattern = "(.+)\s-\s(.+)"
-                        match = re.search(pattern, data[0]["title"])
-                        if match:
-                            artist = match.group(1)
-                            title = match.group(2)
-                        else:
-                            if "title" in data[0]:
-                                title = data[0]["title"]
-                    else:
-                        if "artist" in data[0]:
-                            artist = data[0]["artist"]
-                        if "title" in data[0]:
-                            title = data[0]["title"]
-
-                    current = {
-                        "artist": artist,
-                        "song": title,
-                        "started_at": start_time,
-                    }
-                    self.now_playing[station] = current
-                    self.logger.log.debug(
-                        f"New song detected on {station}: {artist} - {title}"
-                    )
+                SSE_EVENTS.inc()
+                received = True
+                # Any complete event, keepalives included, proves the connection is alive.
+                self.deadline.reset(self.stall_timeout)
+                self.handle_event(event.data)
 
         except Exception as e:
+            if self.broker is not None:
+                # Cut on purpose, to hand over to the broker
+                return received
+            SSE_ERRORS.inc()
             self.logger.log.error("get_metadata error")
             self.logger.log.error(e)
+        return received
+
+    def handle_event(self, data):
+        # Lazy %-formatting: with debug logging off, this costs next to nothing.
+        self.logger.log.debug("SSE event received: %s", data)
+
+        if data == "keepalive":
+            SSE_KEEPALIVES.inc()
+
+        elif data != "keepalive":
+            if self.subscriptions is not None:
+                # Peek at the station before paying for json.loads and the regex work.
+                station = peek_station(data)
+                if station is not None and station not in self.subscriptions:
+                    # Still worth knowing the station exists.
+                    self.stations.add(station)
+                    SSE_FILTERED.inc()
+                    return
+
+            decode_start = time.perf_counter()
+            station, current = self.parse_event(data)
+            SSE_DECODE_SECONDS.observe(time.perf_counter() - decode_start)
+            self.update_now_playing(station, current)
+
+    def subscribe(self, station):
+        # Decode events of {station} too, if decoding is limited to subscribed stations.
+        if self.subscriptions is not None:
+            self.subscriptions.add(station)
+
+    def unsubscribe(self, station):
+        # Stations subscribed in settings.ini stay subscribed.
+        if self.subscriptions is not None and station not in self.configured_subscriptions:
+            self.subscriptions.discard(station)
+
+    def parse_event(self, data):
+        # Event can contain undefined values. Thus we need to initiate them as empty strings.
+        artist = ""
+        title = ""
+
+        data = json.loads(data)
+        station = data[0]["station"]
+
+        # start_time is used to *estimate* play time on the interface
+        start_time = time.perf_counter()
+
+        if "rekt" in station:
+            # Stations 'rekt' and 'rektory' have both the song title and the artist name in the 'title' section.
+            # These stations have to be handled in a different manner.
+            pattern = r"(.+)\s-\s(.+)"
+            match = re.search(pattern, data[0]["title"])
+            if match:
+                artist = match.group(1)
+                title = match.group(2)
+            else:
+                if "title" in data[0]:
+                    title = data[0]["title"]
+        else:
+            if "artist" in data[0]:
+                artist = data[0]["artist"]
+            if "title" in data[0]:
+                title = data[0]["title"]
+
+        return station, NowPlaying(artist, title, start_time, time.time())
+
+    def update_now_playing(self, station, current, record_history=True):
+        if self.stations.add(station):
+            self.logger.log.info(f"Discovered station {station}")
+        previous = self.now_playing.get(station)
+        self.now_playing[station] = current
+        self.logger.log.debug(
+            f"New song detected on {station}: {current.artist} - {current.song}"
+        )
+
+        # The feed can repeat the current track, e.g. after a reconnect. Only changes go into history.
+        if self.history and record_history and (
+            previous is None
+            or previous.artist != current.artist
+            or previous.song != current.song
+        ):
+            self.history.record(station, current.artist, current.song)
+
+        if self.snapshot_file:
+            self.schedule_snapshot()
+
+        for callback in self.listeners:
+            try:
+                callback(station, current)
+            except Exception as e:
+                self.logger.log.error("Now playing listener failed")
+                self.logger.log.error(e)
+        for sink in self.sinks:
+            sink.put(station, current)
+
+    def load_snapshot(self):
+        try:
+            with open(self.snapshot_file, encoding="utf-8") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            self.logger.log.error("Failed to load now playing snapshot")
+            self.logger.log.error(e)
+            return
+
+        if not isinstance(snapshot, dict):
+            self.logger.log.error("Now playing snapshot is not a JSON object. Ignoring it.")
+            return
+
+        # started_at is a perf_counter() value, which is meaningless across runs.
+        # It is rebuilt from the wall clock time the snapshot was taken with.
+        loaded = 0
+        for station, entry in snapshot.items():
+            try:
+                artist, song, started_at_wall = entry
+                if not (isinstance(artist, str) and isinstance(song, str)):
+                    raise TypeError("artist and song have to be strings")
+                # Stale data is replaced by the next event from the station.
+                current = NowPlaying.from_wall(artist, song, float(started_at_wall), stale=True)
+            except (TypeError, ValueError) as e:
+                self.logger.log.warning(f"Skipping bad snapshot entry for {station}: {e}")
+                continue
+            self.stations.add(station)
+            self.now_playing[station] = current
+            loaded += 1
+        self.logger.log.debug(f"Loaded now playing snapshot of {loaded} stations")
+
+    def schedule_snapshot(self):
+        # Changes are coalesced: one write at most every {snapshot_delay} seconds.
+        with self.snapshot_lock:
+            if self.snapshot_timer is None:
+                self.snapshot_timer = threading.Timer(
+                    self.snapshot_delay, self.save_snapshot
+                )
+                self.snapshot_timer.daemon = True
+                self.snapshot_timer.start()
+
+    def save_snapshot(self):
+        with self.snapshot_lock:
+            if self.snapshot_timer is not None:
+                self.snapshot_timer.cancel()
+                self.snapshot_timer = None
+
+        snapshot = {
+            station: [current.artist, current.song, current.started_at_wall]
+            for station, current in list(self.now_playing.items())
+        }
+        try:
+            atomic_write(
+                self.snapshot_file, json.dumps(snapshot, separators=(",", ":"))
+            )
+        except Exception as e:
+            self.logger.log.error("Failed to save now playing snapshot")
+            self.logger.log.error(e)
+
+
+def dump(stations=None, max_pending=1000, summary=False):
+    # Track changes as NDJSON on stdout, without audio or interface. Runs until
+    # Ctrl-C, or until the reader of stdout goes away.
+    # Only the feed. The player, broker or server running next to it keep their files and port.
+    # Without --station, every station, whatever settings.ini subscribes to.
+    api = NightRideAPI(
+        logfile="dump.log",
+        audio=False,
+        subscribe_all=not stations,
+        subscriptions=stations,
+        outputs=False,
+    )
+    out = sys.stdout.buffer
+    wanted = set(stations or [])
+    playing = {}
+    written = {"updates": 0, "bytes": 0}
+    done = threading.Event()
+
+    def write(station, current):
+        if wanted and station not in wanted:
+            return
+        # The first update of a station, then changes only. Reconnects repeat the current track.
+        track = (current.artist, current.song)
+        if playing.get(station) == track:
+            return
+        playing[station] = track
+        line = ndjson(station, current)
+        try:
+            out.write(line)
+            out.flush()
+        except BrokenPipeError:
+            # Nothing left to flush into at exit, either.
+            os.dup2(os.open(os.devnull, os.O_WRONLY), out.fileno())
+            done.set()
+            return
+        written["updates"] += 1
+        written["bytes"] += len(line)
+
+    # Bounded: a reader that falls behind loses the oldest updates, and the feed carries on.
+    sink = api.add_sink("stdout", write, max_pending=max_pending)
+    started = time.perf_counter()
+    try:
+        done.wait()
+    except KeyboardInterrupt:
+        sink.drain(timeout=1)
+
+    if summary:
+        seconds = time.perf_counter() - started
+        print(
+            f"{written['updates']} updates in {seconds:.1f}s,"
+            f" {written['updates'] / seconds:.2f}/s, {written['bytes'] / seconds:.0f} B/s,"
+            f" {sink.dropped.value} dropped",
+            file=sys.stderr,
+        )
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nightride metadata feed.")
+    parser.add_argument(
+        "--dump", action="store_true", help="Track changes as NDJSON on stdout, without audio"
+    )
+    parser.add_argument(
+        "--station", action="append", help="Only this station. Can be given more than once"
+    )
+    parser.add_argument("--max-pending", type=int, default=1000, help="Updates buffered for stdout")
+    parser.add_argument(
+        "--summary", action="store_true", help="Print rate and throughput to stderr on exit"
+    )
+    args = parser.parse_args()
+
+    if args.dump:
+        dump(stations=args.station, max_pending=args.max_pending, summary=args.summary)
+        sys.exit()
+
     nightRide = NightRideAPI(loglevel=logging.DEBUG)
     try:
-        nightRide.start()
+        while True:
+            time.sleep(1)
     except KeyboardInterrupt:
         nightRide.audioPlayer.stop()
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import logging
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logger import Logger
+
+from Metrics import registry
+
+# NowPlayingServer serves what NightRideAPI knows over local HTTP.
+#
+# GET /now-playing            every station, as JSON
+# GET /now-playing/<station>  one station, as JSON
+# GET /events                 server-sent events, one per track change
+# GET /metrics                player metrics, in the Prometheus text format
+#
+# JSON responses carry a strong ETag and answer If-None-Match with
+# 304 Not Modified. Bodies and tags are built once per track change, not per
+# request, so polling consumers cost a dictionary lookup.
+#
+# Usage:
+# server = NowPlayingServer(api, host="127.0.0.1", port=8741)
+
+KEEPALIVE_SECONDS = 15
+
+
+def etag_for(body: bytes):
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+class NowPlayingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes. Without this, Nagle's algorithm
+    # holds the body back until the client acknowledges the headers.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        relay = self.server.relay
+        if self.path == "/events":
+            self.stream_events(relay)
+            return
+        if self.path == "/metrics":
+            self.send_metrics()
+            return
+
+        if self.path == "/now-playing":
+            cached = relay.all_stations
+        elif self.path.startswith("/now-playing/"):
+            cached = relay.stations.get(self.path[len("/now-playing/") :])
+        else:
+            cached = None
+
+        if cached is None:
+            self.send_error(404)
+            return
+
+        body, etag = cached
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_metrics(self):
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_events(self, relay):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        events = relay.subscribe()
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    event = b"data: keepalive\n\n"
+                if event is None:
+                    # Fell too far behind and was cut off.
+                    return
+                self.wfile.write(event)
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            relay.unsubscribe(events)
+
+    def log_message(self, format, *args):
+        self.server.relay.logger.log.debug(format % args)
+
+
+class NowPlayingServer:
+    def __init__(
+        self,
+        api,
+        host: str = "127.0.0.1",
+        port: int = 8741,
+        max_pending_events: int = 100,
+        loglevel=logging.INFO,
+        logfile: str = "radio.log",
+    ):
+        self.logger = Logger(
+            module_name=__name__,
+            log_file=logfile,
+            log_level=loglevel,
+            delete_old_logfile=True,
+            streamhandler=False,
+            filehandler=True,
+        )
+
+        self.api = api
+        self.max_pending_events = max_pending_events
+        self.lock = threading.Lock()
+        self.subscribers = []
+
+        # (body, etag) per station, and for all stations together.
+        self.stations = {}
+        self.all_stations = None
+        for station, current in list(api.now_playing.items()):
+            self.stations[station] = self.render(station, current)
+        self.render_all()
+
+        # Raises OSError if the port is taken, before anything is registered with the api.
+        self.httpd = ThreadingHTTPServer((host, port), NowPlayingHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.relay = self
+        self.port = self.httpd.server_address[1]
+        # Rendering and queueing to clients happen in a sink, off the metadata thread.
+        api.add_sink("http", self.update)
+
+        server_thread = threading.Thread(target=self.httpd.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        self.logger.log.info(f"Now playing server listening on {host}:{self.port}")
+
+    def as_json(self, station, current):
+        return {
+            "station": station,
+            "artist": current.artist,
+            "song": current.song,
+            "started_at": current.started_at_wall,
+            "stale": current.stale,
+        }
+
+    def render(self, station, current):
+        body = json.dumps(self.as_json(station, current)).encode("utf-8")
+        return body, etag_for(body)
+
+    def render_all(self):
+        body = json.dumps(
+            [
+                self.as_json(station, current)
+                for station, current in list(self.api.now_playing.items())
+            ]
+        ).encode("utf-8")
+        self.all_stations = (body, etag_for(body))
+
+    def update(self, station, current):
+        body, etag = self.render(station, current)
+        self.stations[station] = (body, etag)
+        self.render_all()
+
+        event = b"data: " + body + b"\n\n"
+        with self.lock:
+            for events in list(self.subscribers):
+                try:
+                    events.put_nowait(event)
+                except queue.Full:
+                    # A consumer that stopped reading must not hold up the others.
+                    self.subscribers.remove(events)
+                    self.drop(events)
+
+    def drop(self, events):
+        while True:
+            try:
+                events.get_nowait()
+            except queue.Empty:
+                break
+        events.put_nowait(None)
+
+    def subscribe(self):
+        events = queue.Queue(maxsize=self.max_pending_events)
+        with self.lock:
+            self.subscribers.append(events)
+        return events
+
+    def unsubscribe(self, events):
+        with self.lock:
+            if events in self.subscribers:
+                self.subscribers.remove(events)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    from Config import get_config
+    from NightrideAPI import NightRideAPI
+
+    config = get_config()
+    api = NightRideAPI(logfile="server.log", audio=False)
+    server = api.http_server or NowPlayingServer(
+        api, host=config.http_host, port=config.http_port, logfile="server.log"
+    )
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.close()
@@ -0,0 +1,138 @@
+import collections
+import logging
+import threading
+import time
+from logger import Logger
+
+from Metrics import registry
+from Sinks import Sink
+
+PLAY_CLOCK_DELAY = registry.gauge(
+    "nightride_play_clock_delay_seconds", "Delay applied to metadata, to match the audio heard"
+)
+PLAY_CLOCK_DROPPED = registry.counter(
+    "nightride_play_clock_dropped_total", "Updates dropped while too many waited for the audio"
+)
+
+# PlayClock holds metadata back until the audio it belongs to is heard.
+#
+# The audio player runs several seconds behind the live stream, and the
+# metadata feed does not. PlayClock listens to NightRideAPI, and moves each
+# update into its own {now_playing} once the audio backend's measured delay
+# has passed since the update arrived. The delay is read again while an update
+# waits, so drift in the audio buffer moves the title change along with it.
+# Play times are shifted by the same delay, so the play time counts from the
+# moment the track is heard.
+#
+# Usage:
+# clock = PlayClock(api, api.audioPlayer)
+# clock.now_playing["darksynth"]
+
+
+class PlayClock:
+    def __init__(
+        self,
+        api,
+        audio,
+        fixed_delay: float = None,
+        drift_threshold: float = 0.5,
+        max_pending: int = 1000,
+        loglevel=logging.INFO,
+        logfile: str = "radio.log",
+    ):
+        self.logger = Logger(
+            module_name=__name__,
+            log_file=logfile,
+            log_level=loglevel,
+            delete_old_logfile=True,
+            streamhandler=False,
+            filehandler=True,
+        )
+
+        self.audio = audio
+        # A fixed delay from settings.ini replaces the measurement.
+        self.fixed_delay = fixed_delay
+        self.delay = fixed_delay or 0.0
+        # Delay changes larger than this are logged
+        self.drift_threshold = drift_threshold
+        self.logged_delay = self.delay
+
+        # Snapshot data is not tied to any audio, so it shows up right away.
+        self.now_playing = dict(api.now_playing)
+        self.listeners = []
+        self.sinks = []
+        # Bounded, for a feed that runs far ahead of the delay, e.g. a fast replay.
+        # The oldest updates go first.
+        self.pending = collections.deque(maxlen=max_pending)
+        self.condition = threading.Condition()
+
+        PLAY_CLOCK_DELAY.set_function(lambda: self.delay)
+        api.add_listener(self.schedule)
+
+        clock_thread = threading.Thread(target=self.run)
+        clock_thread.daemon = True
+        clock_thread.start()
+
+    def add_listener(self, callback):
+        # callback(station, current) is called from the clock thread, as the audio catches up.
+        self.listeners.append(callback)
+
+    def add_sink(self, name, handler, max_pending: int = 100):
+        # handler(station, current) is called from a thread of the sink's own, as the audio catches up.
+        sink = Sink(name, handler, max_pending=max_pending, logger=self.logger.log)
+        self.sinks.append(sink)
+        return sink
+
+    def schedule(self, station, current):
+        with self.condition:
+            if len(self.pending) == self.pending.maxlen:
+                PLAY_CLOCK_DROPPED.inc()
+            self.pending.append((station, current))
+            self.condition.notify()
+
+    def current_delay(self):
+        if self.fixed_delay is None:
+            measured = self.audio.delay
+            # Between connections the measurement starts over. Keep the last one meanwhile.
+            if measured is not None:
+                self.delay = measured
+            if abs(self.delay - self.logged_delay) > self.drift_threshold:
+                self.logger.log.info(
+                    f"Audio delay drifted from {self.logged_delay:.2f}s to {self.delay:.2f}s"
+                )
+                self.logged_delay = self.delay
+        return self.delay
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                station, current = self.pending[0]
+                delay = self.current_delay()
+                wait = current.started_at + delay - time.perf_counter()
+                if wait > 0:
+                    # Short waits, so a change in the delay is picked up.
+                    self.condition.wait(min(wait, 0.25))
+                    continue
+                self.pending.popleft()
+            self.deliver(station, current, delay)
+
+    def deliver(self, station, current, delay):
+        # A NowPlaying, as of when it is heard
+        heard = type(current)(
+            current.artist,
+            current.song,
+            current.started_at + delay,
+            current.started_at_wall + delay,
+            current.stale,
+        )
+        self.now_playing[station] = heard
+        for callback in self.listeners:
+            try:
+                callback(station, heard)
+            except Exception as e:
+                self.logger.log.error("Play clock listener failed")
+                self.logger.log.error(e)
+        for sink in self.sinks:
+            sink.put(station, heard)
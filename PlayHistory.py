@@ -0,0 +1,218 @@
+import argparse
+import datetime
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from logger import Logger
+
+# PlayHistory stores every track change from every Nightride station in SQLite.
+#
+# Writes are queued and committed in batches by a single writer thread, so the
+# SSE handler never waits on the disk. The database runs in WAL mode, which lets
+# the query side read while the writer is committing.
+#
+# Usage:
+# history = PlayHistory(database="history.db")
+# history.record("darksynth", "Perturbator", "Future Club")
+# history.query(station="darksynth", since=time.time() - 3600)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plays (
+    id INTEGER PRIMARY KEY,
+    played_at REAL NOT NULL,
+    station TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    song TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_plays_station_time ON plays (station, played_at);
+CREATE INDEX IF NOT EXISTS idx_plays_artist ON plays (artist);
+"""
+
+INSERT = "INSERT INTO plays (played_at, station, artist, song) VALUES (?, ?, ?, ?)"
+
+
+class PlayHistory:
+    def __init__(
+        self,
+        database: str = "history.db",
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        max_pending: int = 10000,
+        cache_size: int = None,
+        loglevel=logging.INFO,
+        logfile: str = "radio.log",
+    ):
+        self.logger = Logger(
+            module_name=__name__,
+            log_file=logfile,
+            log_level=loglevel,
+            delete_old_logfile=True,
+            streamhandler=False,
+            filehandler=True,
+        )
+
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # SQLite page cache per connection, in KiB. None keeps the SQLite default of 2 MiB.
+        self.cache_size = cache_size
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+
+        # Create the schema up front, so queries work before the first write.
+        connection = self.connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+
+        self.writer_thread = threading.Thread(target=self.writer)
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def connect(self):
+        connection = sqlite3.connect(self.database, timeout=10)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable across application crashes in WAL mode, and only
+        # risks the last transactions on power loss.
+        connection.execute("PRAGMA synchronous=NORMAL")
+        if self.cache_size is not None:
+            connection.execute(f"PRAGMA cache_size=-{int(self.cache_size)}")
+        return connection
+
+    def record(self, station: str, artist: str, song: str, played_at: float = None):
+        if played_at is None:
+            played_at = time.time()
+        try:
+            self.pending.put_nowait((played_at, station, artist, song))
+        except queue.Full:
+            # Never block the SSE handler. Losing history beats losing metadata.
+            self.dropped += 1
+            self.logger.log.warning(f"History queue full, dropped {station} event")
+
+    def writer(self):
+        connection = self.connect()
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            rows = [row for row in batch if row is not None]
+            try:
+                with connection:
+                    connection.executemany(INSERT, rows)
+                self.logger.log.debug(f"Wrote {len(rows)} history rows")
+            except Exception as e:
+                self.logger.log.error("History write error")
+                self.logger.log.error(e)
+
+            for _ in batch:
+                self.pending.task_done()
+            if None in batch:
+                connection.close()
+                return
+
+    def flush(self):
+        # Wait until everything recorded so far has been committed.
+        self.pending.join()
+
+    def close(self):
+        self.pending.put(None)
+        self.writer_thread.join()
+
+    def query(
+        self,
+        station: str = None,
+        artist: str = None,
+        since: float = None,
+        until: float = None,
+        limit: int = 100,
+    ):
+        clauses = []
+        params = []
+        if station:
+            clauses.append("station = ?")
+            params.append(station)
+        if artist:
+            clauses.append("artist = ?")
+            params.append(artist)
+        if since is not None:
+            clauses.append("played_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("played_at < ?")
+            params.append(until)
+
+        sql = "SELECT played_at, station, artist, song FROM plays"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY played_at DESC LIMIT ?"
+        params.append(limit)
+
+        connection = self.connect()
+        try:
+            rows = connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+
+        return [
+            {"played_at": played_at, "station": station, "artist": artist, "song": song}
+            for played_at, station, artist, song in rows
+        ]
+
+
+def parse_time(value: str):
+    # Accepts ISO dates ("2022-05-01", "2022-05-01T22:00") and relative
+    # offsets into the past ("90m", "12h", "2d").
+    units = {"m": 60, "h": 3600, "d": 86400}
+    if value[-1:] in units and value[:-1].isdigit():
+        return time.time() - int(value[:-1]) * units[value[-1]]
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def last_night():
+    # "Last night" is yesterday 20:00 until today 06:00, local time.
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    since = today - datetime.timedelta(hours=4)
+    until = today + datetime.timedelta(hours=6)
+    return since.timestamp(), until.timestamp()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query Nightride play history.")
+    parser.add_argument("--database", default="history.db")
+    parser.add_argument("--station", help="e.g. darksynth")
+    parser.add_argument("--artist")
+    parser.add_argument("--since", help='ISO time or offset like "12h"')
+    parser.add_argument("--until", help='ISO time or offset like "1h"')
+    parser.add_argument(
+        "--last-night", action="store_true", help="Yesterday 20:00 to today 06:00"
+    )
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    since = parse_time(args.since) if args.since else None
+    until = parse_time(args.until) if args.until else None
+    if args.last_night:
+        since, until = last_night()
+
+    history = PlayHistory(database=args.database, logfile="history.log")
+    rows = history.query(
+        station=args.station,
+        artist=args.artist,
+        since=since,
+        until=until,
+        limit=args.limit,
+    )
+    for row in reversed(rows):
+        played_at = datetime.datetime.fromtimestamp(row["played_at"])
+        print(
+            f'{played_at:%Y-%m-%d %H:%M}  {row["station"]:<12} {row["artist"]} - {row["song"]}'
+        )
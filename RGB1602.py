@@ -1,12 +1,19 @@
 # -*- coding: utf-8 -*-
 from enum import Enum
 import time
-from smbus import SMBus
 import logging
+import unicodedata
+
+from Metrics import registry
+
+I2C_TRANSACTIONS = registry.counter('nightride_lcd_i2c_transactions_total', 'I2C writes to the LCD and its RGB backlight')
+I2C_ERRORS = registry.counter('nightride_lcd_i2c_errors_total', 'Failed I2C writes to the LCD and its RGB backlight')
 
 # from getch import _Getch
 
-b = SMBus(1)
+# I2C bus, opened by the first RGB1602 instance. smbus is imported lazily,
+# so importing this module stays cheap.
+b = None
 
 # Device I2C Arress
 LCD_ADDRESS = (0x7c >> 1)   # 0111 1100
@@ -19,7 +26,18 @@ REG_GREEN = 0x03    # 0000 0011
 REG_BLUE = 0x02     # 0000 0010
 REG_MODE1 = 0x00    # 0000 0000
 REG_MODE2 = 0x01    # 0000 0001
+REG_GRPPWM = 0x06   # 0000 0110
+REG_GRPFREQ = 0x07  # 0000 0111
 REG_OUTPUT = 0x08   # 0000 1000
+
+# Control register flag of the RGB controller: the register address goes up by
+# one after every byte, so a block of registers is written in one transaction.
+AUTO_INCREMENT = 0x80   # 1000 0000
+
+# MODE2 values. With DMBLNK, GRPPWM and GRPFREQ blink the backlight;
+# without it, GRPPWM dims it.
+MODE2_BLINK = 0x20  # 0010 0000
+MODE2_DIM = 0x00    # 0000 0000
 LCD_CLEARDISPLAY = 0x01     # 0000 0001
 LCD_RETURNHOME = 0x02       # 0000 0010
 LCD_ENTRYMODESET = 0x04     # 0000 0100
@@ -58,6 +76,76 @@ LCD_2LINE = 0x08        # 0000 1000
 LCD_1LINE = 0x00        # 0000 0000
 LCD_5x8DOTS = 0x00      # 0000 0000
 
+# Character ROM of the AiP31068 (the HD44780 A00 set). 0x20-0x7d are ASCII,
+# except 0x5c, which is a yen sign. 0x7e and 0x7f are arrows, and the upper
+# half is mostly katakana, with a few Latin and Greek letters and symbols.
+ROM_GLYPHS = {
+    '¥': 0x5c, '→': 0x7e, '←': 0x7f,
+    '。': 0xa1, '「': 0xa2, '」': 0xa3, '、': 0xa4, '・': 0xa5, '·': 0xa5, '•': 0xa5,
+    '°': 0xdf, 'α': 0xe0, 'ä': 0xe1, 'ß': 0xe2, 'β': 0xe2, 'ε': 0xe3, 'µ': 0xe4, 'μ': 0xe4,
+    'σ': 0xe5, 'ρ': 0xe6, '√': 0xe8, '¢': 0xec, '£': 0xed, 'ñ': 0xee, 'ö': 0xef,
+    'θ': 0xf2, '∞': 0xf3, 'Ω': 0xf4, 'ü': 0xf5, 'Σ': 0xf6, 'π': 0xf7, '÷': 0xfd, '█': 0xff,
+    # No capitals with umlauts in the ROM. The small ones are closer than a bare letter.
+    'Ä': 0xe1, 'Ö': 0xef, 'Ü': 0xf5, 'Ñ': 0xee,
+}
+
+# Characters without a glyph, and without a decomposition to ASCII
+TRANSLITERATIONS = {
+    '\\': '/', '~': '-', '\x7f': '?',
+    '‘': "'", '’': "'", '‚': "'", '‛': "'", '´': "'",
+    '“': '"', '”': '"', '„': '"', '«': '<<', '»': '>>', '‹': '<', '›': '>',
+    '‐': '-', '‑': '-', '‒': '-', '–': '-', '—': '-', '―': '-', '−': '-',
+    '…': '...', '×': 'x', '¡': '!', '¿': '?', '©': '(c)', '®': '(R)', '™': 'TM',
+    'Æ': 'AE', 'æ': 'ae', 'Œ': 'OE', 'œ': 'oe', 'Ø': 'O', 'ø': 'o', 'Đ': 'D', 'đ': 'd',
+    'Ł': 'L', 'ł': 'l', 'Þ': 'Th', 'þ': 'th', 'Ð': 'D', 'ð': 'd', 'ı': 'i', '\u00a0': ' ',
+}
+
+
+def transliterate(character:str):
+    # ASCII for a character without a glyph, e.g. e for é, or None
+    decomposed = ''.join(
+        c for c in unicodedata.normalize('NFKD', character) if not unicodedata.combining(c)
+    )
+    if decomposed and all(' ' <= c < '\x7f' and c not in '\\~' for c in decomposed):
+        return decomposed
+    return None
+
+
+class RomTable(dict):
+    # Code point to ROM bytes, as latin-1 characters, for str.translate. ASCII,
+    # Latin-1, Latin Extended and the common punctuation are built in advance.
+    # Any other character is transliterated the first time it is seen, and remembered.
+    def __missing__(self, code):
+        glyphs = transliterate(chr(code))
+        if glyphs is None:
+            # Once per character, not once per title
+            logging.getLogger(__name__).error(f'No LCD glyph for {chr(code)!r}')
+            glyphs = '?'
+        self[code] = glyphs
+        return glyphs
+
+
+def buildRomTable():
+    table = RomTable({code: chr(code) for code in range(0x80)})
+    for code in range(0x80, 0x250):
+        table[code] = transliterate(chr(code)) or '?'
+    for character, glyphs in TRANSLITERATIONS.items():
+        table[ord(character)] = glyphs
+    for character, code in ROM_GLYPHS.items():
+        table[ord(character)] = chr(code)
+    return table
+
+
+ROM_TABLE = None
+
+
+def encodeForLcd(text:str) -> bytes:
+    """Text as bytes of the LCD character ROM, in one translate and one encode."""
+    global ROM_TABLE
+    if ROM_TABLE is None:
+        ROM_TABLE = buildRomTable()
+    return text.translate(ROM_TABLE).encode('latin_1')
+
 
 class RGB1602:
     def __init__(self, col, row, loglevel: str='info', logfile: str=False):
@@ -85,6 +173,11 @@ class RGB1602:
             
         self.logger.info(f'Logger setup finished for {__name__} module')
         ### Logger setup finished
+
+        global b
+        if b is None:
+            from smbus import SMBus
+            b = SMBus(1)
         
         self._row = row
         self._col = col
@@ -109,28 +202,26 @@ class RGB1602:
         cmd_bin = f'{cmd_bin[0:4]} {cmd_bin[4:8]}'
         self.logger.debug(f'Sending command [{cmd_bin}] to display')
         
+        I2C_TRANSACTIONS.inc()
         try:
             b.write_byte_data(LCD_ADDRESS, 0x80, cmd)
         except OSError as err:
+            I2C_ERRORS.inc()
             self.logger.error(err)
 
     # send a command to character creator address
+    # data is a byte of the character ROM. See encodeForLcd.
     def write(self, data):
-        
-        # Handle special letters ä and ö, which are not in proper places (for latin-1) in the AiP31068-001 CHARACTER PATTERN of the board.
-        if data == 228 :# ä
-            data = 225 
-        if data == 246: # ö
-            data = 239 
-        
         # Convert values to binary for logging purposes
         data_bin = format(data, '08b')
         data_bin = f'{data_bin[0:4]} {data_bin[4:8]}'
         self.logger.debug(f'Sending command [{data_bin}] to character creator')
         
+        I2C_TRANSACTIONS.inc()
         try:
             b.write_byte_data(LCD_ADDRESS, 0x40, data)
         except OSError as err:
+            I2C_ERRORS.inc()
             self.logger.error(err)
 
     def setReg(self, reg, data):
@@ -141,15 +232,66 @@ class RGB1602:
         reg_bin = f'{reg_bin[0:4]} {reg_bin[4:8]}'
         self.logger.debug(f'Sending command [{data_bin}] to RGB, registry [{reg_bin}]')
         
+        I2C_TRANSACTIONS.inc()
         try:
             b.write_byte_data(RGB_ADDRESS, reg, data)
         except OSError as err:
+            I2C_ERRORS.inc()
+            self.logger.error(err)
+
+    # Write consecutive RGB registers, starting from reg, in one transaction
+    def setRegs(self, reg, data:list):
+        self.logger.debug(f'Sending {len(data)} bytes to RGB, from registry [{format(reg, "08b")}]')
+
+        I2C_TRANSACTIONS.inc()
+        try:
+            b.write_i2c_block_data(RGB_ADDRESS, AUTO_INCREMENT | reg, data)
+        except OSError as err:
+            I2C_ERRORS.inc()
             self.logger.error(err)
 
     def setRGB(self, rgb:tuple):
-        self.setReg(REG_RED, rgb[0])
-        self.setReg(REG_GREEN, rgb[1])
-        self.setReg(REG_BLUE, rgb[2])
+        # Blue, green and red are registers 0x02, 0x03 and 0x04
+        self.setRegs(REG_BLUE, [rgb[2], rgb[1], rgb[0]])
+
+    def setMode2(self, mode2):
+        if mode2 != self._mode2:
+            self.setReg(REG_MODE2, mode2)
+            self._mode2 = mode2
+
+    # Backlight effects run in the RGB controller. Once set, they take no I2C traffic.
+    def blink(self, period:float=1.0, duty:float=0.5, color:str=None):
+        """
+            Blink the backlight in hardware, until steady() or dim().
+
+            Parameters
+            ----------
+            period : float
+                Seconds per blink, from 0.042 to 10.67.
+            duty : float
+                Share of the period the backlight is on, from 0 to 1.
+            color : str
+                Color to blink in. The current color if not given.
+            """
+        self.setMode2(MODE2_BLINK)
+        # Blink period is (GRPFREQ + 1) / 24 seconds. On time is GRPPWM / 256 of it.
+        grpfreq = min(255, max(0, round(period * 24) - 1))
+        grppwm = min(255, max(0, round(duty * 256)))
+        if color is None:
+            self.setRegs(REG_GRPPWM, [grppwm, grpfreq])
+        else:
+            # Color, the unused fourth channel and the effect, in one transaction
+            rgb = self.colors[color]
+            self.setRegs(REG_BLUE, [rgb[2], rgb[1], rgb[0], 0, grppwm, grpfreq])
+
+    def dim(self, level:float):
+        """Dim the whole backlight in hardware, to a level from 0 to 1 of the current color."""
+        self.setMode2(MODE2_DIM)
+        self.setReg(REG_GRPPWM, min(255, max(0, round(level * 255))))
+
+    def steady(self):
+        """Stop blinking or dimming."""
+        self.dim(1)
 
     def setCursor(self, col, row):
         if(row == 0):
@@ -170,18 +312,8 @@ class RGB1602:
         if(isinstance(arg, int)):
             arg = str(arg)
         self.setCursor(0, row)
-        
-        btarr = bytearray()
-        
-        for char in arg:
-            try:
-                btarr.extend(bytes(char, 'latin_1'))
-            except UnicodeEncodeError:
-                # Erroneous characters will be turned into '?'
-                self.logger.error(f'Could not encode: {char}')
-                btarr.extend(bytes('?', 'latin_1'))
-        
-        for bt in btarr:
+
+        for bt in encodeForLcd(arg):
             self.write(bt)
 
     # 126 → 0x7e
@@ -231,10 +363,7 @@ class RGB1602:
         col = 0
         self.setCursor(col, row)
         
-        try:
-            b_array = bytearray(msg, encoding='latin_1', errors='replace')
-        except UnicodeEncodeError as e:
-            self.logger.error(e)
+        b_array = encodeForLcd(msg)
         for c in b_array:
             # Erase a whitespace, if its the first character on a row. Waste less screen space.
             if col == 0 and chr(c).isspace():
@@ -322,11 +451,11 @@ class RGB1602:
     
     def flashScreen(self, color='YELLOW_GREEN', topRow='', botRow=''):
         self.printOnTwoRows(topRow, botRow, color=color, turnOffAfter=False, freezeFor=0)
-        for i in range(4):
-            self.setRGB(self.colors[color])
-            time.sleep(.2)
-            self.turnOff()
-            time.sleep(.2)
+        # Four blinks of .4 seconds, timed by the RGB controller
+        self.blink(period=.4, duty=.5)
+        time.sleep(1.6)
+        self.steady()
+        self.turnOff()
         self.clear()
 
     def begin(self, cols, lines):
@@ -376,8 +505,10 @@ class RGB1602:
         self.setReg(REG_OUTPUT, 0xFF)
         
         # set MODE2 values
-        # 0010 0000 -> 0x20  (DMBLNK to 1, ie blinky mode)
-        self.setReg(REG_MODE2, 0x20)
+        # 0000 0000 -> 0x00  (DMBLNK to 0, ie dimming mode, at full level)
+        # blink() sets 0x20  (DMBLNK to 1, ie blinky mode)
+        self._mode2 = None
+        self.steady()
 
         self.setColorWhite()
 
@@ -415,7 +546,7 @@ class RGB1602:
             # get char from stdin
             c = self.getch.__call__()
             # convert to bytes 
-            bytearr = bytearray(c, 'latin_1')
+            bytearr = bytearray(c, 'latin_1', errors='replace')
             # print(bytearr)
             
             # quit on ESC (0x1b) and CTRL+C (0x03)
@@ -467,8 +598,9 @@ class RGB1602:
             
             else:
                 memory.append(c)
-                self.write(x)
-                i += 1
+                for x in encodeForLcd(c):
+                    self.write(x)
+                    i += 1
                 
             time.sleep(.01)
         
@@ -1,17 +1,46 @@
-import configparser
 import curses
-import curses.panel
 import curses.textpad
 import logging
 from logger import Logger
 import random
+import threading
 import time
 
-from NightrideAPI import NightRideAPI
+from Config import get_config
+from FrameProfiler import FrameProfiler
+from Metrics import registry
+from NightrideAPI import NightRideAPI, NowPlaying
+from Screen import AnsiScreen, CursesScreen
+from StationRegistry import StationSelector
+
+FRAME_SECONDS = registry.histogram(
+    "nightride_render_frame_seconds", "Time to draw one frame"
+)
+FRAME_INTERVAL = 0.1
+NOTHING_PLAYING = NowPlaying("", "", 0, 0)
+
+COLOR_PAIRS = {
+    1: (curses.COLOR_MAGENTA, curses.COLOR_BLACK),
+    2: (curses.COLOR_CYAN, curses.COLOR_BLACK),
+    3: (curses.COLOR_BLACK, curses.COLOR_CYAN),
+    # 4: (curses.COLOR_CYAN, curses.COLOR_MAGENTA) # Cyan on magenta is hard to read
+    4: (curses.COLOR_BLACK, curses.COLOR_MAGENTA),
+    5: (curses.COLOR_BLACK, curses.COLOR_WHITE),
+    6: (curses.COLOR_BLACK, curses.COLOR_MAGENTA),
+    7: (curses.COLOR_BLACK, curses.COLOR_RED),
+    8: (curses.COLOR_BLACK, curses.COLOR_GREEN),
+    9: (curses.COLOR_BLACK, curses.COLOR_BLUE),
+    10: (curses.COLOR_BLACK, curses.COLOR_BLACK),
+}
+
+# Row, column, height and width of the popups
+POPUP = (2, 2, 9, 49)
 
 
 class RadioInterface:
-    def __init__(self, loglevel=logging.INFO, logfile: str = "radio.log"):
+    def __init__(
+        self, loglevel=logging.INFO, logfile: str = "radio.log", screen=None, api=None, lcd=None
+    ):
         ### ArgParse ###
         # parser = argparse.ArgumentParser(description='Text-based user interface for Nightride.fm.')
 
@@ -27,29 +56,30 @@ class RadioInterface:
             filehandler=True,
         )
 
-        ### Read config ###
-        self.config = configparser.ConfigParser()
-        self.config.read("settings.ini")
+        self.config = get_config()
 
-        self.LCD1602_MODULE = self.config.getboolean("ADDONS", "LCD1602")
-        if self.LCD1602_MODULE:
-            self.logger.log.debug(f"Initializing lcd module")
-            import RGB1602
-
-            self.lcd = RGB1602.RGB1602(16, 2, "error", logfile="radio.log")
+        # Subsystems start concurrently: the LCD and libvlc initialize in their own
+        # threads and the SSE client connects in the API thread, while curses draws
+        # the interface right away.
+        # In multi-process mode the API and the LCD are stand-ins for other processes. See Supervisor.py.
+        self.remote_lcd = lcd
+        self.lcd = None
+        # The LCD is written from its sink, and from key handlers. One at a time.
+        self.lcd_lock = threading.Lock()
+        self.LCD1602_MODULE = self.config.lcd1602
 
-        self.api = NightRideAPI(loglevel=loglevel, logfile="radio.log")
+        self.api = api or NightRideAPI(loglevel=loglevel, logfile="radio.log")
 
-        stationlist = self.config.items("STATIONS")
-        self.stations = []
-        for key, value in stationlist:
-            self.stations.append(value)
+        # Shared with the API, which adds stations as they are discovered.
+        self.stations = self.api.stations
 
-        self.VU_METER = self.config.getboolean("SETTINGS", "VU_METER")
+        self.VU_METER = self.config.vu_meter
         self.volume = 4
         self.api.audioPlayer.set_volume(self.volume)
-        self.station = self.config["SETTINGS"]["default_station"]
+        self.station = self.config.default_station
         self.orig_time = False
+        # The API record on display, and what is drawn of it
+        self.current = None
         self.now_playing = {
             "artist": "",
             "artist_short": "",
@@ -57,91 +87,164 @@ class RadioInterface:
             "song_short": "",
         }
         self.version = "v1.0"
+
+        # Updates reach the screen and the LCD through sinks, as the audio catches up.
+        # A slow I2C write holds up neither the feed nor the frames. See Sinks.py.
+        self.api.play_clock.add_sink("screen", self.show_now_playing, max_pending=10)
+        self.lcd_sink = self.api.play_clock.add_sink("lcd", self.show_on_lcd, max_pending=1)
+        if self.LCD1602_MODULE:
+            self.init_lcd()
+        # The open popup, "about" or "select", or None for the radio itself
+        self.mode = None
+        self.selector = None
+        self.profiler = FrameProfiler(window=60 if self.api.lite else 300)
+        self.crashed = False
         try:
-            curses.wrapper(self.main)
+            # A given screen is used as is, e.g. a headless one in benchmarks/soak.py.
+            if screen is not None:
+                self.main(screen)
+            # The ANSI renderer sends only changed cells, for slow SSH links.
+            elif self.config.renderer == "ansi":
+                with AnsiScreen(COLOR_PAIRS, byte_budget=self.config.render_byte_budget) as screen:
+                    self.main(screen)
+            else:
+                curses.wrapper(lambda stdscr: self.main(CursesScreen(stdscr, COLOR_PAIRS)))
         except Exception as e:
             print("An error caused the program to crash. See radio.log for details")
             self.logger.log.error(e)
+            self.crashed = True
+
+    def init_lcd(self):
+        lcd_thread = threading.Thread(target=self.start_lcd)
+        lcd_thread.daemon = True
+        lcd_thread.start()
+
+    def start_lcd(self):
+        self.logger.log.debug(f"Initializing lcd module")
+        if self.remote_lcd is not None:
+            self.lcd = self.remote_lcd
+            self.set_now_playing()
+            return
+        try:
+            import RGB1602
 
-    def main(self, stdscr):
-        # curses.noecho()
-        curses.curs_set(0)
-        curses.start_color()
-
-        stdscr.nodelay(True)
-
-        curses.init_pair(1, curses.COLOR_MAGENTA, curses.COLOR_BLACK)
-        curses.init_pair(2, curses.COLOR_CYAN, curses.COLOR_BLACK)
+            self.lcd = RGB1602.RGB1602(16, 2, "error", logfile="radio.log")
+        except Exception as e:
+            self.logger.log.error("Failed to initialize lcd module")
+            self.logger.log.error(e)
+            return
+        # Show whatever is playing by now
+        self.set_now_playing()
 
-        curses.init_pair(3, curses.COLOR_BLACK, curses.COLOR_CYAN)
-        # curses.init_pair(4, curses.COLOR_CYAN, curses.COLOR_MAGENTA) # Cyan on magenta is hard to read
-        curses.init_pair(4, curses.COLOR_BLACK, curses.COLOR_MAGENTA)
-        curses.init_pair(5, curses.COLOR_BLACK, curses.COLOR_WHITE)
-        curses.init_pair(6, curses.COLOR_BLACK, curses.COLOR_MAGENTA)
-        curses.init_pair(7, curses.COLOR_BLACK, curses.COLOR_RED)
-        curses.init_pair(8, curses.COLOR_BLACK, curses.COLOR_GREEN)
-        curses.init_pair(9, curses.COLOR_BLACK, curses.COLOR_BLUE)
-        curses.init_pair(10, curses.COLOR_BLACK, curses.COLOR_BLACK)
+    def main(self, screen):
+        # Everything is drawn on {screen}, at absolute positions. See Screen.py.
+        self.screen = screen
 
-        rows, cols = stdscr.getmaxyx()
+        rows, cols = screen.getmaxyx()
         self.logger.log.debug(f"Window size at x:{cols} y:{rows}")
         if rows < 11 or cols < 52:
             self.logger.log.error(
                 f"Window size too small to draw interface! Needs to be at least 52 by 11 characters."
             )
 
-        self.draw_radio_frame(stdscr)
-        self.draw_now_playing_win()
+        self.draw_radio_frame()
 
         self.set_station(self.station)
+        self.draw_now_playing_win()
         self.set_volume_slider(self.volume)
         self.t1 = time.perf_counter()
+        # One loop serves every mode. It sleeps in getkey() until a key comes or
+        # the next frame is due, so an open popup costs no more than the main view.
+        next_frame = time.perf_counter()
         while True:
-            self.read_key(stdscr)
-            self.set_playtime()
-            self.draw_now_playing_win()
-            self.draw_vu_meter()
-            self.draw_menu_bar(stdscr)
-            self.draw_station_win()
-            self.draw_volume_win()
-            stdscr.refresh()
-            time.sleep(0.1)
-
-    def draw_radio_frame(self, stdscr):
+            key = screen.getkey(timeout=max(0.0, next_frame - time.perf_counter()))
+            if key:
+                self.dispatch(key)
+            now = time.perf_counter()
+            if key or now >= next_frame:
+                self.draw_frame()
+            if now >= next_frame:
+                next_frame = max(next_frame + FRAME_INTERVAL, now)
+
+    def draw_frame(self):
+        frame_start = time.perf_counter()
+        with self.profiler.frame():
+            profile = self.profiler.call
+            if self.mode is None:
+                profile("set_playtime", self.set_playtime)
+                profile("draw_now_playing_win", self.draw_now_playing_win)
+                profile("draw_vu_meter", self.draw_vu_meter)
+                profile("draw_menu_bar", self.draw_menu_bar)
+                profile("draw_station_win", self.draw_station_win)
+                profile("draw_volume_win", self.draw_volume_win)
+            else:
+                # Under a popup the radio is hidden. Its sinks keep up with the feed,
+                # and the play time moves on inside the popup.
+                if self.mode == "select":
+                    profile("draw_station_selector", self.draw_station_selector)
+                profile("draw_popup_playtime", self.draw_popup_playtime)
+            # Part of the frame it reports on, so the frame has a single refresh.
+            if self.profiler.enabled and self.mode is None:
+                profile("draw_profiler_overlay", self.draw_profiler_overlay)
+            profile("screen.refresh", self.screen.refresh)
+        FRAME_SECONDS.observe(time.perf_counter() - frame_start)
+
+    def draw_radio_frame(self):
+        screen = self.screen
         # Draw a rectangle with single line
         # curses.textpad.rectangle(stdscr, 2, 2, 10, 50)
 
         # Draw a double line thick rectangle, 50columns wide
-        # stdscr.addstr(2, 2, "╔═ --------- -- ════════════════════════════════╗")
-        stdscr.addstr(2, 2, "┏━ ───────── ── ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓")
+        # screen.addstr(2, 2, "╔═ --------- -- ════════════════════════════════╗")
+        screen.addstr(2, 2, "┏━ ───────── ── ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓")
 
         for i in range(7):
-            # stdscr.addstr(i + 3, 2, f"║{str().center(47)}║")
-            stdscr.addstr(i + 3, 2, f"┃{str().center(47)}┃")
-        # stdscr.addstr(10, 2, "╚═══════════════════════════════════════════════╝")
-        stdscr.addstr(10, 2, "┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛")
+            # screen.addstr(i + 3, 2, f"║{str().center(47)}║")
+            screen.addstr(i + 3, 2, f"┃{str().center(47)}┃")
+        # screen.addstr(10, 2, "╚═══════════════════════════════════════════════╝")
+        screen.addstr(10, 2, "┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛")
 
         # Draw the rest of the interface
-        stdscr.addstr(2, 5, "NIGHTRIDE.", curses.color_pair(2))
-        stdscr.addstr(2, 15, "FM", curses.color_pair(2))
-        stdscr.addstr(4, 3, "...............................................")
+        screen.addstr(2, 5, "NIGHTRIDE.", screen.color(2))
+        screen.addstr(2, 15, "FM", screen.color(2))
+        screen.addstr(4, 3, "...............................................")
 
-    def read_key(self, stdscr):
-        key = ""
-        try:
-            key = stdscr.getkey()
-            if key == "KEY_RESIZE":
-                rows, cols = stdscr.getmaxyx()
-                self.logger.log.debug(f"User resized the window to x:{cols} y:{rows}")
-                self.draw_radio_frame(stdscr)
-            else:
-                self.logger.log.debug(f"User pressed key {key}")
-        except curses.error as e:
-            # No input from user. Let's pass.
-            pass
+    def dispatch(self, key):
+        # Every key goes to the handler of the mode on screen.
+        if key == "KEY_RESIZE":
+            rows, cols = self.screen.getmaxyx()
+            self.logger.log.debug(f"User resized the window to x:{cols} y:{rows}")
+            # Everything else is drawn again on every frame.
+            self.screen.clear()
+            self.draw_mode()
+            return
+        self.logger.log.debug(f"User pressed key {key}")
+        if self.mode == "about":
+            self.on_about_key(key)
+        elif self.mode == "select":
+            self.on_select_key(key)
+        else:
+            self.on_key(key)
+
+    def draw_mode(self):
+        # The parts of the current mode that are not drawn on every frame
+        if self.mode == "about":
+            self.draw_popup_about()
+        elif self.mode == "select":
+            self.draw_popup_select_station()
+        else:
+            self.draw_radio_frame()
+
+    def close_popup(self):
+        self.mode = None
+        self.selector = None
+        self.draw_radio_frame()
 
+    def on_key(self, key):
         # Change channels inputting numbers
-        if key in ["1", "2", "3", "4", "5", "6", "7", "8", "9"]:
+        if key in ["1", "2", "3", "4", "5", "6", "7", "8", "9"] and int(key) <= len(
+            self.stations
+        ):
             self.api.audioPlayer.stop()
             self.set_station(self.stations[int(key) - 1])
 
@@ -176,317 +279,206 @@ class RadioInterface:
         #         next_station = self.stations[index_of_next]
         #         self.set_station(next_station)
 
-        # Resize window
-        if key == "KEY_RESIZE":
-            self.station_win.refresh()
-            self.now_playing_win.refresh()
-
-            self.station_win = curses.newwin(1, 23, 3, 5)
-            n = self.stations.index(self.station)
-            self.station_win.addstr(f"station {n+1}: {self.station}")
-            self.station_win.refresh()
-            stdscr.refresh()
-
         # Disable VU meter
         if key == "v":
             self.VU_METER = not self.VU_METER
-            self.config.set("SETTINGS", "VU_METER", f"{self.VU_METER}")
-            self.save_config()
+            self.config.set("SETTINGS", "vu_meter", self.VU_METER)
 
         if key == "r":
             self.LCD1602_MODULE = not self.LCD1602_MODULE
-            self.config.set("ADDONS", "lcd1602", f"{self.VU_METER}")
-            self.save_config()
-            if not self.LCD1602_MODULE:
-                self.lcd.clear()
-                self.lcd.turnOff()
+            self.config.set("ADDONS", "lcd1602", self.LCD1602_MODULE)
+            if self.lcd is None:
+                if self.LCD1602_MODULE:
+                    self.init_lcd()
+            elif not self.LCD1602_MODULE:
+                with self.lcd_lock:
+                    self.lcd.clear()
+                    self.lcd.turnOff()
             else:
-                self.lcd.printOnTwoRows(
-                    argTopRow=self.now_playing["artist"],
-                    argBotRow=self.now_playing["song"],
-                    color="PURPLE",
-                    turnOffAfter=False,
-                    freezeFor=0,
-                )
+                self.set_now_playing()
+        # Toggle the frame profiler overlay
+        if key == "p":
+            self.profiler.enabled = not self.profiler.enabled
+            if self.profiler.enabled:
+                self.profiler.reset()
+            else:
+                self.screen.clear()
+                self.draw_radio_frame()
+
+        # Dump profiled frames for a flame graph
+        if key == "P":
+            self.profiler.dump("frames.folded")
+            self.logger.log.info("Wrote frame profile to frames.folded")
+
         # Quit
         if key == "KEY_F(12)":
-            if self.LCD1602_MODULE:
-                self.lcd.clear()
-                self.lcd.turnOff()
+            if self.LCD1602_MODULE and self.lcd:
+                with self.lcd_lock:
+                    self.lcd.clear()
+                    self.lcd.turnOff()
             exit()
 
         # Show "About" info
         if key == "KEY_F(1)":
-            self.draw_popup_about(stdscr)
+            self.mode = "about"
+            self.draw_popup_about()
         # Show "Stations" panel
         if key == "KEY_F(2)":
-            self.draw_popup_select_station(stdscr)
-
-    def draw_popup_about(self, stdscr):
-        self.panwin = curses.newwin(9, 49, 2, 2)
-        self.panwin.erase()
-        self.panwin.box()
-
-        max_rows, max_cols = stdscr.getmaxyx()
-        menu_win = curses.newwin(1, 11, 0, 0)
-        menu_win_2 = curses.newwin(1, max_cols - 11, 0, 10)
-        try:
-            menu_win.addstr("F1: ABOUT ", curses.color_pair(3))
-            menu_win_2.addstr(
-                "| F2: STATION | -/+: VOLUME | F12: QUIT".ljust(max_cols),
-                curses.color_pair(5),
-            )
-        except curses.error:
-            # Accursed curses raises an error if you write in the last column.
-            # We will discard that...
-            pass
-        menu_win.refresh()
-        menu_win_2.refresh()
-
-        self.panwin.addstr(0, 20, ">>ABOUT<<", curses.color_pair(5))
-        self.panwin.addstr(2, 3, "AUTHOR:", curses.color_pair(3))
-        self.panwin.addstr(2, 10, " Matias Räisänen 2022 ", curses.color_pair(6))
-
-        self.panwin.addstr(3, 2, "CONTACT:", curses.color_pair(3))
-        self.panwin.addstr(3, 10, " matias@matiasraisanen.com ", curses.color_pair(6))
-
-        self.panwin.addstr(4, 3, "SOURCE:", curses.color_pair(3))
-        self.panwin.addstr(
-            4, 10, " github.com/matiasraisanen/nightride ", curses.color_pair(6)
+            self.mode = "select"
+            # Only the three rows in view are ever drawn, however many stations there are.
+            self.selector = StationSelector(self.stations, self.station, rows=3)
+            self.draw_popup_select_station()
+            if self.LCD1602_MODULE and self.lcd:
+                with self.lcd_lock:
+                    self.lcd.printOnOneRow(arg=f"Select station: ", row=0)
+                    self.lcd.printOnOneRow(arg=f"{self.selector.selected}".center(16).upper(), row=1)
+
+    def draw_popup_about(self):
+        screen = self.screen
+        screen.erase(*POPUP)
+        screen.box(*POPUP)
+
+        max_rows, max_cols = screen.getmaxyx()
+        screen.addstr(0, 0, "F1: ABOUT ", screen.color(3))
+        screen.addstr(
+            0,
+            10,
+            "| F2: STATION | -/+: VOLUME | F12: QUIT".ljust(max_cols - 10),
+            screen.color(5),
         )
 
-        self.panwin.addstr(5, 2, "VERSION:", curses.color_pair(3))
-        self.panwin.addstr(5, 10, f" {self.version}", curses.color_pair(6))
+        self.popup_addstr(0, 20, ">>ABOUT<<", screen.color(5))
+        self.popup_addstr(2, 3, "AUTHOR:", screen.color(3))
+        self.popup_addstr(2, 10, " Matias Räisänen 2022 ", screen.color(6))
 
-        self.panwin.addstr(6, 2, "Player for Nightride.fm")
-        self.panwin.addstr(7, 2, "(https://nightride.fm)")
-        self.panwin.addstr(8, 3, "ENTER: [OK]", curses.color_pair(8))
-        self.panwin.addstr(8, 31, "F1: [CLOSE]", curses.color_pair(7))
+        self.popup_addstr(3, 2, "CONTACT:", screen.color(3))
+        self.popup_addstr(3, 10, " matias@matiasraisanen.com ", screen.color(6))
 
-        panel = curses.panel.new_panel(self.panwin)
-        panel.top()
-        # NOTE: Update panels will crash on WIN10. Should figure out a workaround later!
-        curses.panel.update_panels()
-        stdscr.refresh()
-        while True:
-            key = ""
-            try:
-                key = stdscr.getkey()
-                self.logger.log.debug(f"User pressed key {key}")
-            except curses.error as e:
-                # No input from user. Let's pass.
-                pass
-
-            if key == "KEY_F(1)" or key == "\n":
-                self.draw_radio_frame(stdscr)
-                break
-            if key == "KEY_F(12)":
-                exit()
-
-    def draw_popup_select_station(self, stdscr):
-        # Draw menu with "station" active
-        max_rows, max_cols = stdscr.getmaxyx()
-        menu_win = curses.newwin(1, 12, 0, 0)
-        menu_win_2 = curses.newwin(1, 14, 0, 11)
-        menu_win_3 = curses.newwin(1, max_cols - 25, 0, 24)
-        try:
-            menu_win.addstr("F1: ABOUT |", curses.color_pair(5))
-            menu_win_2.addstr(" F2: STATION ", curses.color_pair(3))
-            menu_win_3.addstr(
-                "| ↑/↓: MOVE | F12: QUIT".ljust(max_cols), curses.color_pair(5)
-            )
-        except curses.error:
-            # Accursed curses raises an error if you write in the last column.
-            # We will discard that...
-            pass
-        menu_win.refresh()
-        menu_win_2.refresh()
-        menu_win_3.refresh()
-
-        self.panwin = curses.newwin(9, 49, 2, 2)
-        self.panwin.erase()
-        self.panwin.box()
-
-        selected = self.stations.index(self.station)
-        index_of_prev = self.stations.index(self.station) - 1
-        if index_of_prev >= 0:
-            prev_station = self.stations[index_of_prev]
-        else:
-            prev_station = ""
+        self.popup_addstr(4, 3, "SOURCE:", screen.color(3))
+        self.popup_addstr(
+            4, 10, " github.com/matiasraisanen/nightride ", screen.color(6)
+        )
 
-        index_of_next = self.stations.index(self.station) + 1
-        if index_of_next < len(self.stations):
-            next_station = self.stations[index_of_next]
-        else:
-            next_station = ""
+        self.popup_addstr(5, 2, "VERSION:", screen.color(3))
+        self.popup_addstr(5, 10, f" {self.version}", screen.color(6))
 
-        top = prev_station
-        mid = self.stations[selected]
-        bot = next_station
+        self.popup_addstr(6, 2, "Player for Nightride.fm")
+        self.popup_addstr(7, 2, "(https://nightride.fm)")
+        self.popup_addstr(8, 3, "ENTER: [OK]", screen.color(8))
+        self.popup_addstr(8, 31, "F1: [CLOSE]", screen.color(7))
 
-        self.panwin.addstr(0, 15, f">>SELECT STATION<<", curses.color_pair(5))
-        # self.panwin.addstr(2, 6, f'↑', curses.color_pair(5))
-        self.panwin.addstr(3, 3, f"Station {selected+1}:")
-        # self.panwin.addstr(4, 6, f'↓', curses.color_pair(5))
+    def on_about_key(self, key):
+        if key == "KEY_F(1)" or key == "\n":
+            self.close_popup()
+        if key == "KEY_F(12)":
+            exit()
 
-        # Draw top row
-        if top == "":
-            # Draw black on top row, if the selected station is first in list
-            top_color = curses.color_pair(10)
-        else:
-            top_color = curses.color_pair(9)
-        self.panwin.addstr(2, 18, f"  {top.center(11)}  ", top_color)
+    def popup_addstr(self, row, column, text, attr=0):
+        # Draws at a position inside the popup.
+        self.screen.addstr(POPUP[0] + row, POPUP[1] + column, text, attr)
 
-        # Draw mid row
-        self.panwin.addstr(3, 19, f"→ {mid.center(11)} ←", curses.color_pair(3))
+    def draw_popup_select_station(self):
+        screen = self.screen
+        # Draw menu with "station" active
+        max_rows, max_cols = screen.getmaxyx()
+        screen.addstr(0, 0, "F1: ABOUT |", screen.color(5))
+        screen.addstr(0, 11, " F2: STATION ", screen.color(3))
+        screen.addstr(
+            0,
+            24,
+            "| ↑/↓: MOVE | TYPE: FILTER | F12: QUIT".ljust(max_cols - 24),
+            screen.color(5),
+        )
 
-        # Draw bot row
-        if bot == "":
-            # Draw black on bot row, if the selected station is last in list
-            bot_color = curses.color_pair(10)
-        else:
-            bot_color = curses.color_pair(9)
-        self.panwin.addstr(4, 18, f"  {bot.center(11)}  ", bot_color)
+        screen.erase(*POPUP)
+        screen.box(*POPUP)
+        self.popup_addstr(0, 15, f">>SELECT STATION<<", screen.color(5))
 
         # Draw "NOW PLAYING"-section
-        self.panwin.addstr(5, 1, "...............................................")
-        self.panwin.addstr(5, 3, "NOW.PLAYING")
-
-        artist = self.api.now_playing[self.stations[selected]]["artist"]
-        artist = self.shorten(artist, 37)
-        song = self.api.now_playing[self.stations[selected]]["song"]
-        song = self.shorten(song, 37)
-        self.panwin.addstr(6, 2, f"Artist: ")
-        self.panwin.addstr(6, 10, f"{artist}", curses.color_pair(3))
-        self.panwin.addstr(7, 4, f"Song: ")
-        self.panwin.addstr(7, 10, f"{song}", curses.color_pair(4))
-
-        self.panwin.addstr(8, 3, "ENTER: [OK]", curses.color_pair(8))
-        self.panwin.addstr(8, 31, "F2: [CLOSE]", curses.color_pair(7))
-
-        panel = curses.panel.new_panel(self.panwin)
-        panel.top()
-        # NOTE: Update panels will crash on WIN10. Should figure out a workaround later!
-        curses.panel.update_panels()
-        stdscr.refresh()
-        if self.LCD1602_MODULE:
-            self.lcd.printOnOneRow(arg=f"Select station: ", row=0)
-            self.lcd.printOnOneRow(arg=f"{mid}".center(16).upper(), row=1)
+        self.popup_addstr(5, 1, "...............................................")
+        self.popup_addstr(5, 3, "NOW.PLAYING")
+        self.popup_addstr(8, 3, "ENTER: [OK]", screen.color(8))
+        self.popup_addstr(8, 31, "F2: [CLOSE]", screen.color(7))
 
+    def on_select_key(self, key):
         # User changing stations
-        while True:
-            key = ""
-            if self.LCD1602_MODULE:
-                self.lcd.printOnOneRow(arg="Select station:", row=0)
-            try:
-                key = stdscr.getkey()
-
-                if key == "KEY_UP":
-                    # Check if top of list.
-                    index_of_prev = selected - 1
-                    if index_of_prev >= 0:
-                        if index_of_prev == 0:
-                            top = ""
-                        else:
-                            top = self.stations[selected - 2]
-                        mid = self.stations[selected - 1]
-                        bot = self.stations[selected]
-                        selected -= 1
-                        if selected > 0:
-                            top = self.stations[selected - 1]
-                    else:
-                        top = ""
-
-                if key == "KEY_DOWN":
-                    max_num = len(self.stations) - 1
-                    index_of_next = selected + 1
-                    if index_of_next <= max_num:
-                        mid = self.stations[selected + 1]
-                        top = self.stations[selected]
-                        if index_of_next == max_num:
-                            bot = ""
-
-                        selected += 1
-                        if selected < max_num:
-                            bot = self.stations[selected + 1]
-                    else:
-                        bot = ""
-                if key == "KEY_F(2)":
-                    self.draw_radio_frame(stdscr)
-                    self.set_now_playing(redraw=True)
-                    break
-                if key == "KEY_F(12)":
-                    exit()
-
-                mid = self.stations[selected]
-
-                # Start drawing the channel selector
-
-                # Draw top row
-                if top == "":
-                    # Draw black on top row, if the selected station is first in list
-                    top_color = curses.color_pair(10)
-                else:
-                    top_color = curses.color_pair(9)
-                self.panwin.addstr(2, 18, f"  {top.center(11)}  ", top_color)
-
-                # Draw mid row
-                self.panwin.addstr(3, 3, f"Station {selected+1}:")
-                self.panwin.addstr(3, 19, f"→ {mid.center(11)} ←", curses.color_pair(3))
-
-                # Draw bot row
-                if bot == "":
-                    # Draw black on bot row, if the selected station is last in list
-                    bot_color = curses.color_pair(10)
+        selector = self.selector
+        previous = selector.selected
+        if key == "KEY_UP":
+            selector.move(-1)
+        elif key == "KEY_DOWN":
+            selector.move(1)
+        elif key == "KEY_PPAGE":
+            selector.move(-selector.rows)
+        elif key == "KEY_NPAGE":
+            selector.move(selector.rows)
+        elif key == "KEY_HOME":
+            selector.move(-len(self.stations))
+        elif key == "KEY_END":
+            selector.move(len(self.stations))
+        elif key in ("KEY_BACKSPACE", "\b", "\x7f"):
+            selector.backspace()
+        elif key == "KEY_F(2)":
+            self.close_popup()
+            self.set_now_playing()
+            return
+        elif key == "KEY_F(12)":
+            exit()
+        elif key == curses.KEY_ENTER or key == "\n":
+            # User pressing "ENTER" will activate the selection
+            if selector.selected:
+                self.logger.log.debug(f"User selected station {selector.selected} via F2")
+                self.close_popup()
+                self.set_station(selector.selected)
+            return
+        elif len(key) == 1 and key.isprintable():
+            selector.type(key)
+
+        # The LCD row only changes with the selection.
+        if self.LCD1602_MODULE and self.lcd and selector.selected != previous:
+            with self.lcd_lock:
+                self.lcd.printOnOneRow(arg=f"{selector.selected or ''}".center(16).upper(), row=1)
+
+    def draw_station_selector(self):
+        # Drawn on every frame, so new stations and titles show up while the popup is open.
+        selector = self.selector
+        selector.refresh()
+        color = self.screen.color
+        # Filter row
+        shown = f"{selector.position + 1 if selector.matches else 0}/{len(selector.matches)}"
+        self.popup_addstr(1, 3, f"Filter: {selector.query[:24]}".ljust(34))
+        self.popup_addstr(1, 46 - len(shown), shown)
+
+        # Station rows
+        visible = selector.visible()
+        for row in range(selector.rows):
+            if row < len(visible):
+                number, station, selected = visible[row]
+                text = f"{number:>3}: {station}"[:41]
+                if selected:
+                    self.popup_addstr(row + 2, 3, f"→ {text}".ljust(43), color(3))
                 else:
-                    bot_color = curses.color_pair(9)
-                self.panwin.addstr(4, 18, f"  {bot.center(11)}  ", bot_color)
-
-                # Set data for the "NOW PLAYING"-section
-                artist = self.api.now_playing[self.stations[selected]]["artist"]
-                artist = self.shorten(artist, 37)
-                song = self.api.now_playing[self.stations[selected]]["song"]
-                song = self.shorten(song, 37)
-
-                # Draw the "NOW PLAYING"-section
-                self.panwin.addstr(6, 2, f"Artist: {artist.ljust(38)}")
-                self.panwin.addstr(6, 10, f"{artist}", curses.color_pair(3))
-                self.panwin.addstr(7, 4, f"Song: {song.ljust(38)}")
-                self.panwin.addstr(7, 10, f"{song}", curses.color_pair(4))
-
-                panel = curses.panel.new_panel(self.panwin)
-                panel.top()
-                # NOTE: Update panels will crash on WIN10. Should figure out a workaround later!
-                curses.panel.update_panels()
-                stdscr.refresh()
-
-                # User pressing "ENTER" will activate the selection
-                if key == curses.KEY_ENTER or key == 10 or key == 13 or key == "\n":
-                    self.logger.log.debug(
-                        f"User selected station {self.stations[selected]} via F2"
-                    )
-                    self.set_station(self.stations[selected])
-                    break
+                    self.popup_addstr(row + 2, 3, f"  {text}".ljust(43), color(9))
+            else:
+                self.popup_addstr(row + 2, 3, " " * 43, color(10))
 
-                if self.LCD1602_MODULE:
-                    self.lcd.printOnOneRow(arg=f"{mid}".center(16).upper(), row=1)
-            except curses.error as e:
-                # No input from user. Let's pass.
-                pass
+        # Set data for the "NOW PLAYING"-section
+        selected_now_playing = self.get_station_now_playing(selector.selected)
+        artist = self.shorten(selected_now_playing.artist, 37)
+        song = self.shorten(selected_now_playing.song, 37)
 
-    def save_config(self):
-        with open("settings.ini", "w") as configfile:
-            self.config.write(configfile)
+        # Draw the "NOW PLAYING"-section
+        self.popup_addstr(6, 2, f"Artist: {artist.ljust(38)}")
+        self.popup_addstr(6, 10, f"{artist}", color(3))
+        self.popup_addstr(7, 4, f"Song: {song.ljust(38)}")
+        self.popup_addstr(7, 10, f"{song}", color(4))
 
     def set_volume_slider(self, volume):
         self.logger.log.debug(f"Set volume slider to {volume}")
         try:
             slider = list("VOL: ◄──────────►")
             slider[int(volume) + 6] = str(volume)
-
-            self.vol_win = curses.newwin(1, 18, 3, 31)
-            self.vol_win.addstr("".join(slider))
-            self.vol_win.refresh()
+            self.screen.addstr(3, 31, "".join(slider))
         except:
             self.logger.log.error(f"Failed to set volume slider to {volume}")
 
@@ -500,76 +492,99 @@ class RadioInterface:
         return word
 
     def draw_now_playing_win(self):
-        self.set_now_playing()
-        artist = self.now_playing["artist_short"]
-        song = self.now_playing["song_short"]
+        # Replaced as a whole by the screen sink, so both rows are of the same record.
+        now_playing = self.now_playing
+        artist = now_playing["artist_short"]
+        song = now_playing["song_short"]
 
-        self.now_playing_win = curses.newwin(2, 40, 6, 5)
-        self.now_playing_win.addstr(0, 0, f"Artist: ")
-        self.now_playing_win.addstr(1, 2, f"Song: ")
+        screen = self.screen
+        screen.erase(6, 5, 2, 40)
+        screen.addstr(6, 5, f"Artist: ")
+        screen.addstr(7, 7, f"Song: ")
 
         # Erroneous artist/song titles will be replaced with ???ERR
         fail_title = "???ERR"
         try:
-            self.now_playing_win.addstr(0, 8, f" {artist} ", curses.color_pair(3))
+            screen.addstr(6, 13, f" {artist} ", screen.color(3))
         except:
-            self.now_playing_win.addstr(0, 8, f" {fail_title} ", curses.color_pair(3))
+            screen.addstr(6, 13, f" {fail_title} ", screen.color(3))
 
         try:
-            self.now_playing_win.addstr(1, 8, f" {song} ", curses.color_pair(4))
+            screen.addstr(7, 13, f" {song} ", screen.color(4))
         except:
-            self.now_playing_win.addstr(1, 8, f" {fail_title} ", curses.color_pair(4))
-
-        self.now_playing_win.refresh()
+            screen.addstr(7, 13, f" {fail_title} ", screen.color(4))
 
     def draw_station_win(self):
         n = self.stations.index(self.station)
-        self.station_win = curses.newwin(1, 23, 3, 5)
-        self.station_win.addstr(f"station {n+1}: {self.station}")
-        self.station_win.refresh()
+        self.screen.addstr(3, 5, f"station {n+1}: {self.station}"[:22].ljust(22))
 
     def draw_volume_win(self):
         try:
             slider = list("VOL: ◄──────────►")
             slider[int(self.volume) + 6] = str(self.volume)
-
-            self.vol_win = curses.newwin(1, 18, 3, 31)
-            self.vol_win.addstr("".join(slider))
-            self.vol_win.refresh()
+            self.screen.addstr(3, 31, "".join(slider))
         except:
             self.logger.log.error(f"Failed to draw volume window")
 
-    def set_now_playing(self, redraw=False):
-        try:
-            # Force LCD redraw with redraw = True
-            if (
-                self.now_playing == self.api.now_playing[self.station]
-                and redraw == False
-            ):
-                # Already playing the song, do nothing.
-                pass
-            else:
-                self.now_playing = self.api.now_playing[self.station]
-                artist = self.now_playing["artist"]
-                song = self.now_playing["song"]
-                self.now_playing["artist_short"] = self.shorten(artist)
-                self.now_playing["song_short"] = self.shorten(song)
-                if self.LCD1602_MODULE:
-                    self.lcd.printOnTwoRows(
-                        argTopRow=artist,
-                        argBotRow=song,
-                        color="PURPLE",
-                        turnOffAfter=False,
-                        freezeFor=0,
-                    )
-        except KeyError as e:
+    def set_now_playing(self):
+        # Shows the station's record right away, on a station change or when the LCD
+        # is back. Later updates come through the sinks.
+        current = self.api.play_clock.now_playing.get(self.station)
+        if current is None:
             self.logger.log.warning(f"No data for station {self.station} yet")
-        except Exception as e:
-            self.logger.log.error(f"Failed to set now playing: {e}")
+            return
+        self.show_now_playing(self.station, current)
+        self.lcd_sink.put(self.station, current)
+
+    def show_now_playing(self, station, current):
+        # Screen sink. The frame draws what is set here.
+        if station != self.station or current is self.current:
+            return
+        # Every event brings a new record, so identity tells if anything changed.
+        self.current = current
+        self.now_playing = {
+            "artist": current.artist,
+            "artist_short": self.shorten(current.artist),
+            "song": current.song,
+            "song_short": self.shorten(current.song),
+        }
+
+    def show_on_lcd(self, station, current):
+        # LCD sink. The station selector has the LCD while it is open.
+        if station != self.station or not (self.LCD1602_MODULE and self.lcd):
+            return
+        with self.lcd_lock:
+            if self.mode == "select":
+                return
+            self.lcd.printOnTwoRows(
+                argTopRow=current.artist,
+                argBotRow=current.song,
+                color="PURPLE",
+                turnOffAfter=False,
+                freezeFor=0,
+            )
+
+    def get_station_now_playing(self, station):
+        # Stations that have not sent an event yet, and are not in the snapshot either, show up empty.
+        return self.api.play_clock.now_playing.get(station, NOTHING_PLAYING)
 
     def set_playtime(self):
+        time_to_print = self.playtime()
+        try:
+            self.screen.addstr(8, 5, time_to_print.ljust(20))
+        except:
+            self.logger.log.error(f"Failed to draw time played.")
+        self.orig_time = time_to_print
+
+    def draw_popup_playtime(self):
+        # Between the buttons of the popup, without the notes that don't fit there
+        self.popup_addstr(8, 15, self.playtime(notes=False).center(15))
+
+    def playtime(self, notes=True):
+        stale = False
         try:
-            current_song_start = self.api.now_playing[self.station]["started_at"]
+            current_song_start = self.api.play_clock.now_playing[self.station].started_at
+            stale = self.api.play_clock.now_playing[self.station].stale
         except KeyError:
             self.logger.log.warning("Could not get current_song_start")
             current_song_start = 0
@@ -579,23 +594,27 @@ class RadioInterface:
         seconds = timedelta % 60
 
         time_to_print = f"Played: {str(minutes).zfill(2)}:{str(seconds).zfill(2)}"
-
-        try:
-            time_played_win = curses.newwin(1, 20, 8, 5)
-            time_played_win.addstr(time_to_print)
-            time_played_win.refresh()
-        except:
-            self.logger.log.error(f"Failed to draw time played.")
-        self.orig_time = time_to_print
+        if not notes:
+            return time_to_print
+        if stale:
+            # Data from the snapshot of an earlier run, not yet confirmed by the feed.
+            time_to_print += " (old)"
+        elif self.api.audioPlayer.failing:
+            # The stream dropped and a standby is connecting.
+            time_to_print += " (lost)"
+        return time_to_print
 
     def set_station(self, station):
         self.logger.log.debug(f"Set station => {station}")
         try:
+            self.api.unsubscribe(self.station)
             self.station = station
+            self.api.subscribe(station)
             self.api.audioPlayer.play(station)
         except Exception as e:
             self.logger.log.error(f"Failed to set station to {station}")
             self.logger.log.error(e)
+        self.set_now_playing()
 
     def draw_vu_meter(self):
         # Obviously, this VU meter is purely cosmetic :-)
@@ -610,30 +629,47 @@ class RadioInterface:
             meter = ""
 
         try:
-            vu_win = curses.newwin(1, 15, 8, 35)
-            vu_win.addstr(0, 0, meter)
-            vu_win.refresh()
+            self.screen.addstr(8, 35, meter.ljust(14))
         except:
             self.logger.log.error(f"Failed to draw VU meter")
 
-    def draw_menu_bar(self, stdscr):
-        max_rows, max_cols = stdscr.getmaxyx()
-        self.menu_win = curses.newwin(1, max_cols, 0, 0)
-        try:
-            self.menu_win.addstr(
-                "F1: ABOUT | F2: STATION | -/+: VOLUME | F12: QUIT".ljust(max_cols),
-                curses.color_pair(5),
+    def draw_profiler_overlay(self):
+        # Below the radio if the terminal has room for it, on top of it otherwise.
+        screen = self.screen
+        max_rows, max_cols = screen.getmaxyx()
+        top = 11 if max_rows >= 19 else 2
+        screen.erase(top, 2, 8, 49)
+        screen.box(top, 2, 8, 49)
+        screen.addstr(top, 4, " PROFILER (ms)  p:close P:dump ", screen.color(5))
+        screen.addstr(top + 1, 4, f"{'step':<24}{'p50':>7}{'p99':>7}{'max':>7}")
+        for row, (name, p50, p99, worst) in enumerate(self.profiler.worst(5)):
+            screen.addstr(
+                top + row + 2,
+                4,
+                f"{name[:24]:<24}{p50 * 1000:7.2f}{p99 * 1000:7.2f}{worst * 1000:7.2f}",
+                screen.color(2),
             )
-        except curses.error:
-            # Accursed curses raises an error if you write in the last column.
-            # We will discard that...
-            pass
-        self.menu_win.refresh()
 
+    def draw_menu_bar(self):
+        max_rows, max_cols = self.screen.getmaxyx()
+        self.screen.addstr(
+            0,
+            0,
+            "F1: ABOUT | F2: STATION | -/+: VOLUME | F12: QUIT".ljust(max_cols),
+            self.screen.color(5),
+        )
 
-if __name__ == "__main__":
-    radio = RadioInterface(loglevel=logging.INFO)
 
-    if radio.LCD1602_MODULE:
-        radio.lcd.clear()
-        radio.lcd.turnOff()
+if __name__ == "__main__":
+    if get_config().processes == "multi":
+        # Ingest, audio, LCD and this interface in processes of their own
+        from Supervisor import Supervisor
+
+        Supervisor(loglevel=logging.INFO).run()
+    else:
+        radio = RadioInterface(loglevel=logging.INFO)
+
+        if radio.LCD1602_MODULE and radio.lcd:
+            with radio.lcd_lock:
+                radio.lcd.clear()
+                radio.lcd.turnOff()
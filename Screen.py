@@ -0,0 +1,309 @@
+import codecs
+import os
+import select
+import termios
+import time
+import tty
+
+from Metrics import registry
+
+RENDER_BYTES = registry.counter(
+    "nightride_render_bytes_total", "Bytes written to the terminal by the ANSI renderer"
+)
+
+# Screen is what RadioInterface draws on: text at absolute positions, in
+# numbered color pairs, made visible by refresh().
+#
+# CursesScreen draws with curses, on the one standard screen.
+# AnsiScreen keeps its own grid of cells, and on refresh() writes only the
+# cells that changed since the last one: a cursor move where needed, a color
+# change where needed, and the characters. At most {byte_budget} bytes go out
+# per refresh. Cells left over go out with the next one, so a slow SSH link
+# sees a slightly late frame instead of a backlog.
+#
+# Usage:
+# with AnsiScreen(color_pairs={1: (curses.COLOR_MAGENTA, curses.COLOR_BLACK)}) as screen:
+#     screen.addstr(2, 5, "NIGHTRIDE.", screen.color(1))
+#     screen.refresh()
+#     key = screen.getkey(timeout=0.1)  # "" when no key came within the timeout
+
+
+class Screen:
+    def box(self, y, x, height, width, attr=0):
+        self.addstr(y, x, "┌" + "─" * (width - 2) + "┐", attr)
+        for row in range(y + 1, y + height - 1):
+            self.addstr(row, x, "│", attr)
+            self.addstr(row, x + width - 1, "│", attr)
+        self.addstr(y + height - 1, x, "└" + "─" * (width - 2) + "┘", attr)
+
+    def erase(self, y, x, height, width):
+        for row in range(y, y + height):
+            self.addstr(row, x, " " * width)
+
+
+class CursesScreen(Screen):
+    def __init__(self, stdscr, color_pairs):
+        import curses
+
+        self.curses = curses
+        self.stdscr = stdscr
+        curses.curs_set(0)
+        curses.start_color()
+        stdscr.nodelay(True)
+        self.timeout = 0
+        for pair, (foreground, background) in color_pairs.items():
+            curses.init_pair(pair, foreground, background)
+
+    def color(self, pair):
+        return self.curses.color_pair(pair)
+
+    def addstr(self, y, x, text, attr=0):
+        try:
+            self.stdscr.addstr(y, x, text, attr)
+        except self.curses.error:
+            # Accursed curses raises an error if you write in the last column.
+            # We will discard that...
+            pass
+
+    def getkey(self, timeout: float = 0):
+        # Waits up to {timeout} seconds for a key, asleep in curses.
+        milliseconds = int(timeout * 1000)
+        if milliseconds != self.timeout:
+            self.stdscr.timeout(milliseconds)
+            self.timeout = milliseconds
+        try:
+            return self.stdscr.getkey()
+        except self.curses.error:
+            # No input from user
+            return ""
+
+    def getmaxyx(self):
+        return self.stdscr.getmaxyx()
+
+    def clear(self):
+        self.stdscr.clear()
+
+    def refresh(self):
+        self.stdscr.refresh()
+
+
+# Escape sequences of the keys the interface uses, by their curses names
+KEYS = {
+    "\x1bOP": "KEY_F(1)",
+    "\x1b[11~": "KEY_F(1)",
+    "\x1bOQ": "KEY_F(2)",
+    "\x1b[12~": "KEY_F(2)",
+    "\x1b[24~": "KEY_F(12)",
+    "\x1b[A": "KEY_UP",
+    "\x1b[B": "KEY_DOWN",
+    "\x1b[C": "KEY_RIGHT",
+    "\x1b[D": "KEY_LEFT",
+    "\x1b[5~": "KEY_PPAGE",
+    "\x1b[6~": "KEY_NPAGE",
+    "\x1b[H": "KEY_HOME",
+    "\x1bOH": "KEY_HOME",
+    "\x1b[1~": "KEY_HOME",
+    "\x1b[F": "KEY_END",
+    "\x1bOF": "KEY_END",
+    "\x1b[4~": "KEY_END",
+    "\x7f": "KEY_BACKSPACE",
+    "\r": "\n",
+}
+# A key's escape sequence can arrive split over reads. A part waits this long for the rest.
+ESCAPE_DELAY = 0.05
+BLANK = (" ", 0)
+
+
+def escape_length(text):
+    # Length of the CSI or SS3 sequence {text} starts with, None while incomplete,
+    # 0 if the escape starts neither.
+    if len(text) < 2:
+        return None
+    if text[1] == "O":
+        return 3 if len(text) >= 3 else None
+    if text[1] != "[":
+        return 0
+    # Parameter and intermediate bytes, up to a final byte in @ to ~
+    for i in range(2, len(text)):
+        if "@" <= text[i] <= "~":
+            return i + 1
+        if not " " <= text[i] <= "?":
+            # Not a valid sequence. Only the escape and bracket are dropped.
+            return i
+    return None
+
+
+class AnsiScreen(Screen):
+    def __init__(self, color_pairs, byte_budget: int = 2048, fd_in: int = 0, fd_out: int = 1):
+        self.fd_in = fd_in
+        self.fd_out = fd_out
+        self.byte_budget = byte_budget
+        # Pair number to SGR sequence. Pair 0 is the terminal default.
+        self.sgr = {0: "\x1b[0m"}
+        for pair, (foreground, background) in color_pairs.items():
+            self.sgr[pair] = f"\x1b[0;{30 + foreground};{40 + background}m"
+
+        self.rows, self.cols = self.terminal_size()
+        self.cells = [[BLANK] * self.cols for _ in range(self.rows)]
+        # What the terminal shows. None is unknown, and gets drawn.
+        self.shown = [[None] * self.cols for _ in range(self.rows)]
+        self.dirty = set(range(self.rows))
+        self.cursor = None
+        self.attr = None
+
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.input = ""
+        self.input_at = 0.0
+        self.keys = []
+        self.bytes_written = 0
+
+    def __enter__(self):
+        self.saved_mode = termios.tcgetattr(self.fd_in)
+        tty.setcbreak(self.fd_in)
+        # Alternate screen, hidden cursor, cleared
+        self.write("\x1b[?1049h\x1b[?25l\x1b[0m\x1b[2J")
+        return self
+
+    def __exit__(self, *exc):
+        self.write("\x1b[0m\x1b[?25h\x1b[?1049l")
+        termios.tcsetattr(self.fd_in, termios.TCSADRAIN, self.saved_mode)
+
+    def terminal_size(self):
+        try:
+            size = os.get_terminal_size(self.fd_out)
+            return size.lines, size.columns
+        except OSError:
+            return 24, 80
+
+    def color(self, pair):
+        return pair
+
+    def addstr(self, y, x, text, attr=0):
+        if not 0 <= y < self.rows:
+            return
+        row = self.cells[y]
+        for offset, character in enumerate(text):
+            column = x + offset
+            if column >= self.cols:
+                break
+            if column >= 0:
+                row[column] = (character, attr)
+        self.dirty.add(y)
+
+    def getmaxyx(self):
+        return self.rows, self.cols
+
+    def clear(self):
+        self.cells = [[BLANK] * self.cols for _ in range(self.rows)]
+        self.dirty = set(range(self.rows))
+
+    def resize(self):
+        rows, cols = self.terminal_size()
+        if (rows, cols) == (self.rows, self.cols):
+            return False
+        self.rows, self.cols = rows, cols
+        self.clear()
+        self.shown = [[None] * cols for _ in range(rows)]
+        self.write("\x1b[0m\x1b[2J")
+        self.cursor = None
+        self.attr = None
+        return True
+
+    def refresh(self):
+        if self.resize():
+            self.keys.append("KEY_RESIZE")
+
+        out = []
+        size = 0
+        for y in sorted(self.dirty):
+            row = self.cells[y]
+            shown = self.shown[y]
+            x = 0
+            while x < self.cols:
+                cell = row[x]
+                if cell == shown[x]:
+                    x += 1
+                    continue
+                if size >= self.byte_budget:
+                    break
+
+                if self.cursor != (y, x):
+                    gap = self.cursor[1] if self.cursor and self.cursor[0] == y else None
+                    # Rewriting a few unchanged cells is cheaper than moving the cursor over them.
+                    if gap is not None and gap < x and x - gap <= 4 and all(
+                        cell[1] == self.attr for cell in row[gap:x]
+                    ):
+                        text = "".join(cell[0] for cell in row[gap:x])
+                    else:
+                        text = f"\x1b[{y + 1};{x + 1}H"
+                    out.append(text)
+                    size += len(text.encode("utf-8"))
+                if cell[1] != self.attr:
+                    self.attr = cell[1]
+                    text = self.sgr.get(cell[1], "\x1b[0m")
+                    out.append(text)
+                    size += len(text)
+                out.append(cell[0])
+                size += len(cell[0].encode("utf-8"))
+                shown[x] = cell
+                x += 1
+                self.cursor = (y, x)
+            if size >= self.byte_budget:
+                break
+
+        # Rows with cells left over by the budget stay dirty.
+        self.dirty = {y for y in self.dirty if self.cells[y] != self.shown[y]}
+        if out:
+            self.write("".join(out))
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        while data:
+            written = os.write(self.fd_out, data)
+            data = data[written:]
+            self.bytes_written += written
+            RENDER_BYTES.inc(written)
+
+    def getkey(self, timeout: float = 0):
+        # Like curses with a timeout: a key if one comes within {timeout} seconds, "" otherwise.
+        if not self.keys:
+            # A partial escape sequence waits no longer than ESCAPE_DELAY for its rest.
+            wait = min(timeout, ESCAPE_DELAY) if self.input else timeout
+            while select.select([self.fd_in], [], [], wait)[0]:
+                data = os.read(self.fd_in, 1024)
+                if not data:
+                    break
+                self.input += self.decoder.decode(data)
+                self.input_at = time.monotonic()
+                # Whatever else has arrived, without waiting any longer
+                wait = 0
+            self.parse_input(flush=time.monotonic() - self.input_at >= ESCAPE_DELAY)
+        return self.keys.pop(0) if self.keys else ""
+
+    def parse_input(self, flush=False):
+        # With {flush}, nothing more is coming for a partial sequence left in the input.
+        while self.input:
+            if self.input[0] == "\x1b":
+                length = escape_length(self.input)
+                if length is None:
+                    # Incomplete. The rest may come with the next read.
+                    if not flush:
+                        return
+                    # A lone escape is the Esc key. A partial sequence is dropped.
+                    if len(self.input) == 1:
+                        self.keys.append("\x1b")
+                    self.input = ""
+                    return
+                if length:
+                    # Unknown sequences are dropped whole, so their tail is not taken as typed.
+                    key = KEYS.get(self.input[:length])
+                    if key:
+                        self.keys.append(key)
+                    self.input = self.input[length:]
+                    continue
+                # Escape and a character, e.g. Alt and a key. The character is kept as typed.
+                self.input = self.input[1:]
+                continue
+            character = self.input[0]
+            self.input = self.input[1:]
+            self.keys.append(KEYS.get(character, character))
@@ -0,0 +1,209 @@
+import math
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+# SharedState is what the processes of the multi-process mode share: the now
+# playing table, and the audio status. See Supervisor.py.
+#
+# It is one block of shared memory. Every station has a fixed size slot,
+# written by the ingest process only. The audio status has its own record,
+# written by the audio process only. Each record starts with a sequence
+# number, odd while a write is in progress, so a reader retries instead of
+# using a half-written record. A change counter in the header tells readers
+# whether any slot changed, so an idle poll reads 8 bytes.
+#
+# A writer killed mid-write leaves its record's sequence odd. Readers then
+# give up waiting after {READ_TIMEOUT} and take the record as it is, and the
+# restarted writer recovers its records before it writes again.
+#
+# Usage:
+# state = SharedState()                  # creates the block, in the supervisor
+# state = SharedState(name=state.name)   # attaches to it, in a worker
+# state.write_station("darksynth", "Artist", "Song", time.time(), False)
+# state.read_changed(seen)
+
+SEQUENCE = struct.Struct("<Q")
+# sequence, delay (NaN while unknown), failing, volume, station length, station
+STATUS = struct.Struct("<Qd?BB32s")
+# sequence, started_at_wall, stale, then the lengths of station, artist and song
+SLOT = struct.Struct("<Qd?BHH")
+
+STATUS_OFFSET = 8
+SLOTS_OFFSET = 64
+SLOT_SIZE = 512
+MAX_STATIONS = 64
+MAX_STATION = 32
+MAX_TEXT = (SLOT_SIZE - SLOT.size - MAX_STATION) // 2
+# Seconds a reader waits for a write to finish. Writes take microseconds.
+READ_TIMEOUT = 0.005
+
+
+def encode(text, limit):
+    # UTF-8, cut to {limit} bytes without splitting a character
+    return text.encode("utf-8")[:limit].decode("utf-8", "ignore").encode("utf-8")
+
+
+class SharedState:
+    def __init__(self, name: str = None):
+        if name is None:
+            self.memory = shared_memory.SharedMemory(
+                create=True, size=SLOTS_OFFSET + SLOT_SIZE * MAX_STATIONS
+            )
+            self.memory.buf[:] = bytes(self.memory.size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.buf = self.memory.buf
+        # Writers in a process may be several threads. Only one writes at a time.
+        self.lock = threading.Lock()
+        if name is None:
+            self.write_status(None, False, 0, None)
+
+        # Station to slot index. A restarted ingest process finds its stations where it left them.
+        self.slots = {}
+        for index in range(MAX_STATIONS):
+            record = self.read_slot(index)
+            if record is None:
+                break
+            self.slots[record[1]] = index
+
+    @property
+    def changes(self) -> int:
+        return SEQUENCE.unpack_from(self.buf, 0)[0]
+
+    def begin_write(self, offset):
+        # Odd while writing, even if a dead writer left it odd.
+        sequence = SEQUENCE.unpack_from(self.buf, offset)[0]
+        sequence += 1 if sequence % 2 == 0 else 2
+        SEQUENCE.pack_into(self.buf, offset, sequence)
+        return sequence
+
+    def end_write(self, offset, sequence):
+        SEQUENCE.pack_into(self.buf, offset, sequence + 1)
+
+    def read_consistent(self, offset, read):
+        # Retries {read} until it ran between two writes. After READ_TIMEOUT the
+        # writer is taken to be dead, and the record is read as it is.
+        give_up_at = None
+        while True:
+            before = SEQUENCE.unpack_from(self.buf, offset)[0]
+            if give_up_at is None:
+                give_up_at = time.monotonic() + READ_TIMEOUT
+            elif time.monotonic() > give_up_at:
+                return before, read()
+            if before % 2:
+                continue
+            value = read()
+            if SEQUENCE.unpack_from(self.buf, offset)[0] == before:
+                return before, value
+
+    def recover(self, status=False, slots=False):
+        # For a restarted writer, before it writes: records a dead writer left
+        # half written are made readable again. Their content is what it is,
+        # until the next write.
+        offsets = [STATUS_OFFSET] if status else []
+        if slots:
+            offsets += [SLOTS_OFFSET + index * SLOT_SIZE for index in range(MAX_STATIONS)]
+        with self.lock:
+            for offset in offsets:
+                sequence = SEQUENCE.unpack_from(self.buf, offset)[0]
+                if sequence % 2:
+                    SEQUENCE.pack_into(self.buf, offset, sequence + 1)
+
+    def write_station(self, station, artist, song, started_at_wall, stale=False):
+        # Returns False if the table is full.
+        with self.lock:
+            index = self.slots.get(station)
+            if index is None:
+                if len(self.slots) == MAX_STATIONS:
+                    return False
+                index = self.slots[station] = len(self.slots)
+            offset = SLOTS_OFFSET + index * SLOT_SIZE
+            name = encode(station, MAX_STATION)
+            artist = encode(artist, MAX_TEXT)
+            song = encode(song, MAX_TEXT)
+
+            sequence = self.begin_write(offset)
+            SLOT.pack_into(
+                self.buf, offset, sequence, started_at_wall, stale, len(name), len(artist), len(song)
+            )
+            start = offset + SLOT.size
+            text = name + artist + song
+            self.buf[start : start + len(text)] = text
+            self.end_write(offset, sequence)
+            SEQUENCE.pack_into(self.buf, 0, self.changes + 1)
+            return True
+
+    def read_slot(self, index):
+        # (sequence, station, artist, song, started_at_wall, stale), or None for an unused slot
+        offset = SLOTS_OFFSET + index * SLOT_SIZE
+
+        def read():
+            _, started_at_wall, stale, name_length, artist_length, song_length = SLOT.unpack_from(
+                self.buf, offset
+            )
+            if not name_length:
+                return None
+            start = offset + SLOT.size
+            text = bytes(self.buf[start : start + name_length + artist_length + song_length])
+            # "replace", as a record left half written by a dead writer is read as it is
+            return (
+                text[:name_length].decode("utf-8", "replace"),
+                text[name_length : name_length + artist_length].decode("utf-8", "replace"),
+                text[name_length + artist_length :].decode("utf-8", "replace"),
+                started_at_wall,
+                stale,
+            )
+
+        sequence, record = self.read_consistent(offset, read)
+        return None if record is None else (sequence,) + record
+
+    def read_changed(self, seen):
+        # Stations written since {seen}, a dict of slot index to sequence the caller keeps.
+        # [(station, artist, song, started_at_wall, stale)]
+        changed = []
+        for index in range(MAX_STATIONS):
+            offset = SLOTS_OFFSET + index * SLOT_SIZE
+            sequence = SEQUENCE.unpack_from(self.buf, offset)[0]
+            if sequence == 0:
+                break
+            if seen.get(index) == sequence:
+                continue
+            record = self.read_slot(index)
+            if record is not None:
+                seen[index] = record[0]
+                changed.append(record[1:])
+        return changed
+
+    def write_status(self, delay, failing, volume, station):
+        with self.lock:
+            sequence = self.begin_write(STATUS_OFFSET)
+            name = encode(station or "", MAX_STATION)
+            STATUS.pack_into(
+                self.buf,
+                STATUS_OFFSET,
+                sequence,
+                math.nan if delay is None else delay,
+                failing,
+                volume,
+                len(name),
+                name,
+            )
+            self.end_write(STATUS_OFFSET, sequence)
+
+    def read_status(self):
+        # (delay or None, failing, volume, station or None)
+        _, (_, delay, failing, volume, name_length, name) = self.read_consistent(
+            STATUS_OFFSET, lambda: STATUS.unpack_from(self.buf, STATUS_OFFSET)
+        )
+        station = name[:name_length].decode("utf-8", "replace") or None
+        return (None if math.isnan(delay) else delay), failing, volume, station
+
+    def close(self):
+        self.buf = None
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
@@ -0,0 +1,99 @@
+import collections
+import json
+import threading
+import time
+
+from Metrics import registry
+
+# Sink delivers now playing updates to one output, from a thread of its own.
+#
+# Updates wait in a bounded queue. When the output falls behind and the queue
+# is full, the oldest update is dropped, so a stalled output never holds up
+# the feed, or any other output. An output that only shows the latest state,
+# like the LCD, takes a queue of one. Each sink counts the updates it dropped,
+# and how long updates waited for it.
+#
+# Usage:
+# sink = api.add_sink("lcd", show_on_lcd, max_pending=1)
+# sink.put("darksynth", current)   # what the API does on every update
+# sink.drain(timeout=1)
+
+
+def ndjson(station, current) -> bytes:
+    # One update as a line of JSON, the same for the broker, files and pipes.
+    update = {
+        "station": station,
+        "artist": current.artist,
+        "song": current.song,
+        "started_at_wall": current.started_at_wall,
+        "stale": current.stale,
+    }
+    return (json.dumps(update, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class NdjsonWriter:
+    # Sink handler that writes every update to a binary file, one JSON object per line.
+    def __init__(self, file):
+        self.file = file
+
+    def __call__(self, station, current):
+        self.file.write(ndjson(station, current))
+        self.file.flush()
+
+
+class Sink:
+    def __init__(self, name, handler, max_pending: int = 100, logger=None):
+        self.name = name
+        self.handler = handler
+        self.logger = logger
+        self.pending = collections.deque(maxlen=max_pending)
+        self.busy = False
+        self.condition = threading.Condition()
+
+        labels = {"sink": name}
+        self.delivered = registry.counter(
+            "nightride_sink_delivered_total", "Updates delivered to an output", labels=labels
+        )
+        self.dropped = registry.counter(
+            "nightride_sink_dropped_total",
+            "Updates dropped because an output fell behind",
+            labels=labels,
+        )
+        self.lag = registry.histogram(
+            "nightride_sink_lag_seconds", "Time updates waited for an output", labels=labels
+        )
+
+        sink_thread = threading.Thread(target=self.run, name=f"sink-{name}")
+        sink_thread.daemon = True
+        sink_thread.start()
+
+    def put(self, station, current):
+        # Never blocks.
+        with self.condition:
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped.inc()
+            self.pending.append((time.perf_counter(), station, current))
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+                while not self.pending:
+                    self.condition.wait()
+                queued_at, station, current = self.pending.popleft()
+                self.busy = True
+            self.lag.observe(time.perf_counter() - queued_at)
+            try:
+                self.handler(station, current)
+                self.delivered.inc()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Output {self.name} failed")
+                    self.logger.error(e)
+
+    def drain(self, timeout: float = None) -> bool:
+        # Waits until everything queued has been delivered. False on timeout.
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending and not self.busy, timeout)
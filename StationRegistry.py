@@ -0,0 +1,124 @@
+import threading
+
+# StationRegistry is the ordered set of known stations.
+#
+# Stations from settings.ini come first, in their configured order, so the
+# number hotkeys stay stable. Stations discovered from the metadata feed are
+# appended as they show up. Lookups by name and by position are O(1).
+#
+# Usage:
+# stations = StationRegistry(["nightride", "chillsynth"])
+# stations.add("darksynth")
+# stations.index("darksynth")  # 2
+# stations[2]                  # "darksynth"
+
+
+class StationRegistry:
+    def __init__(self, stations=()):
+        self.names = []
+        self.positions = {}
+        self.lock = threading.Lock()
+        for station in stations:
+            self.add(station)
+
+    def add(self, station: str) -> bool:
+        # Returns True if the station was not known before.
+        if station in self.positions:
+            return False
+        with self.lock:
+            if station in self.positions:
+                return False
+            self.positions[station] = len(self.names)
+            self.names.append(station)
+            return True
+
+    def index(self, station: str) -> int:
+        return self.positions[station]
+
+    def __getitem__(self, index):
+        return self.names[index]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(list(self.names))
+
+    def __contains__(self, station):
+        return station in self.positions
+
+    def search(self, query: str, within=None):
+        # Positions of the stations whose name contains {query}, case-insensitively.
+        # Pass the result of a shorter query as {within} to only search those.
+        query = query.lower()
+        candidates = range(len(self.names)) if within is None else within
+        return [i for i in candidates if query in self.names[i].lower()]
+
+
+class StationSelector:
+    # Selection state of the station selector popup: a filter query, the
+    # matching stations and a scroll window over them. Only the visible rows
+    # are ever built, however many stations there are.
+    def __init__(self, stations: StationRegistry, current: str, rows: int):
+        self.stations = stations
+        self.rows = rows
+        self.query = ""
+        self.matches = stations.search("")
+        self.known = len(stations)
+        self.position = stations.index(current) if current in stations else 0
+        self.offset = 0
+        self.scroll()
+
+    def refresh(self) -> bool:
+        # Pick up stations discovered while the selector is open. Returns True if there were any.
+        if len(self.stations) == self.known:
+            return False
+        selected = self.selected
+        self.known = len(self.stations)
+        self.filter(self.query, selected)
+        return True
+
+    def filter(self, query: str, keep=None):
+        # Narrowing the query only searches the previous matches.
+        within = self.matches if keep is None and query.startswith(self.query) else None
+        self.query = query
+        self.matches = self.stations.search(query, within)
+        self.position = 0
+        if keep is not None and keep in self.stations:
+            index = self.stations.index(keep)
+            if index in self.matches:
+                self.position = self.matches.index(index)
+        self.offset = 0
+        self.scroll()
+
+    def type(self, character: str):
+        self.filter(self.query + character)
+
+    def backspace(self):
+        if self.query:
+            self.filter(self.query[:-1], self.selected)
+
+    def move(self, delta: int):
+        if self.matches:
+            self.position = max(0, min(len(self.matches) - 1, self.position + delta))
+            self.scroll()
+
+    def scroll(self):
+        # Keep the selected row inside the window.
+        if self.position < self.offset:
+            self.offset = self.position
+        elif self.position >= self.offset + self.rows:
+            self.offset = self.position - self.rows + 1
+
+    @property
+    def selected(self):
+        if not self.matches:
+            return None
+        return self.stations[self.matches[self.position]]
+
+    def visible(self):
+        # [(station number, station, is selected)] for the rows in the window.
+        return [
+            (index + 1, self.stations[index], self.offset + row == self.position)
+            for row, index in enumerate(self.matches[self.offset : self.offset + self.rows])
+        ]
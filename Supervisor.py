@@ -0,0 +1,404 @@
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from logger import Logger
+
+from Config import get_config
+from SharedState import SharedState
+
+# Supervisor runs the player as four processes, for [SETTINGS] processes = multi.
+#
+# ingest  NightRideAPI without audio: the SSE feed, history, snapshot and HTTP
+#         server. Writes every update into SharedState.
+# audio   The audio backend. Takes play, stop and volume commands from a queue,
+#         and writes its delay, failover state, station and volume into
+#         SharedState. Restarted, it picks up the station and volume again.
+# lcd     The RGB1602 display. Takes print commands from a queue, so the slow
+#         I2C writes never hold up a frame.
+# ui      RadioInterface, on a RemoteAPI that reads SharedState and sends the
+#         commands.
+#
+# Each process has its own interpreter and GIL, so decoding, logging and I2C
+# don't take turns with drawing. A worker that dies is started again, with
+# backoff. When the interface quits, everything stops.
+#
+# Usage:
+# python3 Supervisor.py
+# [SETTINGS] processes = multi, then python3 Radio.py
+
+# Small queues. A command that does not fit is dropped, instead of blocking the interface.
+QUEUE_SIZE = 64
+
+
+class RemoteAudio:
+    # What RadioInterface uses of the audio backend, in the audio process.
+    def __init__(self, state, commands):
+        self.state = state
+        self.commands = commands
+
+    def send(self, *command):
+        try:
+            self.commands.put_nowait(command)
+        except queue.Full:
+            pass
+
+    def play(self, station: str = "chillsynth"):
+        self.send("play", station)
+
+    def stop(self):
+        self.send("stop", None)
+
+    def set_volume(self, volume):
+        self.send("volume", volume)
+
+    @property
+    def delay(self):
+        return self.state.read_status()[0]
+
+    @property
+    def failing(self) -> bool:
+        return self.state.read_status()[1]
+
+
+class RemoteLCD:
+    # What RadioInterface uses of RGB1602, in the LCD process.
+    def __init__(self, commands):
+        self.commands = commands
+
+    def send(self, method, **kwargs):
+        try:
+            self.commands.put_nowait((method, kwargs))
+        except queue.Full:
+            pass
+
+    def printOnOneRow(self, arg, row):
+        self.send("printOnOneRow", arg=arg, row=row)
+
+    def printOnTwoRows(self, **kwargs):
+        self.send("printOnTwoRows", **kwargs)
+
+    def clear(self):
+        self.send("clear")
+
+    def turnOff(self):
+        self.send("turnOff")
+
+
+class RemoteAPI:
+    # What RadioInterface uses of NightRideAPI, read from SharedState.
+    def __init__(self, state, audio_commands, ingest_commands, loglevel, logfile):
+        from NightrideAPI import NowPlaying
+        from PlayClock import PlayClock
+        from StationRegistry import StationRegistry
+
+        config = get_config()
+        self.NowPlaying = NowPlaying
+        self.lite = config.lite
+        self.stations = StationRegistry(config.stations)
+        self.state = state
+        self.ingest_commands = ingest_commands
+        self.audioPlayer = RemoteAudio(state, audio_commands)
+        self.now_playing = {}
+        self.listeners = []
+        self.seen = {}
+        self.seen_changes = None
+
+        # Whatever the ingest process has by now, before the first frame
+        self.poll()
+        self.play_clock = PlayClock(
+            self, self.audioPlayer, fixed_delay=config.audio_delay, loglevel=loglevel, logfile=logfile
+        )
+        poll_thread = threading.Thread(target=self.run)
+        poll_thread.daemon = True
+        poll_thread.start()
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def subscribe(self, station):
+        self.send(("subscribe", station))
+
+    def unsubscribe(self, station):
+        self.send(("unsubscribe", station))
+
+    def send(self, command):
+        try:
+            self.ingest_commands.put_nowait(command)
+        except queue.Full:
+            pass
+
+    def run(self, interval=0.05):
+        while True:
+            time.sleep(interval)
+            self.poll()
+
+    def poll(self):
+        changes = self.state.changes
+        if changes == self.seen_changes:
+            return
+        self.seen_changes = changes
+        for station, artist, song, started_at_wall, stale in self.state.read_changed(self.seen):
+            self.stations.add(station)
+            current = self.NowPlaying.from_wall(artist, song, started_at_wall, stale)
+            self.now_playing[station] = current
+            for callback in self.listeners:
+                callback(station, current)
+
+
+def run_ingest(state_name, commands, loglevel, logfile):
+    from NightrideAPI import NightRideAPI
+
+    state = SharedState(name=state_name)
+    # A previous ingest process may have died mid-write.
+    state.recover(slots=True)
+
+    def publish(station, current):
+        state.write_station(
+            station, current.artist, current.song, current.started_at_wall, current.stale
+        )
+
+    api = NightRideAPI(loglevel=loglevel, logfile=logfile, audio=False)
+    api.add_listener(publish)
+    for station, current in list(api.now_playing.items()):
+        publish(station, current)
+
+    while True:
+        command = commands.get()
+        if command is None:
+            # A clean exit, so the snapshot is saved.
+            return
+        action, station = command
+        if action == "subscribe":
+            api.subscribe(station)
+        elif action == "unsubscribe":
+            api.unsubscribe(station)
+
+
+def run_audio(state_name, commands, loglevel, logfile):
+    from AudioPlayer import create_audio_player
+
+    config = get_config()
+    state = SharedState(name=state_name)
+    # A previous audio process may have died mid-write.
+    state.recover(status=True)
+    player = create_audio_player(
+        config.audio_backend,
+        base_url=config.audio_stream_base_url,
+        lite=config.lite,
+        device=config.audio_device,
+        variants=config.audio_variants,
+        stall_timeout=config.audio_stall_timeout,
+        loglevel=loglevel,
+        logfile=logfile,
+    )
+    # A restart carries on where the previous audio process was.
+    _, _, volume, station = state.read_status()
+    player.set_volume(volume)
+    if station:
+        player.play(station)
+
+    while True:
+        try:
+            command = commands.get(timeout=0.25)
+        except queue.Empty:
+            command = ()
+        if command is None:
+            return
+        if command:
+            action, argument = command
+            if action == "play":
+                station = argument
+                player.play(station)
+            elif action == "stop":
+                station = None
+                player.stop()
+            elif action == "volume":
+                volume = argument
+                player.set_volume(volume)
+        state.write_status(player.delay, player.failing, volume, station)
+
+
+def run_lcd(commands, loglevel, logfile):
+    lcd = None
+    while True:
+        batch = [commands.get()]
+        while True:
+            try:
+                batch.append(commands.get_nowait())
+            except queue.Empty:
+                break
+        # Of several queued two row prints, only the newest is worth the I2C time.
+        last_print = max(
+            (i for i, command in enumerate(batch) if command and command[0] == "printOnTwoRows"),
+            default=None,
+        )
+        for i, command in enumerate(batch):
+            if command is None:
+                return
+            method, kwargs = command
+            if method == "printOnTwoRows" and i != last_print:
+                continue
+            if lcd is None:
+                # Only once the interface uses the LCD. A failure ends the process, and it is retried.
+                import RGB1602
+
+                lcd = RGB1602.RGB1602(16, 2, "error", logfile=logfile)
+            getattr(lcd, method)(**kwargs)
+
+
+def run_ui(state_name, terminal, audio_commands, lcd_commands, ingest_commands, loglevel, logfile):
+    from Radio import RadioInterface
+
+    # multiprocessing points stdin at /dev/null. The interface needs the terminal.
+    os.dup2(terminal, 0)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    state = SharedState(name=state_name)
+    api = RemoteAPI(state, audio_commands, ingest_commands, loglevel, logfile)
+    radio = RadioInterface(loglevel=loglevel, logfile=logfile, api=api, lcd=RemoteLCD(lcd_commands))
+    sys.exit(1 if radio.crashed else 0)
+
+
+class Worker:
+    def __init__(self, name, target, args):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.restart_at = None
+
+
+class Supervisor:
+    def __init__(
+        self,
+        loglevel=logging.INFO,
+        logfile: str = "radio.log",
+        min_backoff: float = 0.5,
+        max_backoff: float = 30,
+    ):
+        self.logger = Logger(
+            module_name=__name__,
+            log_file=logfile,
+            log_level=loglevel,
+            delete_old_logfile=True,
+            streamhandler=False,
+            filehandler=True,
+        )
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        # Forked, so the interface can take the terminal. The supervisor starts no threads of its own.
+        self.context = multiprocessing.get_context("fork")
+        self.state = SharedState()
+        self.ingest_commands = self.context.Queue(QUEUE_SIZE)
+        self.audio_commands = self.context.Queue(QUEUE_SIZE)
+        self.lcd_commands = self.context.Queue(QUEUE_SIZE)
+        self.terminal = os.dup(0)
+
+        name = self.state.name
+        self.workers = [
+            Worker("ingest", run_ingest, (name, self.ingest_commands, loglevel, logfile)),
+            Worker("audio", run_audio, (name, self.audio_commands, loglevel, logfile)),
+            Worker("lcd", run_lcd, (self.lcd_commands, loglevel, logfile)),
+            Worker(
+                "ui",
+                run_ui,
+                (
+                    name,
+                    self.terminal,
+                    self.audio_commands,
+                    self.lcd_commands,
+                    self.ingest_commands,
+                    loglevel,
+                    logfile,
+                ),
+            ),
+        ]
+
+    def start(self, worker):
+        worker.process = self.context.Process(
+            target=self.bootstrap, args=(worker.target, worker.args), name=worker.name
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        self.logger.log.info(f"Started {worker.name} worker, pid {worker.process.pid}")
+
+    @staticmethod
+    def bootstrap(target, args):
+        # Ctrl-C is for the supervisor, and the interface. The others are stopped in order.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        target(*args)
+
+    def run(self):
+        for worker in self.workers:
+            self.start(worker)
+        try:
+            while True:
+                self.supervise()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def supervise(self):
+        # Sleeps until a worker exits, or a restart is due.
+        now = time.monotonic()
+        due = [worker.restart_at for worker in self.workers if worker.restart_at is not None]
+        timeout = max(0.0, min(due) - now) if due else None
+        running = [worker.process.sentinel for worker in self.workers if worker.restart_at is None]
+        multiprocessing.connection.wait(running, timeout)
+
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.restart_at is not None:
+                if worker.restart_at <= now:
+                    self.start(worker)
+                continue
+            if worker.process.is_alive():
+                continue
+            worker.process.join()
+            code = worker.process.exitcode
+            if worker.name == "ui" and code == 0:
+                self.logger.log.info("Interface quit. Stopping.")
+                raise KeyboardInterrupt
+            # A worker that ran for a while before dying starts over fast.
+            if now - worker.started_at > 60:
+                worker.restarts = 0
+            delay = min(self.max_backoff, self.min_backoff * 2**worker.restarts)
+            worker.restarts += 1
+            worker.restart_at = now + delay
+            self.logger.log.error(
+                f"{worker.name} worker exited with code {code}. Restarting in {delay:.1f}s"
+            )
+
+    def stop(self):
+        # The interface first, so it can put the terminal back. Then the others
+        # get a clean exit, so the snapshot is saved and the LCD turned off.
+        ui = self.workers[-1].process
+        if ui.is_alive():
+            ui.join(2)
+        for commands in (self.ingest_commands, self.audio_commands, self.lcd_commands):
+            try:
+                commands.put(None, timeout=1)
+            except queue.Full:
+                pass
+        for worker in self.workers:
+            if worker.process.is_alive():
+                worker.process.join(2)
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+        self.state.close()
+        self.state.unlink()
+
+
+if __name__ == "__main__":
+    Supervisor(loglevel=logging.INFO).run()
@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+# Compares the audio backends on the same local stream, played into a null sink.
+#
+# Each backend runs in its own process, so RSS and CPU are its own:
+#
+# first audio  construction until the first decoded audio is played
+# cpu          process CPU time per second of playback, after first audio
+# rss          resident memory at the end
+#
+# Usage:
+# python3 benchmarks/audio_backends.py tone.aac --seconds 20
+# python3 benchmarks/audio_backends.py tone.aac --backends ffmpeg
+
+
+def rss_mib():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def has_played(player):
+    if hasattr(player, "first_period_at"):
+        return player.first_period_at is not None
+    return player.player is not None and player.player.get_time() > 0
+
+
+def measure(backend, base_url, seconds):
+    # Runs in the child process.
+    from AudioPlayer import create_audio_player
+
+    start = time.perf_counter()
+    player = create_audio_player(backend, base_url=base_url, device="null", logfile=os.devnull)
+    player.set_volume(4)
+    player.play("darksynth")
+    while not has_played(player):
+        if time.perf_counter() - start > 30:
+            return {"backend": backend, "error": "no audio"}
+        time.sleep(0.005)
+    first_audio = time.perf_counter() - start
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_start = usage.ru_utime + usage.ru_stime
+    time.sleep(seconds)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = usage.ru_utime + usage.ru_stime - cpu_start
+    result = {
+        "backend": backend,
+        "first_audio": first_audio,
+        "cpu": cpu / seconds,
+        "rss": rss_mib(),
+    }
+    player.stop()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Audio backend comparison")
+    parser.add_argument("path", help="Audio file to stream, preferably ADTS AAC")
+    parser.add_argument("--backends", default="vlc,ffmpeg")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--rate", type=int, default=16000, help="Stream rate, bytes per second")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.base_url, args.seconds)))
+        sys.exit(0)
+
+    from stream_server import StreamServer
+
+    server = StreamServer(args.path, rate=args.rate)
+    print(f"{'backend':<8} {'first audio':>12} {'cpu':>8} {'rss':>10}")
+    for backend in args.backends.split(","):
+        child = subprocess.run(
+            [sys.executable, __file__, args.path, "--child", backend, "--base-url", server.base_url,
+             "--seconds", str(args.seconds)],
+            cwd=ROOT,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        try:
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            result = {"error": f"exit status {child.returncode}"}
+        if "error" in result:
+            print(f"{backend:<8} {result['error']}")
+            continue
+        print(
+            f"{backend:<8} {result['first_audio'] * 1000:9.1f} ms {result['cpu'] * 100:7.2f}% "
+            f"{result['rss']:6.1f} MiB"
+        )
+    server.close()
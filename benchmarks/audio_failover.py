@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from stream_server import StreamServer
+
+# Dropout length when the audio stream fails, with the libvlc watchdog.
+#
+# AudioPlayer plays a local stream into a null sink. The stream is dropped or
+# stalled, and the time until a standby player has taken over is measured.
+#
+# Usage:
+# python3 benchmarks/audio_failover.py tone.aac --rounds 5
+
+
+def wait_for(condition, timeout):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if condition():
+            return time.perf_counter()
+        time.sleep(0.005)
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Audio failover benchmark")
+    parser.add_argument("path", help="Audio file to stream, preferably ADTS AAC")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--stall-timeout", type=float, default=2.0)
+    parser.add_argument("--rate", type=int, default=16000, help="Stream rate, bytes per second")
+    args = parser.parse_args()
+
+    from AudioPlayer import AudioPlayer
+
+    server = StreamServer(args.path, rate=args.rate)
+    player = AudioPlayer(
+        base_url=server.base_url,
+        device="null",
+        stall_timeout=args.stall_timeout,
+        logfile=os.devnull,
+    )
+    player.play("darksynth")
+    if wait_for(lambda: player.player is not None and player.player.get_time() > 0, 30) is None:
+        print("No audio from the local stream")
+        sys.exit(1)
+
+    for fault in ("drop", "stall"):
+        times = []
+        for _ in range(args.rounds):
+            time.sleep(2)
+            playing = player.player
+            server.inject(fault)
+            recovered = wait_for(
+                lambda: player.player is not playing and player.player.get_time() > 0,
+                args.stall_timeout + 20,
+            )
+            times.append(None if recovered is None else recovered - server.fault_at)
+        print(
+            f"{fault:<6} dropout  "
+            + ", ".join(f"{t * 1000:.0f} ms" if t is not None else "no recovery" for t in times)
+        )
+
+    player.stop()
+    server.close()
@@ -0,0 +1,205 @@
+import argparse
+import collections
+import http.client
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from AudioPlayer import AUDIO_QUALITY_SWITCHES, QualitySelector
+from stream_server import StreamServer
+
+# Stream quality switching against a throttled local stream server.
+#
+# A StreamServer serves three variants of a station, each at its own bitrate,
+# and its link rate is changed on a schedule, as a congested link would. A
+# simulated player plays from the stream at the bitrate of the variant, and
+# lets the QualitySelector of AudioPlayer pick the variant. Like AudioPlayer, it
+# keeps playing the old stream until the new one has buffered, and steps down
+# on an underrun. The files are random bytes, as nothing is decoded.
+#
+# The streams run at {real_ratio} of their nominal bitrate, after a burst of
+# two seconds, as real ones do. The selector only knows the nominal bitrates.
+#
+# Two cases run by default: the schedule at the nominal rates, and a healthy
+# link with streams 3% under nominal, where no step down may happen. For each
+# phase, it shows the variants played, the best one the link could carry, and
+# the time spent rebuffering.
+#
+# Usage:
+# python3 benchmarks/audio_quality.py
+# python3 benchmarks/audio_quality.py --schedule 40000:30,9000:40,40000:60 --real-ratio 0.97
+
+# (suffix, bits per second), lowest first
+VARIANTS = (("_low", 48000), ("_mid", 96000), ("", 128000))
+TICK = 0.1
+
+
+class Connection:
+    # One stream, read as fast as the server sends it.
+    def __init__(self, port, path, index):
+        self.index = index
+        self.received = 0
+        self.connection = http.client.HTTPConnection("127.0.0.1", port)
+        self.connection.request("GET", path)
+        self.response = self.connection.getresponse()
+        reader_thread = threading.Thread(target=self.read)
+        reader_thread.daemon = True
+        reader_thread.start()
+
+    def read(self):
+        try:
+            while True:
+                chunk = self.response.read1(65536)
+                if not chunk:
+                    return
+                self.received += len(chunk)
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def close(self):
+        self.connection.close()
+
+
+class SimulatedPlayer:
+    def __init__(self, port, selector, real_ratio=1.0, prebuffer=1.0, underrun_grace=0.5):
+        self.port = port
+        self.selector = selector
+        self.real_ratio = real_ratio
+        self.prebuffer = prebuffer
+        self.underrun_grace = underrun_grace
+        self.playing = self.connect()
+        self.played = 0.0
+        self.started = False
+        self.underrun_at = None
+        self.standby = None
+        self.rebuffering = 0.0
+
+    def connect(self):
+        suffix = VARIANTS[self.selector.index][0]
+        return Connection(self.port, f"/darksynth{suffix}.m4a", self.selector.index)
+
+    def buffered(self, connection, played):
+        # Played at the real rate of the stream, which the selector does not know
+        return connection.received * 8 / (VARIANTS[connection.index][1] * self.real_ratio) - played
+
+    def tick(self, now, dt):
+        if self.standby is not None and self.buffered(self.standby, 0) >= self.prebuffer:
+            self.playing.close()
+            self.playing, self.standby = self.standby, None
+            self.played = 0.0
+            self.selector.reset()
+
+        buffered = self.buffered(self.playing, self.played)
+        if not self.started:
+            self.started = buffered >= self.prebuffer
+        if self.started and buffered > 0:
+            self.played += min(dt, buffered)
+            self.underrun_at = None
+        elif self.played > 0:
+            self.rebuffering += dt
+            if self.underrun_at is None:
+                self.underrun_at = now
+            elif now - self.underrun_at > self.underrun_grace and self.standby is None:
+                # What AudioPlayer does on an underrun: one step down, and a standby stream
+                self.selector.step(-1, now)
+                self.standby = self.connect()
+                self.underrun_at = None
+
+        if self.standby is None:
+            starved = self.underrun_at is not None
+            self.selector.update(now, self.playing.received, starved=starved)
+            if self.selector.index != self.playing.index:
+                self.standby = self.connect()
+
+    def close(self):
+        self.playing.close()
+        if self.standby is not None:
+            self.standby.close()
+
+
+def best_variant(link_rate, real_ratio):
+    # The highest variant the link carries, by bitrate alone
+    fits = [i for i, (_, bitrate) in enumerate(VARIANTS) if bitrate * real_ratio / 8 <= link_rate]
+    return fits[-1] if fits else 0
+
+
+def run(files, schedule, real_ratio, up_after, down_after):
+    # Returns the number of steps down.
+    byte_rates = {suffix: int(bitrate * real_ratio / 8) for suffix, bitrate in VARIANTS}
+    server = StreamServer(
+        files[""],
+        rate=byte_rates[""],
+        burst=byte_rates[""] * 2,
+        variants={suffix: (files[suffix], byte_rates[suffix]) for suffix, _ in VARIANTS[:-1]},
+    )
+    selector = QualitySelector(
+        [(suffix, bitrate) for suffix, bitrate in VARIANTS],
+        up_after=up_after,
+        down_after=down_after,
+    )
+    phases = [tuple(int(part) for part in phase.split(":")) for phase in schedule.split(",")]
+    downs = AUDIO_QUALITY_SWITCHES["down"].value
+    player = None
+    print(f"streams at {real_ratio:.0%} of nominal")
+    print(f"{'link B/s':>8} {'seconds':>7}  {'best':>5}  {'at end':>6}  {'rebuffering':>11}  played")
+    for link_rate, seconds in phases:
+        server.link_rate = link_rate
+        if player is None:
+            player = SimulatedPlayer(server.port, selector, real_ratio=real_ratio)
+        time_at = collections.Counter()
+        rebuffering = player.rebuffering
+        end = time.monotonic() + seconds
+        last = time.monotonic()
+        while time.monotonic() < end:
+            time.sleep(TICK)
+            now = time.monotonic()
+            player.tick(now, now - last)
+            time_at[player.playing.index] += now - last
+            last = now
+        played = ", ".join(
+            f"{VARIANTS[index][1] // 1000}k {share:.0f}s" for index, share in sorted(time_at.items())
+        )
+        best = VARIANTS[best_variant(link_rate, real_ratio)][1] // 1000
+        print(
+            f"{link_rate:>8} {seconds:>7}  {best:>4}k"
+            f"  {VARIANTS[player.playing.index][1] // 1000:>5}k"
+            f"  {player.rebuffering - rebuffering:>10.1f}s  {played}"
+        )
+    player.close()
+    server.close()
+    return AUDIO_QUALITY_SWITCHES["down"].value - downs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream quality switching benchmark")
+    parser.add_argument(
+        "--schedule", help="Link rates in bytes per second, with seconds each. Runs only this case"
+    )
+    parser.add_argument("--real-ratio", type=float, default=1.0, help="Real to nominal bitrate")
+    parser.add_argument("--up-after", type=float, default=15.0)
+    parser.add_argument("--down-after", type=float, default=4.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    files = {}
+    for suffix, bitrate in VARIANTS:
+        files[suffix] = os.path.join(workdir, f"stream{suffix}.bin")
+        with open(files[suffix], "wb") as stream_file:
+            stream_file.write(os.urandom(bitrate // 8 * 10))
+
+    if args.schedule:
+        run(files, args.schedule, args.real_ratio, args.up_after, args.down_after)
+        sys.exit(0)
+
+    run(files, "40000:30,9000:40,4000:30,40000:90", 1.0, args.up_after, args.down_after)
+    print()
+    downs = run(files, "40000:120", 0.97, args.up_after, args.down_after)
+    if downs:
+        print(f"FAIL: {downs} steps down on a healthy link")
+        sys.exit(1)
@@ -0,0 +1,133 @@
+import argparse
+import fcntl
+import os
+import pty
+import select
+import signal
+import statistics
+import struct
+import sys
+import tempfile
+import termios
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from sse_recording import synthetic_records
+from sse_replay import ReplayServer
+
+# Frame time jitter, in single and multi-process mode.
+#
+# Radio.py runs in a pseudo terminal with the ANSI renderer and the VU meter
+# on, so every frame writes to the terminal, while a synthetic feed is
+# replayed at {speed} events per second. The gaps between frames, as they
+# arrive on the terminal, should all be the frame interval. Their spread is
+# the jitter the interface shows.
+#
+# Usage:
+# python3 benchmarks/frame_jitter.py --seconds 20 --speed 2000
+# python3 benchmarks/frame_jitter.py --modes multi
+
+SETTINGS = """[DISPLAY]
+renderer = ansi
+
+[ADDONS]
+lcd1602 = False
+
+[URLS]
+sse_url = {url}
+audio_stream_base_url = http://127.0.0.1:1
+
+[STATIONS]
+1 = darksynth
+2 = chillsynth
+
+[SETTINGS]
+vu_meter = True
+default_station = darksynth
+now_playing_snapshot = now_playing.json
+processes = {mode}
+
+[HISTORY]
+enabled = True
+database = history.db
+
+[BROKER]
+socket =
+"""
+
+FRAME_INTERVAL = 0.1
+# Output this close together belongs to the same frame.
+SAME_FRAME = 0.02
+
+
+def measure(mode, url, seconds, rows=12, cols=52):
+    workdir = tempfile.mkdtemp()
+    settings = os.path.join(workdir, "settings.ini")
+    with open(settings, "w") as settings_file:
+        settings_file.write(SETTINGS.format(url=url, mode=mode))
+
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.chdir(workdir)
+        os.environ["TERM"] = "xterm-256color"
+        os.environ["NIGHTRIDE_SETTINGS"] = settings
+        os.execv(sys.executable, [sys.executable, os.path.join(ROOT, "Radio.py")])
+
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+    frames = []
+    output = b""
+    started = None
+    try:
+        deadline = time.perf_counter() + 15
+        while time.perf_counter() < deadline:
+            ready, _, _ = select.select([fd], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(fd, 65536)
+            except OSError:
+                break
+            now = time.perf_counter()
+            if started is None:
+                output += data
+                if b"NIGHTRIDE" in output:
+                    # Startup is not steady state. Give it a couple of seconds.
+                    started = now + 2
+                    deadline = started + seconds
+            elif now >= started and (not frames or now - frames[-1] > SAME_FRAME):
+                frames.append(now)
+    finally:
+        # The process group, for the workers of multi-process mode
+        os.killpg(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        os.close(fd)
+    if len(frames) < 3:
+        return None
+    return [b - a for a, b in zip(frames, frames[1:])]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Frame time jitter per process mode")
+    parser.add_argument("--modes", default="single,multi")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--speed", type=float, default=2000, help="Feed events per second")
+    args = parser.parse_args()
+
+    server = ReplayServer(synthetic_records(200000), speed=args.speed, loop=True, timing=False)
+    print(f"{'mode':<7} {'frames':>6} {'p50 ms':>7} {'p99 ms':>7} {'max ms':>7} {'jitter ms':>9}")
+    for mode in args.modes.split(","):
+        gaps = measure(mode, server.url, args.seconds)
+        if gaps is None:
+            print(f"{mode:<7} no frames")
+            continue
+        gaps.sort()
+        # Mean distance from the intended frame interval
+        jitter = statistics.fmean(abs(gap - FRAME_INTERVAL) for gap in gaps)
+        print(
+            f"{mode:<7} {len(gaps) + 1:>6} {gaps[len(gaps) // 2] * 1000:7.1f}"
+            f" {gaps[int(len(gaps) * 0.99)] * 1000:7.1f} {gaps[-1] * 1000:7.1f} {jitter * 1000:9.1f}"
+        )
+    server.close()
@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from PlayHistory import PlayHistory
+from sse_recording import MAGIC, event_payloads, read_recording
+
+# Measures how fast PlayHistory ingests track events.
+#
+# Events come from a recorded feed, i.e. the raw output of
+#   curl -N https://nightride.fm/meta > feed.txt
+# or a recording made with tools/sse_record.py, or, without --feed, from a
+# synthetic feed covering every station.
+#
+# Usage:
+# python3 benchmarks/history_ingest.py --feed feed.txt --repeat 50
+
+
+def read_feed(path):
+    with open(path, "rb") as feed:
+        recorded = feed.read(len(MAGIC)) == MAGIC
+    if recorded:
+        payloads = event_payloads(read_recording(path))
+    else:
+        with open(path, encoding="utf-8") as feed:
+            payloads = [line[5:].strip() for line in feed if line.startswith("data:")]
+
+    events = []
+    for data in payloads:
+        if data == "keepalive":
+            continue
+        track = json.loads(data)[0]
+        events.append((track["station"], track.get("artist", ""), track.get("title", "")))
+    return events
+
+
+def synthetic_feed(count):
+    stations = ["nightride", "chillsynth", "darksynth", "horrorsynth", "spacesynth"]
+    return [
+        (random.choice(stations), f"Artist {i % 500}", f"Song {i}")
+        for i in range(count)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PlayHistory ingest benchmark")
+    parser.add_argument("--feed", help="Recorded SSE feed")
+    parser.add_argument("--events", type=int, default=10000, help="Synthetic feed size")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the feed N times")
+    args = parser.parse_args()
+
+    events = read_feed(args.feed) if args.feed else synthetic_feed(args.events)
+    events = events * args.repeat
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history = PlayHistory(
+            database=os.path.join(tmp, "history.db"),
+            max_pending=len(events) + 1,
+            logfile=os.path.join(tmp, "bench.log"),
+        )
+
+        start = time.perf_counter()
+        for station, artist, song in events:
+            history.record(station, artist, song)
+        enqueued = time.perf_counter() - start
+        history.flush()
+        total = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows = history.query(station="darksynth", since=0, limit=1000)
+        query = time.perf_counter() - start
+        history.close()
+
+    print(f"events:        {len(events)}")
+    print(f"record() cost: {enqueued / len(events) * 1e6:.2f} us/event")
+    print(f"ingest rate:   {len(events) / total:.0f} events/s")
+    print(f"query:         {len(rows)} rows in {query * 1000:.2f} ms")
@@ -0,0 +1,143 @@
+import argparse
+import http.client
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from NightrideAPI import NowPlaying
+from NowPlayingServer import NowPlayingServer
+from Sinks import Sink
+
+# Load test for the local now playing server.
+#
+# A swarm of keep-alive clients polls /now-playing/<station>, either plainly or
+# with If-None-Match (answered with 304), and reports requests/second and latency
+# percentiles. A second phase attaches SSE subscribers to /events and measures
+# how long a track change takes to reach all of them.
+#
+# Usage:
+# python3 benchmarks/http_relay.py --clients 32 --seconds 5 --subscribers 100
+
+
+class StubAPI:
+    # Just enough of NightRideAPI for the server.
+    def __init__(self):
+        self.now_playing = {}
+        self.listeners = []
+        self.sinks = []
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def add_sink(self, name, handler, max_pending=100):
+        sink = Sink(name, handler, max_pending=max_pending)
+        self.sinks.append(sink)
+        return sink
+
+    def publish(self, station, artist, song):
+        current = NowPlaying(artist, song, time.perf_counter(), time.time())
+        self.now_playing[station] = current
+        for callback in self.listeners:
+            callback(station, current)
+        for sink in self.sinks:
+            sink.put(station, current)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def poll(port, conditional, deadline, latencies):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    etag = None
+    while time.perf_counter() < deadline:
+        headers = {"If-None-Match": etag} if conditional and etag else {}
+        start = time.perf_counter()
+        connection.request("GET", "/now-playing/darksynth", headers=headers)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        etag = response.getheader("ETag")
+    connection.close()
+
+
+def swarm(port, clients, seconds, conditional):
+    deadline = time.perf_counter() + seconds
+    results = [[] for _ in range(clients)]
+    threads = [
+        threading.Thread(target=poll, args=(port, conditional, deadline, results[i]))
+        for i in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies = [latency for result in results for latency in result]
+    return len(latencies) / seconds, latencies
+
+
+def subscribe(port, count, ready, delays):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    connection.request("GET", "/events")
+    response = connection.getresponse()
+    ready.release()
+    while len(delays) < count:
+        line = response.fp.readline()
+        if line.startswith(b"data: {"):
+            event = json.loads(line[6:])
+            delays.append(time.perf_counter() - float(event["artist"]))
+    connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Now playing server load test")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--subscribers", type=int, default=50)
+    parser.add_argument("--updates", type=int, default=20)
+    args = parser.parse_args()
+
+    api = StubAPI()
+    api.publish("darksynth", "Perturbator", "Future Club")
+    server = NowPlayingServer(api, port=0, logfile=os.devnull)
+
+    for conditional in (False, True):
+        rps, latencies = swarm(server.port, args.clients, args.seconds, conditional)
+        label = "If-None-Match" if conditional else "plain GET    "
+        print(
+            f"{label}: {rps:8.0f} req/s  p50 {percentile(latencies, 50) * 1000:.2f} ms"
+            f"  p99 {percentile(latencies, 99) * 1000:.2f} ms"
+        )
+
+    ready = threading.Semaphore(0)
+    delays = [[] for _ in range(args.subscribers)]
+    threads = [
+        threading.Thread(target=subscribe, args=(server.port, args.updates, ready, delays[i]))
+        for i in range(args.subscribers)
+    ]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for _ in threads:
+        ready.acquire()
+    time.sleep(0.2)
+
+    for i in range(args.updates):
+        api.publish("darksynth", repr(time.perf_counter()), f"Song {i}")
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    all_delays = [delay for result in delays for delay in result]
+    print(
+        f"SSE fan-out:   {args.subscribers} subscribers, {len(all_delays)} deliveries"
+        f"  p50 {percentile(all_delays, 50) * 1000:.2f} ms"
+        f"  p99 {percentile(all_delays, 99) * 1000:.2f} ms"
+    )
+    server.close()
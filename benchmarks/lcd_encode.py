@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from RGB1602 import encodeForLcd
+
+# Time to encode track titles for the LCD.
+#
+# "per character" is how titles were encoded before the ROM table: one
+# latin-1 encode per character, with '?' for failures, and the ä and ö
+# fix-ups per byte. Its error logging is left out, which flatters it.
+# "table" is encodeForLcd: one str.translate and one encode per title.
+#
+# Usage:
+# python3 benchmarks/lcd_encode.py --number 20000
+
+TITLES = [
+    "Perturbator",
+    "Future Club",
+    "Matias Räisänen",
+    "Mötley Crüe",
+    "Björk – Jóga",
+    "Sigur Rós",
+    "Ólafur Arnalds",
+    "“Night Drive” (Extended Mix)…",
+    "Gunship feat. Tyler Bates",
+    "Łódź After Dark",
+]
+
+
+def per_character(text):
+    encoded = bytearray()
+    for char in text:
+        try:
+            encoded.extend(bytes(char, "latin_1"))
+        except UnicodeEncodeError:
+            encoded.extend(b"?")
+    return bytes(225 if byte == 228 else 239 if byte == 246 else byte for byte in encoded)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LCD title encoding benchmark")
+    parser.add_argument("--number", type=int, default=20000, help="Passes over the titles")
+    args = parser.parse_args()
+
+    # Builds the table, and transliterates anything outside it, before timing.
+    for title in TITLES:
+        encodeForLcd(title)
+
+    for name, encode in (("per character", per_character), ("table", encodeForLcd)):
+        seconds = timeit.timeit(
+            lambda: [encode(title) for title in TITLES], number=args.number
+        )
+        print(f"{name:<14} {seconds / (args.number * len(TITLES)) * 1e6:6.2f} µs per title")
+
+    print("sample:")
+    for title in TITLES[2:6]:
+        print(f"  {title!r:<22} {per_character(title)!r:<26} {encodeForLcd(title)!r}")
@@ -0,0 +1,157 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from sse_recording import synthetic_records
+from sse_replay import ReplayServer
+
+# Memory budget check for long runs of the player.
+#
+# Hours of feed are replayed as fast as possible into a NightRideAPI with
+# history, snapshot and HTTP server enabled. libvlc plays into a null sink,
+# from a local stream if an audio file is given, since its modules are most
+# of what the lite profile trims. RSS is sampled throughout, and
+# tracemalloc compares the Python heap after warm-up with the heap at the end.
+# Exits with status 1 if peak RSS or heap growth goes over budget.
+#
+# Usage:
+# python3 benchmarks/memory_budget.py --hours 8 --profile lite
+# python3 benchmarks/memory_budget.py --hours 8 --profile full --rss-budget 96 --audio tone.aac
+# python3 benchmarks/memory_budget.py --no-audio   # the metadata side only
+
+SETTINGS = """[URLS]
+sse_url = {url}
+audio_stream_base_url = {audio_url}
+
+[AUDIO]
+backend = vlc
+device = null
+
+[STATIONS]
+1 = darksynth
+
+[SSE]
+stall_timeout = 30
+
+[SETTINGS]
+vu_meter = False
+default_station = darksynth
+now_playing_snapshot = now_playing.json
+profile = {profile}
+
+[HISTORY]
+enabled = True
+database = history.db
+
+[HTTP]
+enabled = True
+host = 127.0.0.1
+port = 0
+"""
+
+
+def rss_mib():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory budget check")
+    parser.add_argument("--hours", type=float, default=8, help="Simulated run time")
+    parser.add_argument("--events-per-second", type=float, default=1.0, help="Simulated feed rate")
+    parser.add_argument("--profile", choices=["full", "lite"], default="lite")
+    parser.add_argument("--rss-budget", type=float, default=64, help="Peak RSS, MiB")
+    parser.add_argument("--growth-budget", type=float, default=1, help="Heap growth after warm-up, MiB")
+    parser.add_argument("--audio", help="Audio file to stream, preferably ADTS AAC")
+    parser.add_argument("--no-audio", action="store_true", help="Leave libvlc out")
+    args = parser.parse_args()
+
+    count = int(args.hours * 3600 * args.events_per_second)
+    records = synthetic_records(count, interval=1 / args.events_per_second)
+    tracks = sum(1 for _, data in records if b"keepalive" not in data)
+    warm_up = tracks // 10
+
+    tracemalloc.start()
+    server = ReplayServer(records, speed=0, timing=False)
+    # Without a file, libvlc still loads and keeps reconnecting to nothing.
+    audio_url = "http://127.0.0.1:1"
+    stream = None
+    if args.audio and not args.no_audio:
+        from stream_server import StreamServer
+
+        stream = StreamServer(args.audio)
+        audio_url = stream.base_url
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, "settings.ini"), "w") as settings:
+        settings.write(SETTINGS.format(url=server.url, audio_url=audio_url, profile=args.profile))
+    os.chdir(workdir)
+    os.environ["NIGHTRIDE_SETTINGS"] = os.path.join(workdir, "settings.ini")
+
+    from NightrideAPI import NightRideAPI
+
+    received = 0
+    warmed_up = threading.Event()
+    done = threading.Event()
+
+    def on_update(station, current):
+        global received
+        received += 1
+        if received == warm_up:
+            warmed_up.set()
+        if received == tracks:
+            done.set()
+
+    api = NightRideAPI(
+        logfile="radio.log", audio=not args.no_audio, use_broker=False, subscribe_all=True
+    )
+    api.add_listener(on_update)
+
+    peak_rss = rss_mib()
+    while not warmed_up.wait(0.1):
+        peak_rss = max(peak_rss, rss_mib())
+    api.history.flush()
+    baseline = tracemalloc.take_snapshot()
+
+    start = time.perf_counter()
+    while not done.wait(0.1):
+        peak_rss = max(peak_rss, rss_mib())
+        if time.perf_counter() - start > 600:
+            print(f"Timed out after {received} of {tracks} events")
+            sys.exit(1)
+    api.history.flush()
+    peak_rss = max(peak_rss, rss_mib())
+    final = tracemalloc.take_snapshot()
+    server.close()
+    if stream is not None:
+        stream.close()
+
+    # The measurement itself is not part of the budget.
+    ignored = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    baseline = baseline.filter_traces(ignored)
+    final = final.filter_traces(ignored)
+
+    growth = sum(stat.size_diff for stat in final.compare_to(baseline, "filename")) / 2**20
+    print(f"profile:     {args.profile}{' without audio' if args.no_audio else ''}")
+    print(f"simulated:   {args.hours:g} h, {tracks} track events")
+    print(f"peak RSS:    {peak_rss:.1f} MiB (budget {args.rss_budget:g})")
+    print(f"heap growth: {growth:.3f} MiB after warm-up (budget {args.growth_budget:g})")
+    print("largest growth:")
+    for stat in final.compare_to(baseline, "lineno")[:5]:
+        print(f"  {stat}")
+
+    over = peak_rss > args.rss_budget or growth > args.growth_budget
+    print("FAIL" if over else "ok")
+    sys.exit(1 if over else 0)
@@ -0,0 +1,112 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from sse_recording import read_recording, synthetic_records
+from sse_replay import ReplayServer
+
+# Throughput and latency of the metadata pipeline, from socket to now_playing.
+#
+# A recorded feed is replayed by a local server, as fast as possible or at a
+# given speed, into a NightRideAPI that decodes every station. Latency is the
+# time from sending the piece that completes an event to the listener seeing it.
+#
+# Usage:
+# python3 benchmarks/metadata_pipeline.py --recording feed.nrsse --speed 0
+# python3 benchmarks/metadata_pipeline.py --events 20000
+
+SETTINGS = """[URLS]
+sse_url = {url}
+audio_stream_base_url = http://127.0.0.1:1
+
+[STATIONS]
+1 = darksynth
+
+[SSE]
+stall_timeout = 30
+
+[SETTINGS]
+vu_meter = False
+default_station = darksynth
+now_playing_snapshot =
+
+[HISTORY]
+enabled = False
+"""
+
+
+def completing_pieces(records):
+    # Index of the piece that completes each track event, in feed order.
+    pieces = []
+    pending = b""
+    for index, (_, data) in enumerate(records):
+        pending += data.replace(b"\r\n", b"\n")
+        *blocks, pending = pending.split(b"\n\n")
+        for block in blocks:
+            if b"data:" in block and b"keepalive" not in block:
+                pieces.append(index)
+    return pieces
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Metadata pipeline benchmark")
+    parser.add_argument("--recording", help="Recording made with tools/sse_record.py")
+    parser.add_argument("--events", type=int, default=20000, help="Synthetic feed size")
+    parser.add_argument("--speed", type=float, default=0, help="Replay speed, 0 for as fast as possible")
+    args = parser.parse_args()
+
+    records = read_recording(args.recording) if args.recording else synthetic_records(args.events)
+    pieces = completing_pieces(records)
+    server = ReplayServer(records, speed=args.speed)
+
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, "settings.ini"), "w") as settings:
+        settings.write(SETTINGS.format(url=server.url))
+    os.chdir(workdir)
+    os.environ["NIGHTRIDE_SETTINGS"] = os.path.join(workdir, "settings.ini")
+
+    from NightrideAPI import NightRideAPI
+
+    received = []
+    done = threading.Event()
+
+    def on_update(station, current):
+        received.append(time.perf_counter())
+        if len(received) == len(pieces):
+            done.set()
+
+    start_cpu = time.process_time()
+    api = NightRideAPI(logfile="radio.log", audio=False, use_broker=False, subscribe_all=True)
+    api.add_listener(on_update)
+    duration = records[-1][0] / args.speed if args.speed else 0
+    finished = done.wait(duration + 60)
+    cpu = time.process_time() - start_cpu
+    server.close()
+
+    if not received:
+        print("No events reached now_playing")
+        sys.exit(1)
+
+    latencies = sorted(
+        (at - server.sent[piece]) * 1000 for at, piece in zip(received, pieces)
+    )
+    elapsed = received[-1] - server.sent[0]
+    print(f"events:     {len(received)} of {len(pieces)}{'' if finished else ' (timed out)'}")
+    print(f"throughput: {len(received) / elapsed:.0f} events/s")
+    print(f"cpu:        {cpu / len(received) * 1e6:.1f} us/event")
+    print(
+        f"latency:    p50 {percentile(latencies, 0.5):.3f} ms  "
+        f"p99 {percentile(latencies, 0.99):.3f} ms  max {latencies[-1]:.3f} ms"
+    )
+    sys.exit(0 if finished else 1)
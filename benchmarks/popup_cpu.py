@@ -0,0 +1,141 @@
+import argparse
+import fcntl
+import os
+import pty
+import select
+import signal
+import struct
+import sys
+import tempfile
+import termios
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from sse_recording import synthetic_records
+from sse_replay import ReplayServer
+
+# CPU use of an idle interface, in the main view and with each popup open.
+#
+# Radio.py runs in a pseudo terminal, fed by a local replay of a synthetic
+# metadata feed. The popups are opened with their F keys, and the CPU time of
+# the process is read from /proc over {seconds} in each view. Exits with 1 if
+# any view uses more than --max-cpu percent of one core.
+#
+# Usage:
+# python3 benchmarks/popup_cpu.py --seconds 10
+# python3 benchmarks/popup_cpu.py --renderers ansi --max-cpu 5
+
+SETTINGS = """[DISPLAY]
+renderer = {renderer}
+
+[ADDONS]
+lcd1602 = False
+
+[URLS]
+sse_url = {url}
+audio_stream_base_url = http://127.0.0.1:1
+
+[STATIONS]
+1 = darksynth
+2 = chillsynth
+
+[SETTINGS]
+vu_meter = False
+default_station = darksynth
+now_playing_snapshot =
+
+[HISTORY]
+enabled = False
+
+[BROKER]
+socket =
+"""
+
+# Key to press to get to each view, as an xterm sends it
+VIEWS = [("main", b""), ("about", b"\x1bOP"), ("select", b"\x1bOQ")]
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as stat_file:
+        # The command may hold spaces, so count fields from its closing parenthesis.
+        fields = stat_file.read().rsplit(")", 1)[1].split()
+    utime, stime = int(fields[11]), int(fields[12])
+    return (utime + stime) / os.sysconf("SC_CLK_TCK")
+
+
+def drain(fd, seconds):
+    # Reads the terminal output, so the interface never blocks on a full pty.
+    output = b""
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        ready, _, _ = select.select([fd], [], [], 0.05)
+        if ready:
+            try:
+                output += os.read(fd, 65536)
+            except OSError:
+                break
+    return output
+
+
+def measure(renderer, url, seconds, settle=2.0, rows=12, cols=52):
+    workdir = tempfile.mkdtemp()
+    settings = os.path.join(workdir, "settings.ini")
+    with open(settings, "w") as settings_file:
+        settings_file.write(SETTINGS.format(renderer=renderer, url=url))
+
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.chdir(workdir)
+        os.environ["TERM"] = "xterm-256color"
+        os.environ["NIGHTRIDE_SETTINGS"] = settings
+        os.execv(sys.executable, [sys.executable, os.path.join(ROOT, "Radio.py")])
+
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+    results = {}
+    try:
+        # Startup is not idle. Let it finish first.
+        if b"NIGHTRIDE" not in drain(fd, 5):
+            return None
+        drain(fd, settle)
+        for view, key in VIEWS:
+            if key:
+                os.write(fd, key)
+                drain(fd, settle)
+            before = cpu_seconds(pid)
+            drain(fd, seconds)
+            results[view] = 100 * (cpu_seconds(pid) - before) / seconds
+            if key:
+                # The same key closes the popup again.
+                os.write(fd, key)
+                drain(fd, settle)
+    finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        os.close(fd)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Idle CPU use per view")
+    parser.add_argument("--renderers", default="curses,ansi")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--max-cpu", type=float, default=10.0, help="Percent of one core")
+    args = parser.parse_args()
+
+    server = ReplayServer(synthetic_records(100000), speed=1, loop=True)
+    failed = False
+    for renderer in args.renderers.split(","):
+        results = measure(renderer, server.url, args.seconds)
+        if results is None:
+            print(f"{renderer:<7} no frame")
+            failed = True
+            continue
+        for view, cpu in results.items():
+            over = cpu > args.max_cpu
+            failed = failed or over
+            print(f"{renderer:<7} {view:<7} {cpu:6.1f}% CPU{'  OVER BUDGET' if over else ''}")
+    server.close()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from SharedState import READ_TIMEOUT, SLOTS_OFFSET, STATUS_OFFSET, SharedState
+
+# Recovery check for SharedState, when a writer dies mid-write.
+#
+# A forked writer starts writing a slot and the status record, and exits
+# without finishing, so both sequences are left odd. Then:
+#
+# readers   read_slot, read_changed and read_status return within a bound
+# attach    a new process attaches, as a restarted worker does
+# recover   the restarted writer makes the records readable at once again,
+#           and its next writes are read back whole
+#
+# Exits with status 1 if any check fails.
+#
+# Usage:
+# python3 benchmarks/shared_state_recovery.py
+
+BOUND = READ_TIMEOUT * 20
+
+
+def die_mid_write(state):
+    pid = os.fork()
+    if pid == 0:
+        state.begin_write(SLOTS_OFFSET)
+        state.begin_write(STATUS_OFFSET)
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+
+def timed(call):
+    started = time.monotonic()
+    value = call()
+    return value, time.monotonic() - started
+
+
+def check(failures, name, ok, detail=""):
+    print(f"{name:<28} {'ok' if ok else 'FAIL'}  {detail}")
+    if not ok:
+        failures.append(name)
+
+
+if __name__ == "__main__":
+    failures = []
+    state = SharedState()
+    try:
+        state.write_station("darksynth", "Artist", "Song", time.time())
+        state.write_status(1.5, False, 80, "darksynth")
+        die_mid_write(state)
+        slot_sequence = state.read_slot(0)[0]
+        check(failures, "slot left odd", slot_sequence % 2 == 1, f"sequence {slot_sequence}")
+
+        record, took = timed(lambda: state.read_slot(0))
+        check(failures, "read_slot returns", took < BOUND, f"{took * 1000:.1f} ms, {record[1:3]}")
+        seen = {}
+        changed, took = timed(lambda: state.read_changed(seen))
+        check(failures, "read_changed returns", took < BOUND, f"{took * 1000:.1f} ms")
+        _, took = timed(lambda: state.read_changed(seen))
+        check(failures, "read_changed again is idle", took < BOUND / 20, f"{took * 1000:.2f} ms")
+        status, took = timed(state.read_status)
+        check(failures, "read_status returns", took < BOUND, f"{took * 1000:.1f} ms, {status}")
+
+        attached, took = timed(lambda: SharedState(name=state.name))
+        check(
+            failures,
+            "attach returns",
+            took < BOUND * 2 and "darksynth" in attached.slots,
+            f"{took * 1000:.1f} ms",
+        )
+
+        attached.recover(status=True, slots=True)
+        _, took = timed(state.read_status)
+        check(failures, "recovered status reads", took < READ_TIMEOUT, f"{took * 1000:.2f} ms")
+        attached.write_station("darksynth", "Next", "Track", time.time())
+        attached.write_status(2.0, True, 60, "darksynth")
+        record = state.read_slot(0)
+        check(
+            failures,
+            "writes after recovery",
+            record[0] % 2 == 0 and record[2:4] == ("Next", "Track"),
+            f"sequence {record[0]}",
+        )
+        status = state.read_status()
+        check(failures, "status after recovery", status[1:] == (True, 60, "darksynth"), f"{status}")
+        attached.close()
+    finally:
+        state.close()
+        state.unlink()
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,221 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from memory_budget import rss_mib
+from sse_recording import synthetic_records
+from sse_replay import ReplayServer
+from stream_server import StreamServer
+
+# Soak test of the whole player, for leaks that only show after days.
+#
+# NightRideAPI, the audio backend and a headless RadioInterface run in this
+# process, against local stand-ins: a synthetic feed replayed at {speed}
+# events per second, which ends every {reconnect_every} events so the SSE
+# client reconnects, and, given an audio file, a StreamServer whose
+# connections are dropped now and then. Keys go in through a pipe, to open
+# the popups and change stations.
+#
+# Threads, file descriptors, RSS and the tracemalloc heap are sampled
+# throughout. After warm-up, the average of the last third of the samples is
+# compared with the first third. Growth over budget in any of them fails the
+# run, with exit status 1.
+#
+# Usage:
+# python3 benchmarks/soak.py --minutes 30
+# python3 benchmarks/soak.py --minutes 240 --audio tone.aac --backend ffmpeg
+
+SETTINGS = """[DISPLAY]
+renderer = ansi
+
+[ADDONS]
+lcd1602 = False
+
+[URLS]
+sse_url = {url}
+audio_stream_base_url = {audio_url}
+
+[STATIONS]
+1 = darksynth
+2 = chillsynth
+
+[AUDIO]
+backend = {backend}
+device = null
+stall_timeout = 2
+
+[SSE]
+stall_timeout = 5
+min_backoff = 0.2
+max_backoff = 1
+
+[SETTINGS]
+vu_meter = True
+default_station = darksynth
+now_playing_snapshot = now_playing.json
+
+[HISTORY]
+enabled = True
+database = history.db
+
+[HTTP]
+enabled = True
+host = 127.0.0.1
+port = 0
+
+[BROKER]
+socket =
+"""
+
+# What the simulated user does, one step per --action-interval, in a loop.
+# Keys as a terminal sends them. None drops the audio connections instead.
+ACTIONS = [
+    "\x1bOQ\x1b[B\r",  # next station, through the selector
+    "\x1bOP",  # about
+    "\r",  # close about
+    "-+",  # volume
+    "\x1bOQabc\x7f\x7f\x7f\x1bOQ",  # filter the selector, and close it
+    None,
+]
+
+# Budgets for growth after warm-up
+BUDGETS = {"threads": 2, "fds": 4, "rss": 8.0, "heap": 2.0}
+UNITS = {"threads": "", "fds": "", "rss": " MiB", "heap": " MiB"}
+
+
+def sample():
+    return {
+        "threads": len(os.listdir("/proc/self/task")),
+        "fds": len(os.listdir("/proc/self/fd")),
+        "rss": rss_mib(),
+        "heap": tracemalloc.get_traced_memory()[0] / 2**20,
+    }
+
+
+def trend(samples, name):
+    # Growth from the first third of the samples to the last, and the slope per hour
+    values = [s[name] for s in samples]
+    third = max(1, len(values) // 3)
+    growth = statistics.fmean(values[-third:]) - statistics.fmean(values[:third])
+    times = [s["time"] for s in samples]
+    slope = 0.0
+    if len(set(times)) > 1:
+        slope = statistics.linear_regression(times, values).slope * 3600
+    return growth, slope
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Soak and leak check of the whole player")
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--speed", type=float, default=20, help="Feed events per second")
+    parser.add_argument("--reconnect-every", type=int, default=500, help="Events per SSE connection")
+    parser.add_argument("--audio", help="Audio file to stream, preferably ADTS AAC")
+    parser.add_argument("--backend", choices=["vlc", "ffmpeg"], default="vlc")
+    parser.add_argument("--sample-interval", type=float, default=5)
+    parser.add_argument("--action-interval", type=float, default=2)
+    parser.add_argument("--warm-up", type=float, default=0.2, help="Share of the run not judged")
+    for name, budget in BUDGETS.items():
+        parser.add_argument(f"--{name}-budget", type=float, default=budget)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    feed = ReplayServer(
+        synthetic_records(args.reconnect_every), speed=args.speed, timing=False
+    )
+    stream = None
+    audio_url = "http://127.0.0.1:1"
+    if args.audio:
+        stream = StreamServer(args.audio)
+        audio_url = stream.base_url
+
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, "settings.ini"), "w") as settings:
+        settings.write(SETTINGS.format(url=feed.url, audio_url=audio_url, backend=args.backend))
+    os.chdir(workdir)
+    os.environ["NIGHTRIDE_SETTINGS"] = os.path.join(workdir, "settings.ini")
+
+    from NightrideAPI import SSE_EVENTS, SSE_RECONNECTS
+    from Radio import COLOR_PAIRS, RadioInterface
+    from Screen import AnsiScreen
+
+    # Headless: keys come from a pipe, and frames go to /dev/null.
+    keys_in, keys_out = os.pipe()
+    screen = AnsiScreen(COLOR_PAIRS, fd_in=keys_in, fd_out=os.open(os.devnull, os.O_WRONLY))
+    radio_thread = threading.Thread(
+        target=RadioInterface, kwargs={"logfile": "radio.log", "screen": screen}
+    )
+    radio_thread.daemon = True
+    radio_thread.start()
+
+    duration = args.minutes * 60
+    warm_up = duration * args.warm_up
+    start = time.perf_counter()
+    next_sample = start
+    next_action = start + args.action_interval
+    action = 0
+    samples = []
+    baseline = None
+    while time.perf_counter() - start < duration:
+        if not radio_thread.is_alive():
+            print("The interface stopped. See radio.log in", workdir)
+            sys.exit(1)
+        now = time.perf_counter()
+        if now >= next_action:
+            keys = ACTIONS[action % len(ACTIONS)]
+            if keys is not None:
+                os.write(keys_out, keys.encode("utf-8"))
+            elif stream:
+                stream.inject("drop")
+            action += 1
+            next_action += args.action_interval
+        if now >= next_sample:
+            if baseline is None and now - start >= warm_up:
+                # Taken before the first judged sample, so its own size is the same in all of them.
+                baseline = tracemalloc.take_snapshot()
+            if baseline is not None:
+                samples.append(dict(sample(), time=now - start))
+            next_sample += args.sample_interval
+        time.sleep(0.05)
+
+    final = tracemalloc.take_snapshot()
+    print(f"ran:         {args.minutes:g} min, {SSE_EVENTS.value} events, {SSE_RECONNECTS.value} reconnects")
+    if stream:
+        print(f"audio:       {stream.connections} stream connections")
+    if len(samples) < 3:
+        print("Too few samples after warm-up to judge. Run longer.")
+        sys.exit(1)
+
+    over = False
+    for name in BUDGETS:
+        budget = getattr(args, f"{name}_budget")
+        growth, slope = trend(samples, name)
+        last = samples[-1][name]
+        unit = UNITS[name]
+        failed = growth > budget
+        over = over or failed
+        print(
+            f"{name + ':':<12} {last:8.1f}{unit}, {growth:+.2f}{unit} growth (budget {budget:g}),"
+            f" {slope:+.2f}{unit}/h{'  OVER BUDGET' if failed else ''}"
+        )
+
+    # The measurement itself is not part of the heap.
+    ignored = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, rss_mib.__code__.co_filename),
+    ]
+    print("largest heap growth:")
+    for stat in final.filter_traces(ignored).compare_to(baseline.filter_traces(ignored), "lineno")[:5]:
+        print(f"  {stat}")
+
+    print("FAIL" if over else "ok")
+    sys.exit(1 if over else 0)
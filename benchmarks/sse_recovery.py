@@ -0,0 +1,123 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from sse_fault_server import FaultSSEServer
+
+# Recovery-time check for the SSE client.
+#
+# NightRideAPI reads a local fault injection server. Every fault has to be
+# recovered from, with fresh events in now_playing again, within its bound:
+#
+# drop      backoff
+# refuse    backoff, growing over the refused attempts
+# stall     stall timeout + backoff
+# truncate  stall timeout + backoff
+#
+# Exits with status 1 if any bound is exceeded.
+#
+# Usage:
+# python3 benchmarks/sse_recovery.py --stall-timeout 1 --rounds 3
+
+SETTINGS = """[URLS]
+sse_url = {url}
+audio_stream_base_url = http://127.0.0.1:1
+
+[STATIONS]
+1 = darksynth
+
+[SSE]
+stall_timeout = {stall_timeout}
+min_backoff = {min_backoff}
+max_backoff = {max_backoff}
+
+[SETTINGS]
+vu_meter = False
+default_station = darksynth
+now_playing_snapshot =
+"""
+
+
+def latest(api):
+    current = api.now_playing.get("darksynth")
+    return int(current.song) if current else 0
+
+
+def wait_for_events(api, after, timeout):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if latest(api) > after:
+            return time.perf_counter()
+        time.sleep(0.002)
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SSE fault recovery check")
+    parser.add_argument("--stall-timeout", type=float, default=1.0)
+    parser.add_argument("--min-backoff", type=float, default=0.1)
+    parser.add_argument("--max-backoff", type=float, default=1.0)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    server = FaultSSEServer(interval=0.02)
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, "settings.ini"), "w") as settings:
+        settings.write(
+            SETTINGS.format(
+                url=server.url,
+                stall_timeout=args.stall_timeout,
+                min_backoff=args.min_backoff,
+                max_backoff=args.max_backoff,
+            )
+        )
+    os.chdir(workdir)
+    os.environ["NIGHTRIDE_SETTINGS"] = os.path.join(workdir, "settings.ini")
+
+    from NightrideAPI import NightRideAPI
+
+    api = NightRideAPI(logfile="radio.log", audio=False, use_broker=False)
+    if wait_for_events(api, 0, 5) is None:
+        print("No events from the fault server")
+        sys.exit(1)
+
+    # Worst case backoff is the full ceiling of every attempt, plus connect time.
+    refused = 3
+    refuse_backoff = sum(
+        min(args.max_backoff, args.min_backoff * 2**i) for i in range(refused + 1)
+    )
+    bounds = {
+        "drop": args.min_backoff + 0.5,
+        "refuse": refuse_backoff + 0.5,
+        "stall": args.stall_timeout + args.min_backoff + 0.5,
+        "truncate": args.stall_timeout + args.min_backoff + 0.5,
+    }
+
+    failed = False
+    for fault, bound in bounds.items():
+        times = []
+        for _ in range(args.rounds):
+            time.sleep(0.2)
+            server.inject(fault, refusals=refused)
+            while server.fault_at is None:
+                time.sleep(0.001)
+            # Recovered once an event sent after the fault shows up in now_playing.
+            recovered = wait_for_events(api, server.fault_sequence, bound * 3)
+            times.append(None if recovered is None else recovered - server.fault_at)
+
+        worst = max(t if t is not None else float("inf") for t in times)
+        ok = worst <= bound
+        failed = failed or not ok
+        print(
+            f"{fault:<9} worst {worst:6.3f}s  bound {bound:6.3f}s  "
+            f"{'ok' if ok else 'FAIL'}  ({', '.join(f'{t:.3f}' if t else '-' for t in times)})"
+        )
+
+    server.close()
+    sys.exit(1 if failed else 0)
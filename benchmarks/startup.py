@@ -0,0 +1,122 @@
+import argparse
+import configparser
+import fcntl
+import os
+import pty
+import select
+import signal
+import struct
+import subprocess
+import sys
+import termios
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+# Startup benchmark for the player.
+#
+# import time:         python -X importtime for "import Radio"
+# time-to-first-frame: Radio.py started in a pseudo terminal, until the frame is drawn
+# time-to-first-audio: AudioPlayer created, until libvlc reports playback progress
+#
+# Usage:
+# python3 benchmarks/startup.py [--skip-audio]
+
+EAGER_SUSPECTS = ["vlc", "av", "numpy", "alsaaudio", "sseclient", "urllib3", "smbus", "RGB1602"]
+
+
+def import_time():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import Radio"],
+        cwd=ROOT,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        modules.append((int(cumulative), int(own), name.rstrip()))
+    return modules
+
+
+def first_frame(timeout=10.0):
+    start = time.perf_counter()
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.chdir(ROOT)
+        os.environ["TERM"] = "xterm-256color"
+        os.execv(sys.executable, [sys.executable, "Radio.py"])
+
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", 12, 52, 0, 0))
+    output = b""
+    elapsed = None
+    try:
+        while time.perf_counter() - start < timeout:
+            ready, _, _ = select.select([fd], [], [], 0.05)
+            if ready:
+                try:
+                    output += os.read(fd, 4096)
+                except OSError:
+                    break
+                if b"NIGHTRIDE" in output:
+                    elapsed = time.perf_counter() - start
+                    break
+    finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        os.close(fd)
+    return elapsed
+
+
+def first_audio(timeout=30.0):
+    from AudioPlayer import AudioPlayer
+
+    config = configparser.ConfigParser()
+    config.read(os.path.join(ROOT, "settings.ini"))
+
+    start = time.perf_counter()
+    player = AudioPlayer(
+        base_url=config["URLS"]["audio_stream_base_url"], logfile=os.devnull
+    )
+    player.play(config["SETTINGS"]["default_station"])
+    constructed = time.perf_counter() - start
+
+    if not player.ready.wait(timeout):
+        return constructed, None, None
+    vlc_ready = time.perf_counter() - start
+
+    while time.perf_counter() - start < timeout:
+        if player.player.get_time() > 0:
+            elapsed = time.perf_counter() - start
+            player.stop()
+            return constructed, vlc_ready, elapsed
+        time.sleep(0.01)
+    player.stop()
+    return constructed, vlc_ready, None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Player startup benchmark")
+    parser.add_argument("--skip-audio", action="store_true")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    modules = import_time()
+    total = next((c for c, _, name in modules if name.strip() == "Radio"), None)
+    print(f"import Radio:         {total / 1000:.1f} ms" if total else "import Radio: failed")
+    for cumulative, own, name in sorted(modules, reverse=True)[: args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    eager = [n.strip() for _, _, n in modules if n.strip() in EAGER_SUSPECTS]
+    print(f"  eagerly imported:   {', '.join(eager) if eager else 'none'}")
+
+    frame = first_frame()
+    print(f"time-to-first-frame:  {frame * 1000:.1f} ms" if frame else "time-to-first-frame: no frame")
+
+    if not args.skip_audio:
+        constructed, vlc_ready, audio = first_audio()
+        print(f"AudioPlayer():        {constructed * 1000:.1f} ms")
+        print(f"libvlc ready:         {vlc_ready * 1000:.1f} ms" if vlc_ready else "libvlc ready: failed")
+        print(f"time-to-first-audio:  {audio * 1000:.1f} ms" if audio else "time-to-first-audio: no audio")
@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+# CPU cost of handling metadata events, with and without a subscription filter.
+#
+# The events mimic the real feed: every station, with rekt/rektory titles in
+# "artist - title" form. With the filter, only --subscribe stations are decoded.
+#
+# Usage:
+# python3 benchmarks/subscription_filter.py --events 1000 --subscribe darksynth
+
+STATIONS = [
+    "nightride", "chillsynth", "darksynth", "horrorsynth", "spacesynth",
+    "datawave", "ebsm", "rektory", "rekt",
+]
+
+SETTINGS = """[URLS]
+sse_url = http://127.0.0.1:1/meta
+audio_stream_base_url = http://127.0.0.1:1
+
+[STATIONS]
+{stations}
+
+[SSE]
+stall_timeout = 90
+min_backoff = 60
+max_backoff = 60
+subscribe =
+
+[SETTINGS]
+vu_meter = False
+default_station = darksynth
+now_playing_snapshot =
+"""
+
+
+def make_events(count):
+    events = []
+    for i in range(count):
+        station = random.choice(STATIONS)
+        if "rekt" in station:
+            track = {"station": station, "title": f"Artist {i} - Song {i}"}
+        else:
+            track = {"station": station, "artist": f"Artist {i}", "title": f"Song {i}"}
+        track["album"] = "Album"
+        events.append(json.dumps([track]))
+        if i % 10 == 0:
+            events.append("keepalive")
+    return events
+
+
+def cpu_per_events(api, events, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        for data in events:
+            api.handle_event(data)
+    return (time.process_time() - start) / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Subscription filter benchmark")
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--subscribe", default="darksynth")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, "settings.ini"), "w") as settings:
+        settings.write(
+            SETTINGS.format(
+                stations="\n".join(f"{i + 1} = {s}" for i, s in enumerate(STATIONS))
+            )
+        )
+    os.chdir(workdir)
+    os.environ["NIGHTRIDE_SETTINGS"] = os.path.join(workdir, "settings.ini")
+
+    from NightrideAPI import NightRideAPI
+
+    api = NightRideAPI(logfile="radio.log", audio=False, use_broker=False)
+    events = make_events(args.events)
+
+    api.subscriptions = None
+    unfiltered = cpu_per_events(api, events, args.repeat)
+    api.subscriptions = set(args.subscribe.split(","))
+    filtered = cpu_per_events(api, events, args.repeat)
+
+    per = 1000 / len(events)
+    print(f"events:     {len(events)} ({args.events} tracks + keepalives)")
+    print(f"all:        {unfiltered * per * 1000:.2f} ms CPU per 1000 events")
+    print(f"filtered:   {filtered * per * 1000:.2f} ms CPU per 1000 events ({args.subscribe})")
+    print(f"saving:     {(1 - filtered / unfiltered) * 100:.0f}%")
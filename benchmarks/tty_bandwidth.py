@@ -0,0 +1,117 @@
+import argparse
+import fcntl
+import os
+import pty
+import select
+import signal
+import struct
+import sys
+import tempfile
+import termios
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from sse_recording import synthetic_records
+from sse_replay import ReplayServer
+
+# Bytes per second the interface writes to its terminal, per renderer.
+#
+# Radio.py runs in a pseudo terminal, fed by a local replay of a synthetic
+# metadata feed, with the VU meter on. Everything it writes after the first
+# frame is counted for {seconds}.
+#
+# Usage:
+# python3 benchmarks/tty_bandwidth.py --seconds 10
+# python3 benchmarks/tty_bandwidth.py --renderers ansi --byte-budget 512
+
+SETTINGS = """[DISPLAY]
+renderer = {renderer}
+byte_budget = {byte_budget}
+
+[ADDONS]
+lcd1602 = False
+
+[URLS]
+sse_url = {url}
+audio_stream_base_url = http://127.0.0.1:1
+
+[STATIONS]
+1 = darksynth
+2 = chillsynth
+
+[SETTINGS]
+vu_meter = True
+default_station = darksynth
+now_playing_snapshot =
+
+[HISTORY]
+enabled = False
+
+[BROKER]
+socket =
+"""
+
+
+def measure(renderer, url, seconds, byte_budget, rows=12, cols=52):
+    workdir = tempfile.mkdtemp()
+    settings = os.path.join(workdir, "settings.ini")
+    with open(settings, "w") as settings_file:
+        settings_file.write(SETTINGS.format(renderer=renderer, url=url, byte_budget=byte_budget))
+
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.chdir(workdir)
+        os.environ["TERM"] = "xterm-256color"
+        os.environ["NIGHTRIDE_SETTINGS"] = settings
+        os.execv(sys.executable, [sys.executable, os.path.join(ROOT, "Radio.py")])
+
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+    output = b""
+    counted = 0
+    started = None
+    try:
+        deadline = time.perf_counter() + 15
+        while time.perf_counter() < deadline:
+            ready, _, _ = select.select([fd], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(fd, 65536)
+            except OSError:
+                break
+            if started is None:
+                output += data
+                if b"NIGHTRIDE" in output:
+                    # Count from the first full frame on.
+                    started = time.perf_counter()
+                    deadline = started + seconds
+            else:
+                counted += len(data)
+    finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        os.close(fd)
+    if started is None:
+        return None
+    return counted / seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Terminal bandwidth per renderer")
+    parser.add_argument("--renderers", default="curses,ansi")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--byte-budget", type=int, default=2048)
+    args = parser.parse_args()
+
+    # A track change somewhere every second
+    server = ReplayServer(synthetic_records(100000), speed=1, loop=True)
+    for renderer in args.renderers.split(","):
+        rate = measure(renderer, server.url, args.seconds, args.byte_budget)
+        if rate is None:
+            print(f"{renderer:<7} no frame")
+        else:
+            print(f"{renderer:<7} {rate:8.0f} bytes/s")
+    server.close()
@@ -14,6 +14,10 @@ import os
 # self.logger.log.debug("This is debug")
 # self.logger.log.info("This is info")
 
+# One handler per log file, shared by every module logging to it. Without
+# this, each module, and each instance of a class, opened the file again.
+file_handlers = {}
+
 
 class Logger:
     def __init__(
@@ -49,9 +53,16 @@ class Logger:
             datefmt="%H:%M:%S",
         )
 
-        fileHandler = logging.FileHandler(self.log_file)
-        fileHandler.setFormatter(formatter)
-        fileHandler.setLevel(self.log_level)
+        fileHandler = file_handlers.get(os.path.abspath(self.log_file))
+        if fileHandler is None:
+            fileHandler = logging.FileHandler(self.log_file)
+            fileHandler.setFormatter(formatter)
+            file_handlers[os.path.abspath(self.log_file)] = fileHandler
+        # The most verbose module decides what reaches the file. Each logger
+        # filters by its own level first.
+        fileHandler.setLevel(min(fileHandler.level or self.log_level, self.log_level))
+        if fileHandler in self.log.handlers:
+            return
         self.log.addHandler(fileHandler)
         self.log.info(f"Initializing {self.module_name} module")
         self.log.info(f"Logging to [{self.log_file}] at level [{self.log_level_name}]")
@@ -62,6 +73,8 @@ class Logger:
             datefmt="%H:%M:%S",
         )
 
+        if any(type(handler) is logging.StreamHandler for handler in self.log.handlers):
+            return
         streamHandler = logging.StreamHandler()
         streamHandler.setFormatter(formatter)
         streamHandler.setLevel(self.log_level)
@@ -70,6 +83,9 @@ class Logger:
         self.log.info(f"Logging to [{self.log_file}] at level [{self.log_level_name}]")
 
     def delete_old_logfile(self):
+        # A file already open in this process belongs to this run.
+        if os.path.abspath(self.log_file) in file_handlers:
+            return
         if os.path.exists(self.log_file):
             os.remove(self.log_file)
         else:
@@ -0,0 +1,156 @@
+import argparse
+import json
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A local stand-in for the nightride.fm metadata feed, with fault injection.
+#
+# It serves track events on /meta every {interval} seconds, plus keepalives.
+# Setting {fault} makes the next delivery fail:
+#
+# "drop"     close the connection without a word
+# "stall"    keep the connection open, and send nothing
+# "truncate" send half an event, then stall
+# "refuse"   answer new connections with 503 for {refusals} attempts
+#
+# Usage:
+# python3 tools/sse_fault_server.py --port 8742
+# server = FaultSSEServer(); server.fault = "stall"
+
+
+class FaultSSEHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        feed = self.server.feed
+        if feed.take_refusal():
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        # Chunked, like the real feed. Clients read close-delimited bodies in large blocks.
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.close_connection = True
+        feed.connected()
+
+        try:
+            while not feed.stopped.is_set():
+                fault = feed.take_fault()
+                if fault == "drop":
+                    # No FIN, no goodbye: reset the connection.
+                    self.connection.setsockopt(
+                        socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+                    )
+                    return
+                if fault == "truncate":
+                    self.write_chunk(b'data: [{"station":"darksynth","art')
+                    fault = "stall"
+                if fault == "stall":
+                    # Hold the connection until the client gives up on it.
+                    self.rfile.read(1)
+                    return
+
+                self.write_chunk(feed.next_event())
+                time.sleep(feed.interval)
+        except OSError:
+            pass
+
+    def write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FaultSSEServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, interval: float = 0.05):
+        self.interval = interval
+        self.fault = None
+        self.refusals = 0
+        self.connections = 0
+        self.sequence = 0
+        # When the last fault hit, and the last event sent before it
+        self.fault_at = None
+        self.fault_sequence = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+        self.httpd = ThreadingHTTPServer((host, port), FaultSSEHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.feed = self
+        self.port = self.httpd.server_address[1]
+        self.url = f"http://{host}:{self.port}/meta"
+
+        server_thread = threading.Thread(target=self.httpd.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+
+    def inject(self, fault: str, refusals: int = 3):
+        with self.lock:
+            self.fault_at = None
+            if fault == "refuse":
+                self.refusals = refusals
+                self.fault = "drop"
+            else:
+                self.fault = fault
+
+    def take_fault(self):
+        with self.lock:
+            fault, self.fault = self.fault, None
+            if fault:
+                self.fault_at = time.perf_counter()
+                self.fault_sequence = self.sequence
+            return fault
+
+    def take_refusal(self):
+        with self.lock:
+            if self.refusals:
+                self.refusals -= 1
+                return True
+            return False
+
+    def connected(self):
+        with self.lock:
+            self.connections += 1
+
+    def next_event(self):
+        with self.lock:
+            self.sequence += 1
+            sequence = self.sequence
+        if sequence % 10 == 0:
+            return b"data: keepalive\n\n"
+        track = [{"station": "darksynth", "artist": "Fault Server", "title": str(sequence)}]
+        return b"data: " + json.dumps(track).encode("utf-8") + b"\n\n"
+
+    def close(self):
+        self.stopped.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SSE server with fault injection")
+    parser.add_argument("--port", type=int, default=8742)
+    parser.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    server = FaultSSEServer(port=args.port, interval=args.interval)
+    print(f"Serving {server.url}. Type drop, stall, truncate or refuse to inject a fault.")
+    try:
+        while True:
+            fault = input("> ").strip()
+            if fault in ("drop", "stall", "truncate", "refuse"):
+                server.inject(fault)
+    except (EOFError, KeyboardInterrupt):
+        server.close()
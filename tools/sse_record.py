@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sse_recording import RecordingWriter, synthetic_records
+
+# Records the raw metadata feed to a file, for sse_replay.py and the benchmarks.
+#
+# Usage:
+# python3 tools/sse_record.py feed.nrsse --seconds 3600
+# python3 tools/sse_record.py feed.nrsse --synthetic 10000
+
+
+def record(url, path, seconds):
+    import urllib3
+
+    http = urllib3.PoolManager(retries=False, timeout=urllib3.Timeout(connect=10, read=None))
+    response = http.request(
+        "GET", url, preload_content=False, headers={"Accept": "text/event-stream"}
+    )
+    writer = RecordingWriter(path)
+    start = time.perf_counter()
+    pieces = 0
+    try:
+        # read1() hands over whatever has arrived, so the pieces match the socket reads.
+        while seconds is None or time.perf_counter() - start < seconds:
+            data = response.read1(65536)
+            if not data:
+                break
+            writer.write(time.perf_counter() - start, data)
+            pieces += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+        response.release_conn()
+    return pieces
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record the SSE metadata feed")
+    parser.add_argument("path", help="Recording to write")
+    parser.add_argument("--url", help="Feed to record. Defaults to sse_url of settings.ini")
+    parser.add_argument("--seconds", type=float, help="Stop after this long")
+    parser.add_argument("--synthetic", type=int, help="Write N synthetic events instead")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        writer = RecordingWriter(args.path)
+        for offset, data in synthetic_records(args.synthetic):
+            writer.write(offset, data)
+        writer.close()
+        print(f"Wrote {args.synthetic} synthetic events to {args.path}")
+    else:
+        from Config import get_config
+
+        url = args.url or get_config().sse_url
+        print(f"Recording {url} to {args.path}. Ctrl+C to stop.")
+        print(f"Recorded {record(url, args.path, args.seconds)} pieces")
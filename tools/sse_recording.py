@@ -0,0 +1,77 @@
+import json
+import random
+import struct
+
+# File format of recorded SSE feeds.
+#
+# A recording is the raw byte stream of the feed, as it arrived, cut into
+# the pieces the socket delivered. Each piece is stored with its arrival time:
+#
+#   b"NRSSE1\n"
+#   repeated: <float64 seconds since start><uint32 length><length bytes>
+#
+# All little endian. Replaying the pieces with their timing reproduces the feed,
+# including how events were split across reads.
+
+MAGIC = b"NRSSE1\n"
+RECORD = struct.Struct("<dI")
+
+STATIONS = [
+    "nightride", "chillsynth", "darksynth", "horrorsynth", "spacesynth",
+    "datawave", "ebsm", "rektory", "rekt",
+]
+
+
+class RecordingWriter:
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+
+    def write(self, offset: float, data: bytes):
+        self.file.write(RECORD.pack(offset, len(data)))
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+
+def read_recording(path: str):
+    # [(seconds since start, bytes)]
+    with open(path, "rb") as recording:
+        if recording.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an SSE recording")
+        records = []
+        while True:
+            header = recording.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return records
+            offset, length = RECORD.unpack(header)
+            records.append((offset, recording.read(length)))
+
+
+def event_payloads(records):
+    # The data of every event in the recording, in order, keepalives included.
+    stream = b"".join(data for _, data in records)
+    payloads = []
+    for block in stream.replace(b"\r\n", b"\n").split(b"\n\n"):
+        lines = [line[5:].lstrip() for line in block.split(b"\n") if line.startswith(b"data:")]
+        if lines:
+            payloads.append(b"\n".join(lines).decode("utf-8"))
+    return payloads
+
+
+def synthetic_records(count: int, interval: float = 1.0, keepalive_every: int = 10):
+    # A feed shaped like the real one, for when there is no recording at hand.
+    records = []
+    for i in range(count):
+        if i % keepalive_every == keepalive_every - 1:
+            data = "keepalive"
+        else:
+            station = random.choice(STATIONS)
+            if "rekt" in station:
+                track = {"station": station, "title": f"Artist {i % 300} - Song {i}"}
+            else:
+                track = {"station": station, "artist": f"Artist {i % 300}", "title": f"Song {i}"}
+            data = json.dumps([track])
+        records.append((i * interval, f"data: {data}\n\n".encode("utf-8")))
+    return records
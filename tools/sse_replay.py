@@ -0,0 +1,98 @@
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sse_recording import read_recording
+
+# Replays a recorded SSE feed on /meta, to every client that connects.
+#
+# speed 1 keeps the recorded timing, speed 10 plays ten times faster, and
+# speed 0 sends everything as fast as the client reads it. The send time of
+# every piece is kept in {sent} unless timing=False, for measuring latency in
+# the same process.
+#
+# Usage:
+# python3 tools/sse_replay.py feed.nrsse --port 8743 --speed 0
+# server = ReplayServer(records, speed=0)
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        replay = self.server.replay
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.close_connection = True
+
+        try:
+            while True:
+                start = time.perf_counter()
+                for offset, data in replay.records:
+                    if replay.speed:
+                        delay = start + offset / replay.speed - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    self.wfile.flush()
+                    if replay.timing:
+                        replay.sent.append(time.perf_counter())
+                if not replay.loop:
+                    break
+            self.wfile.write(b"0\r\n\r\n")
+            replay.finished.set()
+        except OSError:
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer:
+    def __init__(self, records, host="127.0.0.1", port=0, speed=1.0, loop=False, timing=True):
+        self.records = records
+        self.speed = speed
+        self.loop = loop
+        self.timing = timing
+        self.sent = []
+        self.finished = threading.Event()
+
+        self.httpd = ThreadingHTTPServer((host, port), ReplayHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.replay = self
+        self.port = self.httpd.server_address[1]
+        self.url = f"http://{host}:{self.port}/meta"
+
+        server_thread = threading.Thread(target=self.httpd.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded SSE feed")
+    parser.add_argument("path", help="Recording made with sse_record.py")
+    parser.add_argument("--port", type=int, default=8743)
+    parser.add_argument("--speed", type=float, default=1.0, help="0 for as fast as possible")
+    parser.add_argument("--loop", action="store_true")
+    args = parser.parse_args()
+
+    # No latency measurement here, so nothing is kept of what was sent. A looped replay runs for days.
+    server = ReplayServer(
+        read_recording(args.path), port=args.port, speed=args.speed, loop=args.loop, timing=False
+    )
+    print(f"Replaying {args.path} on {server.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.close()
@@ -0,0 +1,175 @@
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A local stand-in for the nightride.fm audio streams.
+#
+# Every /<station>.m4a plays the same file, looped, paced to {rate} bytes per
+# second after an initial {burst}, like an Icecast server. Loop an ADTS AAC
+# file, which can be cut and joined anywhere, e.g. one made with
+#   ffmpeg -f lavfi -i sine=frequency=440:duration=30 -c:a aac -b:a 128k -f adts tone.aac
+# Lowering {rate} below the bitrate of the file starves the players, as a
+# congested link would. inject() fails the connections open at the time:
+#
+# "drop"   close them
+# "stall"  keep them open, and send nothing more
+#
+# New connections are served normally.
+#
+# {variants} serve other files, at their own rate, for paths that end in a
+# suffix, e.g. {"_low": ("tone48k.aac", 6000)} for /<station>_low.m4a. A
+# {link_rate} caps every connection, as a congested link would, without
+# changing what the streams need.
+#
+# Usage:
+# python3 tools/stream_server.py tone.aac --port 8744 --rate 16000
+# server = StreamServer("tone.aac", rate=16000); server.rate = 8000
+# server.inject("stall")
+# server.link_rate = 4000
+
+
+class StreamHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        stream = self.server.stream
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/aac")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        connection = stream.connected()
+        data, variant_rate = stream.variant(self.path)
+
+        position = 0
+        sent = 0
+        paced_rate = None
+        try:
+            while not stream.stopped.is_set():
+                if connection <= stream.failed_up_to:
+                    if stream.fault == "stall":
+                        # Hold the connection until the client gives up on it.
+                        self.rfile.read(1)
+                    return
+                chunk = data[position : position + stream.chunk_size]
+                position = (position + len(chunk)) % len(data)
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                stream.count(len(chunk))
+
+                # Pace everything after the burst. The link, if capped, paces the burst too.
+                # A changed rate applies from now on.
+                own_rate = stream.rate if data is stream.data else variant_rate
+                rate = own_rate if sent >= stream.burst else 0
+                if stream.link_rate:
+                    rate = min(rate, stream.link_rate) if rate else stream.link_rate
+                if rate:
+                    if rate != paced_rate:
+                        paced_rate = rate
+                        paced_from = sent
+                        paced_start = time.perf_counter()
+                    delay = paced_start + (sent - paced_from) / paced_rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+        except OSError:
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StreamServer:
+    def __init__(
+        self,
+        path,
+        host="127.0.0.1",
+        port=0,
+        rate=16000,
+        burst=65536,
+        chunk_size=4096,
+        variants=None,
+        link_rate=0,
+    ):
+        with open(path, "rb") as stream_file:
+            self.data = stream_file.read()
+        self.rate = rate
+        self.variants = {}
+        for suffix, (variant_path, variant_rate) in (variants or {}).items():
+            with open(variant_path, "rb") as stream_file:
+                self.variants[suffix] = (stream_file.read(), variant_rate)
+        self.link_rate = link_rate
+        self.burst = burst
+        self.chunk_size = chunk_size
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.bytes_sent = 0
+        self.fault = None
+        self.failed_up_to = 0
+        self.fault_at = None
+
+        self.httpd = ThreadingHTTPServer((host, port), StreamHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stream = self
+        self.port = self.httpd.server_address[1]
+        self.base_url = f"http://{host}:{self.port}"
+
+        server_thread = threading.Thread(target=self.httpd.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+
+    def connected(self):
+        # Returns the number of the connection, counting from 1.
+        with self.lock:
+            self.connections += 1
+            return self.connections
+
+    def variant(self, path):
+        # (data, rate) for a request path. The rate of the main file is read live, from {rate}.
+        name = path.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+        for suffix in sorted(self.variants, key=len, reverse=True):
+            if name.endswith(suffix):
+                return self.variants[suffix]
+        return self.data, self.rate
+
+    def inject(self, fault):
+        with self.lock:
+            self.fault = fault
+            self.failed_up_to = self.connections
+            self.fault_at = time.perf_counter()
+
+    def count(self, sent):
+        with self.lock:
+            self.bytes_sent += sent
+
+    def close(self):
+        self.stopped.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local audio stream server")
+    parser.add_argument("path", help="Audio file to loop, preferably ADTS AAC")
+    parser.add_argument("--port", type=int, default=8744)
+    parser.add_argument("--rate", type=int, default=16000, help="Bytes per second, 0 for unpaced")
+    parser.add_argument(
+        "--variant",
+        action="append",
+        default=[],
+        help="SUFFIX:PATH:RATE, e.g. _low:tone48k.aac:6000. Can be given more than once",
+    )
+    parser.add_argument("--link-rate", type=int, default=0, help="Bytes per second per connection")
+    args = parser.parse_args()
+
+    variants = {}
+    for variant in args.variant:
+        suffix, path, rate = variant.split(":")
+        variants[suffix] = (path, int(rate))
+    server = StreamServer(
+        args.path, port=args.port, rate=args.rate, variants=variants, link_rate=args.link_rate
+    )
+    print(f"Streaming {args.path} on {server.base_url}/<station>.m4a")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.close()